@@ -74,10 +74,11 @@ st.markdown("""
 # ==== END SHELL ====
 
 import streamlit as st
-import pandas as pd
-from io import BytesIO
-from openpyxl import load_workbook, Workbook
-from openpyxl.utils import get_column_letter
+from pipeline.constants import (
+    REQUIRED_INTERNAL_SHEET, COL_TOTAL, MODE_FORMULAS, MODE_VALUES, MODE_TABLE, LOOKUP_COLUMNS,
+)
+# The pipeline (pandas, openpyxl, pyarrow) is imported only once both files are uploaded,
+# so the login and upload pages render without it; Python keeps it loaded for later reruns.
 
 st.set_page_config(page_title="Machlab – נוסחאות מוגבלות לפי 'הזמנות לבדיקה'", layout="wide")
 
@@ -93,297 +94,200 @@ st.caption("מעלה שני קבצים (פעילות + 'הובלות אלכל כ
            "VLOOKUP משתמש ב-MATCH דינמי לעמודה 'סופק'. כל ההזרקות נעצרות בשורה האחרונה של 'הזמנות לבדיקה'. "
            "הסקריפט מוחל גם על 'הובלה לבית לקוח' וגם על 'הובלה לסוחר'.")
 
-# ----- Constants -----
-REQUIRED_MAIN_SHEET_1     = "הובלה לבית לקוח"
-REQUIRED_MAIN_SHEET_2     = "הובלה לסוחר"
-REQUIRED_INTERNAL_SHEET   = "הובלות אלכל כללי"
-
-COL_PURCHASE_SRC  = "הז. רכש (לקוח)"
-COL_RAKHASH       = "רכש"
-COL_MAKAT         = "מק'ט"
-COL_MAKAT_CLEAN   = "מקט ללא פגומים"
-COL_ORDER_CHECK   = "הזמנות לבדיקה"
-COL_QTY           = "כמות"
-COL_QTY_CHECK     = "בדיקת כמות"
-COL_PRICE_AFTER   = "מחירון מחלב לאחר בדיקה"
-COL_DUP_JULY      = "כפילויות חודש קודם"
-COL_MANUAL        = "מעבר ידני"
-COL_APPROVAL      = "אישור סופי"
-COL_NOTES         = "הערות"
-COL_TOTAL_PAY     = "סה\"כ לתשלום"
-COL_DIFF_ROW      = "פער לפי שורה"
-COL_TOTAL         = "סה\"כ"  # עמודת סיכום קיימת אם יש
-
-# עמודות נוספות להוספה אם חסרות (ללא נוסחאות, מלבד אלה שמוגדר להן נוסחה)
-EXTRA_COLUMNS = [
-    COL_PRICE_AFTER,
-    COL_DUP_JULY,
-    COL_QTY_CHECK,        # עם נוסחת VLOOKUP+MATCH
-    COL_MANUAL,
-    COL_APPROVAL,         # IF/OR/AND
-    COL_NOTES,
-    COL_TOTAL_PAY,        # IF(...*ABS(...))
-    COL_DIFF_ROW,         # סה"כ - סה"כ לתשלום
-]
-
-# ----- Helpers -----
-def find_sheet_name(sheetnames, target):
-    if target in sheetnames:
-        return target
-    if (target + " ") in sheetnames:
-        return target + " "
-    for s in sheetnames:
-        if s.strip() == target.strip():
-            return s
-    return None
-
-def find_col(ws, name):
-    for c in range(1, ws.max_column + 1):
-        val = ws.cell(row=1, column=c).value
-        if (val or "").strip() == name:
-            return c
-    return None
-
-def ensure_column(ws, name):
-    """Locate a column by header; if missing, append it at the end and return the index."""
-    idx = find_col(ws, name)
-    if idx is not None:
-        return idx, False
-    new_idx = ws.max_column + 1 if ws.max_column else 1
-    ws.cell(row=1, column=new_idx, value=name)
-    return new_idx, True
-
-def copy_dataframe_to_sheet(df: pd.DataFrame, wb: Workbook, sheet_name: str):
-    # overwrite if exists
-    if sheet_name in wb.sheetnames:
-        wb.remove(wb[sheet_name])
-    ws = wb.create_sheet(sheet_name)
-    # RTL view only (do not reverse column order)
-    try:
-        ws.sheet_view.rightToLeft = True
-    except Exception:
-        pass
-    # headers
-    for j, col in enumerate(df.columns, start=1):
-        ws.cell(row=1, column=j, value=str(col))
-    # rows
-    for i, row in enumerate(df.itertuples(index=False), start=2):
-        for j, val in enumerate(row, start=1):
-            ws.cell(row=i, column=j, value=val)
-
-def last_nonempty_row(ws, col_letter, start_row=2):
-    max_row = ws.max_row
-    for r in range(max_row, start_row - 1, -1):
-        v = ws[f"{col_letter}{r}"].value
-        if v is not None and str(v).strip() != "":
-            return r
-    return start_row - 1
-
 # ----- UI -----
+MODE_LABELS = {MODE_FORMULAS: "נוסחאות (לביקורת)", MODE_TABLE: "נוסחאות על טבלה (חישוב מהיר)",
+               MODE_VALUES: "ערכים מחושבים"}
+
 col1, col2 = st.columns(2)
 with col1:
     activity_file = st.file_uploader("קובץ פעילות (Excel) – בדרך כלל 'פעילות אלכל חודש שנה' (.xlsx)", type=["xlsx"], key="activity")
 with col2:
     internal_file = st.file_uploader("קובץ 'הובלות אלכל כללי' (Excel) (.xlsx)", type=["xlsx"], key="internal")
 
-if activity_file and internal_file:
-    try:
-        # 1) Load activity workbook
-        wb = load_workbook(activity_file)
-
-        # 2) Copy internal sheet as a new sheet in the same workbook (once)
-        xl_internal = pd.ExcelFile(internal_file)
-        internal_sheet_name = find_sheet_name(xl_internal.sheet_names, REQUIRED_INTERNAL_SHEET)
-        if not internal_sheet_name:
-            st.error(f"לא נמצא גיליון בשם '{REQUIRED_INTERNAL_SHEET}' בקובץ 'הובלות אלכל כללי'.")
-            st.stop()
-        df_internal = xl_internal.parse(internal_sheet_name)
-        copy_dataframe_to_sheet(df_internal, wb, REQUIRED_INTERNAL_SHEET)
-
-        TARGET_SHEETS = [REQUIRED_MAIN_SHEET_1, REQUIRED_MAIN_SHEET_2]
-        overall_msgs = []
-
-        # 3) Process each target sheet with the exact same injections
-        for target_sheet in TARGET_SHEETS:
-            main_sheet_name = find_sheet_name(wb.sheetnames, target_sheet)
-            if not main_sheet_name:
-                st.warning(f"לא נמצא גיליון בשם '{target_sheet}' בקובץ הפעילות – מדלג/ה.")
+output_mode = st.radio(
+    "מצב פלט", [MODE_FORMULAS, MODE_TABLE, MODE_VALUES], format_func=MODE_LABELS.get, horizontal=True, key="output_mode",
+    help="נוסחאות – VLOOKUP/MATCH בכל שורה (לביקורת). "
+         "נוסחאות על טבלה – 'הובלות אלכל כללי' מועתק כטבלת Excel, והחיפוש הוא INDEX/MATCH על טווחים תחומים ושמות מוגדרים, כך שהקובץ מחושב מהר יותר. "
+         "ערכים מחושבים – התוצאות נכתבות כערכים, ללא חישוב מחדש באקסל.",
+)
+lookup_only = st.checkbox(
+    f"העתק מ'הובלות אלכל כללי' רק את עמודות {LOOKUP_COLUMNS} (הטווח שהבדיקה משתמשת בו)", key="lookup_only",
+)
+show_profile = st.checkbox(
+    "מדידת ביצועים (זמן וזיכרון לכל שלב)", key="profile",
+    help="מציג זמן, שורות לשנייה וזיכרון לכל שלב בעיבוד. מדידת הזיכרון מאטה מעט את הריצה.",
+)
+
+STEP_LABELS = {
+    "read_internal": "קריאת 'הובלות אלכל כללי'", "open_activity": "פתיחת קובץ הפעילות",
+    "plan": "חישוב ובדיקת הגיליונות", "write": "כתיבת הגיליונות",
+    "copy_internal": "העתקת 'הובלות אלכל כללי'", "save": "שמירת הקובץ",
+}
+
+
+@st.cache_resource
+def job_store():
+    """The job table, opened once per server process rather than on every rerun / poll."""
+    from pipeline.jobs import JobStore
+    return JobStore()
+
+
+@st.cache_resource
+def result_cache():
+    from pipeline.cache import DiskCache
+    return DiskCache()
+
+
+@st.fragment(run_every=1.0)
+def job_progress(job_id):
+    """Polls the background job; the whole page reruns once it has finished."""
+    from pipeline import jobs
+    job = jobs.get(job_id, job_store())
+    if job is None or job.finished:
+        st.rerun()
+    if job.status == jobs.QUEUED:
+        ahead = jobs.position(job, job_store())
+        st.info(f"⏳ העיבוד ממתין בתור{f' ({ahead} לפניו)' if ahead else ''}…")
+        return
+    step = job.progress.get("step")
+    st.info(f"⚙️ מעבד… {STEP_LABELS.get(step, '')}")
+    for sheet, s in job.progress.get("sheets", {}).items():
+        rows, done = s["rows"] or 0, s["written"]
+        state = f"נכתבו {done:,} מתוך {rows:,} שורות" if done else ("חושב" if s["planned"] else "ממתין")
+        st.progress(min(done / rows, 1.0) if rows else 0.0, text=f"[{sheet}] {state}")
+
+
+def rows_text(problem):
+    rows = problem.get("rows")
+    if not rows:
+        return ""
+    return f" | שורות: {', '.join(map(str, rows))}{'…' if len(problem['row_index']) > len(rows) else ''}"
+
+
+KEY_FINDINGS = {
+    "duplicate_order_key": "מפתח הזמנה כפול בחודש: {n} שורות עם מפתח שמופיע יותר מפעם אחת",
+    "duplicate_order_key_across_sheets": "מפתח הזמנה כפול בין גיליונות: {n} שורות עם מפתח שמופיע גם בגיליון ההובלה השני",
+    "ambiguous_order_key": "מפתח הזמנה דו-משמעי: {n} שורות שבהן רכש ומק\"ט שונים יוצרים אותו מפתח",
+    "previous_month_duplicate": "כפילויות חודש קודם: {n} שורות עם מפתח שכבר הופיע בחודש הקודם (סומנו בעמודה)",
+}
+
+
+INPUT_FINDINGS = {
+    "uncached_formula_inputs": "{n} שורות קוראות נוסחאות שאין להן ערך מחושב בקובץ (יש לשמור אותו ב-Excel) – העמודות המוזרקות בשורות אלה נשארו כמו שהן",
+    "uncached_key_inputs": "{n} שורות בונות את מפתח ההזמנה מנוסחאות שאין להן ערך מחושב בקובץ (יש לשמור אותו ב-Excel) – שורות אלה לא נבדקו לכפילויות",
+}
+
+
+def show_result(result, profile):
+    if not result["ok"]:
+        st.error(f"לא נמצא גיליון בשם '{REQUIRED_INTERNAL_SHEET}' בקובץ 'הובלות אלכל כללי'.")
+        return
+
+    for target_sheet in result["missing_sheets"]:
+        st.warning(f"לא נמצא גיליון בשם '{target_sheet}' בקובץ הפעילות – מדלג/ה.")
+
+    overall_msgs = []
+    for report in result["sheets"]:
+        target_sheet = report["sheet"]
+        for canonical, actual in report["renamed"]:
+            st.info(f'[{target_sheet}] העמודה "{canonical}" זוהתה לפי הכותרת "{actual}".')
+        if "missing_total" in report["warnings"]:
+            st.warning(f'[{target_sheet}] לא נמצאה עמודה "{COL_TOTAL}". הזרקה ל"פער לפי שורה" תדלג (נדרש מקור חיסור).')
+        # rules.yaml findings (failed cells are also marked in the downloaded file)
+        for problem in report["validation"]:
+            if problem["name"] in INPUT_FINDINGS:
+                message = INPUT_FINDINGS[problem["name"]].format(n=len(problem["row_index"]))
+                st.warning(f"[{target_sheet}] {message}{rows_text(problem)}")
                 continue
-            ws = wb[main_sheet_name]
-
-            # Ensure required and extra columns exist (add at end if missing)
-            col_purchase_src = ensure_column(ws, COL_PURCHASE_SRC)[0]
-            col_rakhash, _   = ensure_column(ws, COL_RAKHASH)
-            col_makat, _     = ensure_column(ws, COL_MAKAT)
-            col_clean, _     = ensure_column(ws, COL_MAKAT_CLEAN)
-            col_order, _     = ensure_column(ws, COL_ORDER_CHECK)
-            col_qty, _       = ensure_column(ws, COL_QTY)
-            col_qty_check,_  = ensure_column(ws, COL_QTY_CHECK)
-            col_price,_      = ensure_column(ws, COL_PRICE_AFTER)
-            col_dup,_        = ensure_column(ws, COL_DUP_JULY)
-            col_manual,_     = ensure_column(ws, COL_MANUAL)
-            col_approval,_   = ensure_column(ws, COL_APPROVAL)
-            col_notes,_      = ensure_column(ws, COL_NOTES)
-            col_total_pay,_  = ensure_column(ws, COL_TOTAL_PAY)
-            col_diff,_       = ensure_column(ws, COL_DIFF_ROW)
-
-            added_extra = []
-            for name in EXTRA_COLUMNS:
-                _, added = ensure_column(ws, name)
-                if added:
-                    added_extra.append(name)
-
-            # locate existing "סה\"כ" column (do NOT create if missing)
-            col_total = find_col(ws, COL_TOTAL)
-            if col_total is None:
-                st.warning(f'[{target_sheet}] לא נמצאה עמודה "סה\"כ". הזרקה ל"פער לפי שורה" תדלג (נדרש מקור חיסור).')
-
-            # Letters
-            L_src      = get_column_letter(col_purchase_src)
-            L_rakhash  = get_column_letter(col_rakhash)
-            L_makat    = get_column_letter(col_makat)
-            L_clean    = get_column_letter(col_clean)
-            L_order    = get_column_letter(col_order)
-            L_qty      = get_column_letter(col_qty)
-            L_qtychk   = get_column_letter(col_qty_check)
-            L_price    = get_column_letter(col_price)
-            L_manual   = get_column_letter(col_manual)
-            L_approval = get_column_letter(col_approval)
-            L_totalpay = get_column_letter(col_total_pay)
-            L_diffcol  = get_column_letter(col_diff)
-            L_totalcol = get_column_letter(col_total) if col_total else None
-
-            max_row = ws.max_row
-            cnt_rakhash = cnt_clean = cnt_order = cnt_qtychk = 0
-            cnt_approval = cnt_totalpay = cnt_diff = 0
-
-            # 4) Base formulas (full scan to create order key etc. like before)
-            for r in range(2, max_row + 1):
-                src_val = ws[f"{L_src}{r}"].value
-                if src_val is not None and str(src_val).strip() != "":
-                    ws[f"{L_rakhash}{r}"] = f"={L_src}{r}*1"
-                    cnt_rakhash += 1
-
-            for r in range(2, max_row + 1):
-                v = ws[f"{L_makat}{r}"].value
-                if v is not None and str(v).strip() != "":
-                    ws[f"{L_clean}{r}"] = f"=LEFT({L_makat}{r},7)"
-                    cnt_clean += 1
-
-            for r in range(2, max_row + 1):
-                v1 = ws[f"{L_rakhash}{r}"].value
-                v2 = ws[f"{L_clean}{r}"].value
-                if v1 is not None and v2 is not None and str(v1).strip() != "" and str(v2).strip() != "":
-                    ws[f"{L_order}{r}"] = f"={L_rakhash}{r}&{L_clean}{r}"
-                    cnt_order += 1
-
-            # stop line determined by last non-empty in "הזמנות לבדיקה"
-            end_row_orders = last_nonempty_row(ws, L_order, start_row=2)
-
-            # 4.4 בדיקת כמות – VLOOKUP עם MATCH("סופק") על שורת הכותרות של הגיליון שהועתק
-            for r in range(2, end_row_orders + 1):
-                order_val = ws[f"{L_order}{r}"].value
-                if order_val is not None and str(order_val).strip() != "":
-                    # ✅ נרמול שמות הגיליונות למניעת בעיות של רווחים או תווים נסתרים
-                    sheet_key = main_sheet_name.strip()
-                    sheet_1_key = REQUIRED_MAIN_SHEET_1.strip()
-                    sheet_2_key = REQUIRED_MAIN_SHEET_2.strip()
-
-                    if sheet_key == sheet_1_key:  # "הובלה לבית לקוח"
-                        # תנאי מיוחד: אם הכמות < 3 -> "תקין", אחרת "בדיקת כמות"
-                        formula_qty = (
-                            '=IFNA('
-                            'IF(VLOOKUP({order},\'{internal}\'!$A:$O,'
-                            'MATCH("סופק",\'{internal}\'!$A$1:$O$1,0),0)='
-                            '\'{main}\'!{qty},'
-                            'IF(\'{main}\'!{qty}<3,"תקין","בדיקת כמות"),'
-                            '"נדרשת בדיקה"),'
-                            '"נדרשת בדיקה")'
-                        ).format(
-                            order=f"{L_order}{r}",
-                            internal=REQUIRED_INTERNAL_SHEET,
-                            main=main_sheet_name,  # שומר את שם הגיליון האמיתי, גם אם כולל רווח
-                            qty=f"{L_qty}{r}",
-                        )
-
-                    elif sheet_key == sheet_2_key:  # "הובלה לסוחר"
-                        # תנאי פשוט: שוויון -> "תקין", אחרת "נדרשת בדיקה"
-                        formula_qty = (
-                            '=IFNA('
-                            'IF(VLOOKUP({order},\'{internal}\'!$A:$O,'
-                            'MATCH("סופק",\'{internal}\'!$A$1:$O$1,0),0)='
-                            '{qty},'
-                            '"תקין",'
-                            '"נדרשת בדיקה"),'
-                            '"נדרשת בדיקה")'
-                        ).format(
-                            order=f"{L_order}{r}",
-                            internal=REQUIRED_INTERNAL_SHEET,
-                            qty=f"{L_qty}{r}",
-                        )
-
-                    else:
-                        # ברירת מחדל בטוחה (עם MATCH)
-                        formula_qty = (
-                            '=IFNA('
-                            'IF(VLOOKUP({order},\'{internal}\'!$A:$O,'
-                            'MATCH("סופק",\'{internal}\'!$A$1:$O$1,0),0)='
-                            '{qty},'
-                            '"תקין",'
-                            '"נדרשת בדיקה"),'
-                            '"נדרשת בדיקה")'
-                        ).format(
-                            order=f"{L_order}{r}",
-                            internal=REQUIRED_INTERNAL_SHEET,
-                            qty=f"{L_qty}{r}",
-                        )
-
-                    ws[f"{L_qtychk}{r}"] = formula_qty
-                    cnt_qtychk += 1
-
-
-
-            # 4.5 אישור סופי
-            for r in range(2, end_row_orders + 1):
-                formula_approval = (
-                    '=IF(OR(AND({manual}{r}=0,{qtychk}{r}="תקין"),{manual}{r}="מאושר"),"מאושר","לא מאושר")'
-                ).format(manual=L_manual, qtychk=L_qtychk, r=r)
-                ws[f"{L_approval}{r}"] = formula_approval
-                cnt_approval += 1
-
-            # 4.6 סה"כ לתשלום
-            for r in range(2, end_row_orders + 1):
-                formula_total = (
-                    '=IF({approval}{r}="מאושר",{price}{r}*ABS({qty}{r}),0)'
-                ).format(approval=L_approval, price=L_price, qty=L_qty, r=r)
-                ws[f"{L_totalpay}{r}"] = formula_total
-                cnt_totalpay += 1
-
-            # 4.7 פער לפי שורה = סה"כ - סה"כ לתשלום
-            if L_totalcol:
-                for r in range(2, end_row_orders + 1):
-                    ws[f"{L_diffcol}{r}"] = f"={L_totalcol}{r}-{L_totalpay}{r}"
-                    cnt_diff += 1
-
-            added_msg = (" | נוספו עמודות: " + ", ".join(added_extra)) if added_extra else ""
-            overall_msgs.append(
-                f"✅ [{target_sheet}] הזרקות עד שורה {end_row_orders}. נוסחאות – רכש ({cnt_rakhash}), מק\"ט ללא פגומים ({cnt_clean}), הזמנות לבדיקה ({cnt_order}), בדיקת כמות/MATCH ({cnt_qtychk}), אישור סופי ({cnt_approval}), סה\"כ לתשלום ({cnt_totalpay}), פער לפי שורה ({cnt_diff}).{added_msg}"
-            )
-
-        # 5) Save and offer download
-        out = BytesIO()
-        wb.save(out)
-        out.seek(0)
-
-        for msg in overall_msgs:
-            st.success(msg)
-
-        st.download_button("📥 הורדת הדוח המעודכן",
-            data=out,
-            file_name="Activity_Unified_All_Sheets_With_ROWDIFF_and_MATCH.py.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            detail = problem.get("detail") or f"{problem['failed_rows']} שורות"
+            notify = st.warning if problem["level"] == "error" else st.info
+            notify(f"[{target_sheet}] בדיקת חוקים '{problem['name']}': {detail}{rows_text(problem)}")
+        # order keys repeated in the month / already in the previous month (also marked in the file)
+        for problem in report["duplicates"]:
+            message = KEY_FINDINGS[problem["name"]].format(n=len(problem["row_index"]))
+            st.warning(f"[{target_sheet}] {message}{rows_text(problem)}")
+        diff = report.get("diff")
+        if diff and not result["cached"]:
+            if diff["changed"] or diff["removed"]:
+                cols = ", ".join(f"{name} ({n})" for name, n in diff["columns"].items())
+                st.info(f"🔁 [{target_sheet}] מאז הריצה הקודמת של הקובץ: {diff['changed']} שורות השתנו/נוספו, {diff['removed']} הוסרו"
+                        + (f" | עמודות: {cols}" if cols else "")
+                        + (f" | שורות: {', '.join(map(str, diff['rows']))}" if diff["rows"] else "")
+                        + f". חושבו מחדש {diff['recomputed']} שורות.")
+            else:
+                st.info(f"🔁 [{target_sheet}] אין שינוי בנתוני הקלט מאז הריצה הקודמת של הקובץ.")
+        c = report["counts"]
+        added_msg = (" | נוספו עמודות: " + ", ".join(report["added"])) if report["added"] else ""
+        kind = "ערכים" if output_mode == MODE_VALUES else "נוסחאות"
+        dup_msg = f", כפילויות חודש קודם ({c['dup']})" if "dup" in c else ""
+        overall_msgs.append(
+            f"✅ [{target_sheet}] הזרקות עד שורה {report['end_row']}. {kind} – רכש ({c['rakhash']}), מק\"ט ללא פגומים ({c['clean']}), הזמנות לבדיקה ({c['order']}), בדיקת כמות/MATCH ({c['qty_check']}), אישור סופי ({c['approval']}), סה\"כ לתשלום ({c['total_pay']}), פער לפי שורה ({c['diff']}){dup_msg}.{added_msg}"
         )
 
+    for msg in overall_msgs:
+        st.success(msg)
+    if result["previous_period"]:
+        st.caption(f"🗓️ חודש {result['period']} – 'כפילויות חודש קודם' מולאה מול מפתחות ההזמנות של {result['previous_period']}.")
+    elif result["period"]:
+        st.caption(f"🗓️ חודש {result['period']} – אין מפתחות שמורים של החודש הקודם, ולכן 'כפילויות חודש קודם' לא מולאה. "
+                   "מפתחות החודש נשמרו לבדיקת החודש הבא.")
+    else:
+        st.caption("🗓️ לא זוהה חודש בשם קובץ הפעילות (למשל 'יולי 2025'), ולכן 'כפילויות חודש קודם' לא מולאה.")
+    if result["cached"]:
+        st.caption("⚡ הקבצים האלה כבר עובדו – התוצאה נטענה מהמטמון.")
+
+    if show_profile:
+        with st.expander("⏱️ ביצועים לפי שלב", expanded=True):
+            if not profile:
+                st.caption("אין מדידה לריצה זו (התוצאה נטענה מהמטמון או שהעיבוד התחיל ללא מדידה).")
+            else:
+                st.dataframe(
+                    [{"שלב": r["stage"], "שניות": round(r["seconds"], 3), "שורות": r["rows"],
+                      "שורות/שנייה": round(r["rows_per_sec"]) if r["rows_per_sec"] else None,
+                      "RSS (MB)": round(r["rss_mb"], 1) if r["rss_mb"] is not None else None,
+                      "שיא הקצאות (MB)": round(r["peak_mb"], 1) if r["peak_mb"] is not None else None}
+                     for r in profile],
+                    use_container_width=True, hide_index=True,
+                )
+
+    st.download_button("📥 הורדת הדוח המעודכן",
+        data=result["output"],
+        file_name="Activity_Unified_All_Sheets_With_ROWDIFF_and_MATCH.py.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
+
+if activity_file and internal_file:
+    from pipeline import jobs
+    from pipeline.runner import result_key
+    try:
+        # The run happens in a background job (shared worker pool), so reruns don't restart it
+        # and the session stays responsive. Same two files (by SHA-256) + same code/rules →
+        # served from the result cache; the same file name re-uploaded after edits → only
+        # changed rows are recomputed. The session remembers its job per set of inputs.
+        activity_bytes, internal_bytes = activity_file.getvalue(), internal_file.getvalue()
+        run_key = result_key(activity_bytes, internal_bytes, output_mode, lookup_only, activity_file.name)
+        session_jobs = st.session_state.setdefault("jobs", {})
+        job = jobs.get(session_jobs[run_key], job_store()) if run_key in session_jobs else None
+        if job is None:
+            job = jobs.submit(activity_bytes, internal_bytes, mode=output_mode, lookup_only=lookup_only,
+                              activity_name=activity_file.name, profile="memory" if show_profile else None,
+                              store=job_store(), cache=result_cache())
+            session_jobs[run_key] = job.id
+
+        if not job.finished:
+            job_progress(job.id)
+        elif job.status == jobs.FAILED and job.error != "missing_internal_sheet":
+            del session_jobs[run_key]  # the next rerun submits it again
+            st.error("שגיאה בעיבוד הקבצים.")
+            st.code(job.error or "")
+        else:
+            result = jobs.result(job, result_cache()) if job.status == jobs.DONE else {"ok": False}
+            if result is None:
+                del session_jobs[run_key]  # evicted from the result cache: run it again
+                st.rerun()
+            show_result(result, job.profile)
+
     except Exception as e:
         st.error("שגיאה בעיבוד הקבצים.")
         st.exception(e)
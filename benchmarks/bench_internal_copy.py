@@ -0,0 +1,74 @@
+"""
+Internal-sheet copy: previous path vs bulk path.
+
+  previous: pd.ExcelFile(...).parse() (openpyxl) + one ws.cell() per value
+  bulk:     read_internal() (calamine when installed) + write-only ws.append
+  bulk A:O: same, reading only the columns the lookup uses
+
+Run from the repository root:
+    python -m benchmarks.bench_internal_copy --rows 50000 --cols 25
+"""
+from __future__ import annotations
+import argparse
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import Workbook
+
+from benchmarks.synthetic import make_internal_workbook
+from pipeline.constants import REQUIRED_INTERNAL_SHEET
+from pipeline.internal_sheet import EXCEL_ENGINE, read_internal
+from pipeline.streaming import copy_dataframe_to_sheet, new_output
+
+
+def previous_copy(path):
+    df = pd.ExcelFile(path).parse(REQUIRED_INTERNAL_SHEET)
+    wb = Workbook()
+    ws = wb.create_sheet(REQUIRED_INTERNAL_SHEET)
+    for j, col in enumerate(df.columns, start=1):
+        ws.cell(row=1, column=j, value=str(col))
+    for i, row in enumerate(df.itertuples(index=False), start=2):
+        for j, val in enumerate(row, start=1):
+            ws.cell(row=i, column=j, value=val)
+    wb.save(BytesIO())
+
+
+def bulk_copy(path, lookup_only=False):
+    _, df = read_internal(path, lookup_only=lookup_only)
+    wb = new_output()
+    copy_dataframe_to_sheet(df, wb, REQUIRED_INTERNAL_SHEET)
+    wb.save(BytesIO())
+
+
+def timed(fn, *args, repeat=1, **kwargs):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--cols", type=int, default=25)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "internal.xlsx"
+        make_internal_workbook(path, args.rows, cols=args.cols)
+        print(f"{args.rows} rows x {args.cols} cols, engine={EXCEL_ENGINE}")
+        base = timed(previous_copy, path, repeat=args.repeat)
+        print(f"  previous   {base:8.2f}s")
+        for label, kwargs in (("bulk", {}), ("bulk A:O", {"lookup_only": True})):
+            t = timed(bulk_copy, path, repeat=args.repeat, **kwargs)
+            print(f"  {label:<10} {t:8.2f}s  ({base / t:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Throughput and peak memory of the main paths, on synthetic workbooks.
+
+  pipeline:   process_files() end to end (no caches, sheets planned in-process),
+              per output mode (formulas, table, values)
+  copy:       copy_dataframe_to_sheet() of the internal sheet + save
+  validate:   validate_workbook() of the target sheets against pipeline/rules/rules.yaml
+              (whole sheets, and chunked)
+
+Each case runs in a fresh process, so peak RSS is that case's own. Results go
+to a JSON baseline; --compare reports cases that got slower than an earlier one.
+A validate case whose workbook misses a rule sheet or column fails (and exits 1)
+rather than timing a run that read no rows.
+
+Run from the repository root:
+    python -m benchmarks.bench_pipeline --rows 1000 10000 100000 -o baseline.json
+    python -m benchmarks.bench_pipeline --rows 1000 10000 100000 --compare baseline.json
+"""
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+CASES = ("pipeline", "pipeline_table", "pipeline_values", "copy", "validate", "validate_chunked")
+DEFAULT_THRESHOLD = 0.15  # slower than the baseline by more than this → regression
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _run_case(case, activity, internal, sheet_rows):
+    # in a fresh process: (seconds, rows handled, per-stage seconds)
+    import pandas as pd
+    from pipeline.constants import MODE_FORMULAS, MODE_TABLE, MODE_VALUES, REQUIRED_INTERNAL_SHEET, TARGET_SHEETS
+    from pipeline.internal_sheet import read_internal
+    from pipeline.profiling import Profiler
+    from pipeline.runner import process_files
+    from pipeline.streaming import copy_dataframe_to_sheet, new_output
+    from pipeline.validation import RULES_PATH
+    from validators.rules_engine import validate_workbook
+
+    stages = None
+    if case.startswith("pipeline"):
+        profiler = Profiler()
+        t0 = time.perf_counter()
+        mode = {"pipeline_table": MODE_TABLE, "pipeline_values": MODE_VALUES}.get(case, MODE_FORMULAS)
+        result = process_files(activity, internal, mode=mode, workers=1, use_sidecar=False, profiler=profiler)
+        seconds = time.perf_counter() - t0
+        rows = sheet_rows * len(result["sheets"])
+        stages = {r["stage"]: round(r["seconds"], 4) for r in profiler.records}
+    elif case == "copy":
+        _, df = read_internal(internal)
+        t0 = time.perf_counter()
+        wb = new_output()
+        copy_dataframe_to_sheet(df, wb, REQUIRED_INTERNAL_SHEET)
+        wb.save(BytesIO())
+        seconds = time.perf_counter() - t0
+        rows = len(df)
+    else:
+        t0 = time.perf_counter()
+        with pd.ExcelFile(activity) as xl:
+            names = [s for s in xl.sheet_names if s.strip() in TARGET_SHEETS]
+            result = validate_workbook(xl, str(RULES_PATH), sheets=names,
+                                       chunk_size=case == "validate_chunked" or None)
+        seconds = time.perf_counter() - t0
+        # a missing sheet or column stops before the rows are read: nothing was timed
+        missing = [f"{r['sheet']}: {p['name']} {p.get('detail', '')}".strip()
+                   for r in result["results"] for p in r["problems"] if p["name"].startswith("missing_")]
+        if missing:
+            raise RuntimeError("; ".join(missing))
+        rows = sheet_rows * len(names)
+    return seconds, rows, stages
+
+
+def _measure(case, activity, internal, sheet_rows):
+    seconds, rows, stages = _run_case(case, activity, internal, sheet_rows)
+    return {"case": case, "seconds": round(seconds, 4), "rows": rows,
+            "rows_per_sec": round(rows / seconds) if seconds else None,
+            "peak_rss_mb": round(_peak_rss_mb(), 1) if resource is not None else None,
+            "stages": stages}
+
+
+def measure(case, activity, internal, sheet_rows):
+    """One case in a fresh process (spawned: nothing inherited from this one)."""
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(_measure, (case, str(activity), str(internal), sheet_rows))
+
+
+def environment():
+    import numpy
+    import openpyxl
+    import pandas
+    from pipeline.internal_sheet import EXCEL_ENGINE
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "pandas": pandas.__version__, "numpy": numpy.__version__, "openpyxl": openpyxl.__version__,
+            "excel_engine": EXCEL_ENGINE, "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Lines for cases slower than in `baseline` by more than `threshold`."""
+    before = {(r["case"], r["size"], r["params"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        old = before.get((r["case"], r["size"], r["params"]))
+        if old and old["seconds"] and r["seconds"] > old["seconds"] * (1 + threshold):
+            regressions.append(f"{r['case']} @ {r['size']} rows: {old['seconds']:.2f}s → {r['seconds']:.2f}s "
+                               f"(+{r['seconds'] / old['seconds'] - 1:.0%})")
+    return regressions
+
+
+def main(argv=None):
+    from benchmarks.synthetic import make_pair
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="data rows per target sheet (1000 … 1000000)")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--match-rate", type=float, default=0.9)
+    parser.add_argument("--messy-headers", action="store_true")
+    parser.add_argument("--data-dir", help="keep generated workbooks here (reused across runs)")
+    parser.add_argument("-o", "--output", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", help="earlier baseline JSON; exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    params = f"match={args.match_rate}{',messy' if args.messy_headers else ''}"
+    results, failed = [], 0
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        for size in args.rows:
+            t0 = time.perf_counter()
+            activity, internal = make_pair(data_dir, size, match_rate=args.match_rate,
+                                           messy_headers=args.messy_headers)
+            print(f"{size} rows/sheet, {params} (files ready in {time.perf_counter() - t0:.1f}s)")
+            for case in args.cases:
+                try:
+                    r = {**measure(case, activity, internal, size), "size": size, "params": params}
+                except RuntimeError as e:
+                    print(f"  {case:<17} FAILED: {e}")
+                    failed += 1
+                    continue
+                results.append(r)
+                print(f"  {case:<17} {r['seconds']:8.2f}s  {r['rows_per_sec'] or 0:>9} rows/s  "
+                      f"peak {r['peak_rss_mb']} MB")
+
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION  {line}")
+        return 1 if regressions or failed else 0
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Synthetic activity / "הובלות אלכל כללי" workbooks for the benchmarks.
+
+The activity workbook has a summary sheet and both target sheets with the real
+headers (pipeline.constants); the internal workbook holds the order keys with a
+"סופק" column. match_rate is the share of activity order keys found in the
+internal sheet, qty_match_rate the share of those whose "סופק" equals the
+row's quantity. messy_headers swaps in aliases and stray whitespace /
+direction marks, and adds the trailing space the real "הובלה לסוחר " sheet has.
+
+Run from the repository root to write a pair of files:
+    python -m benchmarks.synthetic --rows 100000 --out /tmp/bench
+"""
+from __future__ import annotations
+import argparse
+import random
+from pathlib import Path
+
+from openpyxl import Workbook
+
+from pipeline.constants import (
+    REQUIRED_MAIN_SHEET_1, REQUIRED_MAIN_SHEET_2, REQUIRED_INTERNAL_SHEET,
+    COL_PURCHASE_SRC, COL_MAKAT, COL_QTY, COL_PRICE_AFTER, COL_MANUAL, COL_NOTES, COL_TOTAL,
+    COLUMN_ALIASES,
+)
+from pipeline.reconcile import SUPPLIED_HEADER, APPROVED
+
+ACTIVITY_HEADERS = ["תאריך", COL_PURCHASE_SRC, COL_MAKAT, COL_QTY, COL_PRICE_AFTER, COL_TOTAL,
+                    COL_MANUAL, COL_NOTES]
+INTERNAL_HEADERS = ["מפתח", "תאריך", "לקוח", SUPPLIED_HEADER]
+
+BLANK_ROW_RATE = 0.02
+
+
+def messy(header: str, rnd: random.Random) -> str:
+    """The header as suppliers send it: an alias, or padded with spaces / RLM / NBSP."""
+    aliases = COLUMN_ALIASES.get(header)
+    if aliases and rnd.random() < 0.5:
+        return rnd.choice(aliases)
+    return rnd.choice([" ", "‏", "\xa0", ""]) + header + rnd.choice(["  ", "‏", ""])
+
+
+def _activity_row(rnd: random.Random):
+    purchase = 4500000000 + rnd.randint(0, 999999)
+    sku = rnd.randint(1000000, 9999999)
+    makat = sku * 10 + rnd.randint(0, 9) if rnd.random() < 0.7 else f"{sku}-{rnd.choice('PX')}"
+    qty = rnd.choice([1, 1, 2, 2, 3, 4, 6, 10, -1, 0])
+    price = round(rnd.uniform(5, 400), 2)
+    manual = rnd.choice([None, None, None, 0, APPROVED])
+    row = [f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+           str(purchase) if rnd.random() < 0.5 else purchase,
+           makat, qty, price, round(qty * price, 2), manual, None]
+    return row, f"{purchase}{sku}", qty
+
+
+def make_activity_workbook(path, rows: int, *, messy_headers: bool = False, seed: int = 0):
+    """
+    Writes the activity workbook (`rows` data rows per target sheet) and returns
+    [(order key, quantity)] of its filled rows, for make_internal_workbook().
+    """
+    rnd = random.Random(seed)
+    wb = Workbook(write_only=True)
+    summary = wb.create_sheet("סיכום")
+    summary.append(["חודש", "סה\"כ"])
+    summary.append(["2025-01", 0])
+    orders = []
+    for name in (REQUIRED_MAIN_SHEET_1, REQUIRED_MAIN_SHEET_2):
+        ws = wb.create_sheet(name + " " if messy_headers and name == REQUIRED_MAIN_SHEET_2 else name)
+        ws.append([messy(h, rnd) for h in ACTIVITY_HEADERS] if messy_headers else ACTIVITY_HEADERS)
+        for _ in range(rows):
+            if rnd.random() < BLANK_ROW_RATE:
+                ws.append([None] * len(ACTIVITY_HEADERS))
+                continue
+            row, key, qty = _activity_row(rnd)
+            ws.append(row)
+            orders.append((key, qty))
+    wb.save(path)
+    return orders
+
+
+def make_internal_workbook(path, rows: int, *, cols: int = 25, orders=(), match_rate: float = 0.9,
+                           qty_match_rate: float = 0.8, seed: int = 0):
+    """
+    Writes the internal workbook: `rows` rows, of which up to match_rate of
+    `orders` carry the activity keys ("סופק" = the quantity at qty_match_rate,
+    off by one otherwise); the rest are random keys.
+    """
+    rnd = random.Random(seed + 1)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(REQUIRED_INTERNAL_SHEET)
+    ws.append(INTERNAL_HEADERS + [f"עמודה {i}" for i in range(len(INTERNAL_HEADERS), cols)])
+    filler = lambda: [rnd.random() * 100 for _ in range(len(INTERNAL_HEADERS), cols)]
+    written = 0
+    for key, qty in orders:
+        if written == rows:
+            break
+        if rnd.random() >= match_rate:
+            continue
+        supplied = qty if rnd.random() < qty_match_rate else qty + 1
+        ws.append([key, f"2025-{rnd.randint(1, 12):02d}-01", f"לקוח {written % 500}", supplied] + filler())
+        written += 1
+    for i in range(written, rows):
+        key = f"{4600000000 + rnd.randint(0, 999999)}{rnd.randint(1000000, 9999999)}"
+        ws.append([key, f"2025-{rnd.randint(1, 12):02d}-01", f"לקוח {i % 500}", rnd.randint(0, 9)] + filler())
+    wb.save(path)
+
+
+def make_pair(directory, rows: int, *, internal_rows: int | None = None, cols: int = 25,
+              match_rate: float = 0.9, qty_match_rate: float = 0.8, messy_headers: bool = False, seed: int = 0):
+    """
+    (activity path, internal path) under `directory`, generated once per set of
+    parameters (large files take a while to write) and reused after that.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    internal_rows = rows if internal_rows is None else internal_rows
+    tag = f"{rows}_{internal_rows}x{cols}_m{match_rate}_q{qty_match_rate}{'_messy' if messy_headers else ''}_s{seed}"
+    activity, internal = directory / f"activity_{tag}.xlsx", directory / f"internal_{tag}.xlsx"
+    if not (activity.exists() and internal.exists()):
+        orders = make_activity_workbook(activity, rows, messy_headers=messy_headers, seed=seed)
+        make_internal_workbook(internal, internal_rows, cols=cols, orders=orders, match_rate=match_rate,
+                               qty_match_rate=qty_match_rate, seed=seed)
+    return activity, internal
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10000, help="data rows per target sheet")
+    parser.add_argument("--internal-rows", type=int, help="default: --rows")
+    parser.add_argument("--cols", type=int, default=25, help="internal sheet width")
+    parser.add_argument("--match-rate", type=float, default=0.9)
+    parser.add_argument("--qty-match-rate", type=float, default=0.8)
+    parser.add_argument("--messy-headers", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=".")
+    args = parser.parse_args(argv)
+    for path in make_pair(args.out, args.rows, internal_rows=args.internal_rows, cols=args.cols,
+                          match_rate=args.match_rate, qty_match_rate=args.qty_match_rate,
+                          messy_headers=args.messy_headers, seed=args.seed):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
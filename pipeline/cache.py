@@ -0,0 +1,162 @@
+from __future__ import annotations
+import getpass
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import time
+from pathlib import Path
+
+# Content-addressed on-disk cache. Entries are plain files named by key; reads
+# refresh the file's mtime, so eviction (oldest mtime first) is LRU. The cache is
+# shared by every session and survives restarts.
+#
+# Entries are unpickled, so the cache directories must be this user's alone: they
+# are created with mode 0700, and one that another user owns (e.g. made in advance
+# under the shared temp directory) or a symlink is refused.
+
+
+def _default_cache_dir():
+    try:
+        user = getpass.getuser()
+    except Exception:  # no user name in the environment
+        user = str(os.getuid()) if hasattr(os, "getuid") else "default"
+    return os.path.join(tempfile.gettempdir(), f"machlab_cache_{user}")
+
+
+CACHE_DIR = os.getenv("MACHLAB_CACHE_DIR", _default_cache_dir())
+CACHE_MAX_MB = int(os.getenv("MACHLAB_CACHE_MAX_MB", "512"))
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+# anything that can change the output for the same two input files
+FINGERPRINT_FILES = (sorted(_REPO_ROOT.glob("pipeline/*.py")) + sorted(_REPO_ROOT.glob("validators/*.py"))
+                     + [_REPO_ROOT / "pipeline" / "rules" / "rules.yaml"])
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def code_fingerprint(files=FINGERPRINT_FILES) -> str:
+    h = hashlib.sha256()
+    for path in files:
+        if path.exists():
+            h.update(path.name.encode())
+            h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+def cache_key(*parts) -> str:
+    return digest("\x1f".join(str(p) for p in parts).encode())
+
+
+def private_dir(path) -> Path:
+    """
+    Create `path` (mode 0700) if missing and check that it, and every directory
+    between it and CACHE_DIR, is a real directory owned by this user; access for
+    others is removed. Raises PermissionError otherwise.
+    """
+    path = Path(path)
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if not hasattr(os, "getuid"):  # Windows: per-user temp directory, no owner bits
+        return path
+    root = Path(CACHE_DIR)
+    for d in [path, *(p for p in path.parents if p == root or root in p.parents)]:
+        st = os.lstat(d)
+        if stat.S_ISLNK(st.st_mode) or st.st_uid != os.getuid():
+            raise PermissionError(f"cache directory {d} is a symlink or not owned by this user; "
+                                  f"set MACHLAB_CACHE_DIR to a private directory")
+        if st.st_mode & 0o077:
+            os.chmod(d, 0o700)
+    return path
+
+
+class DiskCache:
+    """
+    root: directory holding the entries (created on demand, see private_dir)
+    max_bytes: total size kept after each put; least recently used go first
+    max_age: seconds since last use after which an entry is dropped (None = no limit)
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_MB * 1024 * 1024, max_age=None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._checked = False
+
+    def _check_root(self):
+        # before the first read or write (see private_dir)
+        if not self._checked:
+            private_dir(self.root)
+            self._checked = True
+
+    def path(self, key: str, suffix: str = "") -> Path:
+        return self.root / f"{key}{suffix}"
+
+    def get(self, key: str, suffix: str = ""):
+        self._check_root()
+        path = self.path(key, suffix)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        self.touch(path)
+        return data
+
+    def locate(self, key: str, suffix: str = ""):
+        """Path of an entry (marked as used) for callers that map it themselves, or None."""
+        self._check_root()
+        path = self.path(key, suffix)
+        if not path.is_file():
+            return None
+        self.touch(path)
+        return path
+
+    def put(self, key: str, data: bytes, suffix: str = "") -> Path:
+        self._check_root()
+        path = self.path(key, suffix)
+        # write-then-rename so concurrent readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self.evict()
+        return path
+
+    def get_object(self, key: str):
+        data = self.get(key, ".pkl")
+        return None if data is None else pickle.loads(data)
+
+    def put_object(self, key: str, obj) -> Path:
+        return self.put(key, pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL), ".pkl")
+
+    @staticmethod
+    def touch(path: Path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        entries = []
+        for path in self.root.iterdir():
+            if path.suffix == ".tmp" or not path.is_file():
+                continue  # in-flight writes, sub-caches
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()  # least recently used first
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            expired = self.max_age is not None and now - mtime > self.max_age
+            if not expired and total <= self.max_bytes:
+                continue
+            try:
+                path.unlink()
+            except OSError:  # gone already, or still mapped by a reader (Windows)
+                continue
+            total -= size
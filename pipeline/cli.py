@@ -0,0 +1,202 @@
+"""
+Headless entry point (no Streamlit, no login):
+
+    machlab-check run --activity ACTIVITY.xlsx --internal INTERNAL.xlsx [-o OUT.xlsx]
+    machlab-check batch DIR [--internal INTERNAL.xlsx] [--workers N]
+
+`batch` processes every activity .xlsx under DIR on a process pool, one workbook
+per worker; the months of one report series run one after another, different
+series in parallel. Without --internal, each activity file is paired with the file in
+its own folder whose name contains "הובלות אלכל כללי".
+
+--profile writes one JSON line per pipeline stage (seconds, rows/sec, memory)
+to stderr; with MACHLAB_PROFILE_LOG set, the lines go there on every run.
+"""
+from __future__ import annotations
+import argparse
+import os
+import sys
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from pipeline.constants import REQUIRED_INTERNAL_SHEET, MODE_FORMULAS, MODE_VALUES, MODE_TABLE
+from pipeline.order_keys import period_of, series_of
+from pipeline.profiling import NULL_PROFILER, PROFILE_LOG, Profiler, json_lines, log_sink
+from pipeline.runner import process_files, process_files_cached
+
+OUTPUT_SUFFIX = "_checked"
+
+
+def run_one(activity, internal, output, mode=MODE_FORMULAS, lookup_only=False, use_cache=True,
+            sheet_workers=None, profile=False):
+    """Process one pair of files and write the result; returns a picklable summary."""
+    activity, internal, output = Path(activity), Path(internal), Path(output)
+    profiler = NULL_PROFILER
+    if profile or PROFILE_LOG:
+        profiler = Profiler(sink=json_lines(sys.stderr) if profile else log_sink(),
+                            context={"activity": str(activity), "mode": mode})
+    if use_cache:
+        result = process_files_cached(activity.read_bytes(), internal.read_bytes(),
+                                      mode=mode, lookup_only=lookup_only, workers=sheet_workers,
+                                      activity_name=str(activity.resolve()), profiler=profiler)
+    else:
+        result = process_files(activity, internal, mode=mode, lookup_only=lookup_only,
+                               workers=sheet_workers, use_sidecar=False,
+                               activity_name=str(activity.resolve()), profiler=profiler)
+    summary = {"activity": str(activity), "ok": result["ok"]}
+    if not result["ok"]:
+        summary["error"] = result["error"]
+        return summary
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_bytes(result["output"])
+    summary.update(output=str(output), cached=result.get("cached", False),
+                   missing_sheets=result["missing_sheets"], period=result["period"],
+                   previous_period=result["previous_period"],
+                   sheets=[{**{k: r[k] for k in ("sheet", "end_row", "counts", "warnings", "diff")},
+                            "validation": [(p["name"], p["level"], p.get("detail") or p.get("failed_rows"))
+                                           for p in r["validation"] + r["duplicates"]]}
+                           for r in result["sheets"]])
+    return summary
+
+
+def is_internal_file(path: Path) -> bool:
+    return REQUIRED_INTERNAL_SHEET in path.stem
+
+
+def find_jobs(root: Path, internal, out_dir: Path):
+    """
+    (activity, internal, output) for every activity workbook under root, in
+    month order (as named in the file names).
+    """
+    jobs = []
+    for activity in sorted(root.rglob("*.xlsx")):
+        if activity.name.startswith("~$") or is_internal_file(activity) or out_dir in activity.parents:
+            continue
+        pair = Path(internal) if internal else next(
+            (p for p in sorted(activity.parent.glob("*.xlsx")) if is_internal_file(p)), None)
+        output = out_dir / activity.relative_to(root).with_name(activity.stem + OUTPUT_SUFFIX + ".xlsx")
+        jobs.append((activity, pair, output))
+    return sorted(jobs, key=lambda job: (period_of(job[0]) or "", job[0]))
+
+
+def series_queues(jobs):
+    """
+    The jobs as one queue per report series, each in month order: a month's
+    order keys must be stored before the next month of its series is checked
+    against them. Files with no month in their name share nothing and queue alone.
+    """
+    queues = defaultdict(deque)
+    for job in jobs:
+        queues[series_of(job[0]) if period_of(job[0]) else job[0]].append(job)
+    return list(queues.values())
+
+
+def print_summary(summary):
+    if not summary["ok"]:
+        print(f"FAIL  {summary['activity']}: {summary['error']}")
+        return
+    tag = "HIT " if summary["cached"] else "OK  "
+    sheets = ", ".join(f"{s['sheet']}→{s['end_row']}" for s in summary["sheets"])
+    print(f"{tag}  {summary['activity']} → {summary['output']} [{sheets}]")
+    for sheet in summary["missing_sheets"]:
+        print(f"      missing sheet: {sheet}")
+    if summary["period"]:
+        against = summary["previous_period"] or "nothing stored for the previous month"
+        print(f"      month {summary['period']}, order keys checked against: {against}")
+    for s in summary["sheets"]:
+        diff = s["diff"]
+        if diff and not summary["cached"]:
+            print(f"      {s['sheet']}: {diff['changed']} rows changed, {diff['removed']} removed, "
+                  f"{diff['recomputed']} recomputed")
+        for name, level, detail in s["validation"]:
+            print(f"      {s['sheet']}: {level} {name}: {detail}")
+
+
+def cmd_run(args):
+    output = args.output or Path(args.activity).with_name(Path(args.activity).stem + OUTPUT_SUFFIX + ".xlsx")
+    summary = run_one(args.activity, args.internal, output, args.mode, args.lookup_only, not args.no_cache,
+                      profile=args.profile)
+    print_summary(summary)
+    return 0 if summary["ok"] else 1
+
+
+def cmd_batch(args):
+    root = Path(args.directory)
+    out_dir = Path(args.output_dir) if args.output_dir else root / "checked"
+    jobs = find_jobs(root, args.internal, out_dir)
+    if not jobs:
+        print(f"no activity workbooks under {root}")
+        return 1
+
+    failed = 0
+    for activity, internal, _ in jobs:
+        if internal is None:
+            print(f"FAIL  {activity}: no '{REQUIRED_INTERNAL_SHEET}' file next to it (use --internal)")
+            failed += 1
+    runnable = [job for job in jobs if job[1] is not None]
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        def submit(queue):
+            # the pool already runs one workbook per worker: plan their sheets in-process
+            a, i, o = queue.popleft()
+            running[pool.submit(run_one, a, i, o, args.mode, args.lookup_only, not args.no_cache, 1,
+                                args.profile)] = (a, queue)
+
+        running = {}
+        for queue in series_queues(runnable):
+            submit(queue)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                activity, queue = running.pop(future)
+                try:
+                    summary = future.result()
+                except Exception as e:  # one bad workbook must not stop the batch
+                    summary = {"activity": str(activity), "ok": False, "error": repr(e)}
+                print_summary(summary)
+                failed += not summary["ok"]
+                if queue:
+                    submit(queue)
+
+    print(f"{len(jobs) - failed}/{len(jobs)} workbooks processed")
+    return 1 if failed else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="machlab-check", description="Machlab/Alkal activity report check.")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--mode", choices=[MODE_FORMULAS, MODE_TABLE, MODE_VALUES], default=MODE_FORMULAS,
+                        help="inject formulas (audit), formulas over the internal sheet as a bounded "
+                             "Excel Table (fast recalculation), or computed values")
+    common.add_argument("--lookup-only", action="store_true",
+                        help="copy only columns A:O of the internal sheet")
+    common.add_argument("--no-cache", action="store_true",
+                        help="always recompute (no result cache, no master-file sidecar)")
+    common.add_argument("--profile", action="store_true",
+                        help="JSON lines with per-stage time, rows/sec and memory on stderr")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", parents=[common], help="process one activity workbook")
+    run.add_argument("--activity", required=True)
+    run.add_argument("--internal", required=True)
+    run.add_argument("-o", "--output", help=f"default: <activity>{OUTPUT_SUFFIX}.xlsx")
+    run.set_defaults(func=cmd_run)
+
+    batch = sub.add_parser("batch", parents=[common], help="process every activity workbook under a directory")
+    batch.add_argument("directory")
+    batch.add_argument("--internal", help="internal file for all workbooks (default: per folder)")
+    batch.add_argument("--output-dir", help="default: DIRECTORY/checked")
+    batch.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                       help="worker processes (default: CPU count)")
+    batch.set_defaults(func=cmd_batch)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+# ----- Constants -----
+REQUIRED_MAIN_SHEET_1     = "הובלה לבית לקוח"
+REQUIRED_MAIN_SHEET_2     = "הובלה לסוחר"
+REQUIRED_INTERNAL_SHEET   = "הובלות אלכל כללי"
+LOOKUP_COLUMNS            = "A:O"  # הטווח היחיד ב'הובלות אלכל כללי' שה-VLOOKUP/MATCH קורא
+
+TARGET_SHEETS = [REQUIRED_MAIN_SHEET_1, REQUIRED_MAIN_SHEET_2]
+
+COL_PURCHASE_SRC  = "הז. רכש (לקוח)"
+COL_RAKHASH       = "רכש"
+COL_MAKAT         = "מק'ט"
+COL_MAKAT_CLEAN   = "מקט ללא פגומים"
+COL_ORDER_CHECK   = "הזמנות לבדיקה"
+COL_QTY           = "כמות"
+COL_QTY_CHECK     = "בדיקת כמות"
+COL_PRICE_AFTER   = "מחירון מחלב לאחר בדיקה"
+COL_DUP_JULY      = "כפילויות חודש קודם"
+COL_MANUAL        = "מעבר ידני"
+COL_APPROVAL      = "אישור סופי"
+COL_NOTES         = "הערות"
+COL_TOTAL_PAY     = "סה\"כ לתשלום"
+COL_DIFF_ROW      = "פער לפי שורה"
+COL_TOTAL         = "סה\"כ"  # עמודת סיכום קיימת אם יש
+
+# עמודות נוספות להוספה אם חסרות (ללא נוסחאות, מלבד אלה שמוגדר להן נוסחה)
+EXTRA_COLUMNS = [
+    COL_PRICE_AFTER,
+    COL_DUP_JULY,
+    COL_QTY_CHECK,        # עם נוסחת VLOOKUP+MATCH
+    COL_MANUAL,
+    COL_APPROVAL,         # IF/OR/AND
+    COL_NOTES,
+    COL_TOTAL_PAY,        # IF(...*ABS(...))
+    COL_DIFF_ROW,         # סה"כ - סה"כ לתשלום
+]
+
+# מצבי פלט
+MODE_FORMULAS = "formulas"   # נוסחאות (לביקורת)
+MODE_VALUES   = "values"     # ערכים מחושבים
+MODE_TABLE    = "table"      # נוסחאות על טבלה עם טווחים תחומים (חישוב מהיר באקסל)
+FORMULA_MODES = (MODE_FORMULAS, MODE_TABLE)
+
+# שמות חלופיים לכותרות שמגיעות בשם שונה מהספק (מעבר לנרמול רווחים/תווים נסתרים)
+COLUMN_ALIASES = {
+    COL_PURCHASE_SRC: ["הזמנת רכש (לקוח)", "הז. רכש", "הזמנת רכש"],
+    COL_MAKAT:        ["מקט", "מק\"ט", "קוד פריט"],
+    COL_QTY:          ["כמות שסופקה", "כמות בפועל"],
+    COL_PRICE_AFTER:  ["מחירון מחלב אחרי בדיקה", "מחיר מחלב לאחר בדיקה"],
+    COL_TOTAL:        ["סה\"כ לחיוב", "סכום"],
+}
+
+# עמודות מקור שמותר לזהות גם בהתאמה מקורבת (לא עמודות שהסקריפט כותב אליהן, ולא
+# "מחירון מחלב לאחר בדיקה": קרובה מדי ל"מחירון מחלב לפני בדיקה", מזוהה לפי שמות חלופיים)
+FUZZY_SOURCE_COLUMNS = [COL_PURCHASE_SRC, COL_MAKAT, COL_QTY, COL_MANUAL, COL_TOTAL]
@@ -0,0 +1,99 @@
+from __future__ import annotations
+import difflib
+import re
+import unicodedata
+
+# Header index: normalized header name → column, built once per sheet header row
+# and kept up to date as columns are appended, so every lookup is a dict hit
+# instead of a scan over the header cells.
+
+# zero-width / bidi control characters that sneak into Hebrew headers
+_HIDDEN = re.compile("[\u200b-\u200f\u202a-\u202e\u2060-\u2069\ufeff\u00ad]")
+_SPACES = re.compile(r"\s+")
+# Hebrew geresh/gershayim and typographic quotes → ASCII
+_QUOTES = str.maketrans({"\u05f3": "'", "\u2019": "'", "\u2018": "'", "`": "'",
+                         "\u05f4": '"', "\u201c": '"', "\u201d": '"'})
+
+FUZZY_CUTOFF = 0.85
+
+
+def normalize_header(value) -> str:
+    if value is None:
+        return ""
+    text = unicodedata.normalize("NFKC", str(value))
+    text = _HIDDEN.sub("", text).translate(_QUOTES)
+    return _SPACES.sub(" ", text).strip()
+
+
+class HeaderIndex:
+    """
+    Column lookup for one header row (1-based columns).
+
+    header: the header row values; the index owns the list and appends to it
+    aliases: canonical name → alternative names accepted for it
+    """
+
+    def __init__(self, header, aliases=None):
+        self.header = list(header)
+        self._index = {}
+        for c, value in enumerate(self.header, start=1):
+            key = normalize_header(value)
+            if key:
+                self._index.setdefault(key, c)  # first occurrence wins, like a left-to-right scan
+        self._aliases = {name: [normalize_header(a) for a in alts]
+                         for name, alts in (aliases or {}).items()}
+        self._claimed = set()
+        self._resolved = {}  # name → column already resolved for it
+        self.renamed = {}  # canonical name → header actually used, for alias/fuzzy hits
+
+    def __len__(self):
+        return len(self.header)
+
+    def find(self, name, fuzzy=False):
+        """Column of `name` (exact after normalization, then aliases, then optionally fuzzy)."""
+        c = self._resolved.get(name) or self._index.get(normalize_header(name))
+        if c is None:
+            c = next((self._index[a] for a in self._aliases.get(name, ()) if a in self._index), None)
+            if c is None and fuzzy:
+                c = self._fuzzy(name)
+            if c is not None:
+                self.renamed[name] = self.header[c - 1]
+        if c is not None:
+            self._claimed.add(c)
+            self._resolved[name] = c
+        return c
+
+    def ensure(self, name, fuzzy=False):
+        """Locate a column by header; if missing, append it at the end and return the index."""
+        c = self.find(name, fuzzy=fuzzy)
+        if c is not None:
+            return c, False
+        self.header.append(name)
+        c = len(self.header)
+        self._index[normalize_header(name)] = c
+        self._claimed.add(c)
+        self._resolved[name] = c
+        return c, True
+
+    def _fuzzy(self, name):
+        # only headers no other column has already been resolved to
+        free = {key: c for key, c in self._index.items() if c not in self._claimed}
+        target = normalize_header(name)
+        matches = difflib.get_close_matches(target, list(free), n=len(free), cutoff=FUZZY_CUTOFF)
+        return next((free[m] for m in matches if not _one_word_apart(target, m)), None)
+
+
+def _one_word_apart(a: str, b: str) -> bool:
+    """
+    The headers differ in a single word that is not a misspelling of the other
+    ("מחירון מחלב לאחר בדיקה" / "מחירון מחלב לפני בדיקה"): a different column.
+    """
+    words_a, words_b = a.split(), b.split()
+    diffs = [op for op in difflib.SequenceMatcher(None, words_a, words_b).get_opcodes() if op[0] != "equal"]
+    if len(diffs) != 1:
+        return False
+    _, i1, i2, j1, j2 = diffs[0]
+    if i2 - i1 > 1 or j2 - j1 > 1:
+        return False
+    word_a, word_b = " ".join(words_a[i1:i2]), " ".join(words_b[j1:j2])
+    return difflib.SequenceMatcher(None, word_a, word_b).ratio() < FUZZY_CUTOFF
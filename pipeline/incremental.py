@@ -0,0 +1,74 @@
+from __future__ import annotations
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from pipeline.row_plan import RowOutputs
+
+# Incremental re-runs: operators re-upload the same month's file after a few
+# manual edits. Each target sheet keeps, per data row, a fingerprint of every
+# input the injections read (one per column) from the previous run of that file.
+# A re-run compares them to report what changed and, in values mode, recomputes
+# only rows whose inputs are new; every other row reuses its earlier outputs
+# (matched by content, so inserted or moved rows are reused too).
+
+INLINE_ROWS = 20  # changed row numbers listed in the report
+
+
+class RowState(NamedTuple):
+    columns: tuple                   # input column names (report labels), in fingerprint order
+    layout: tuple                    # (start_row, sorted cols items) the outputs were computed for
+    column_fps: np.ndarray           # (rows, columns) uint64
+    row_fps: np.ndarray              # (rows,) uint64
+    outputs: Optional[RowOutputs]    # values mode only
+
+
+def _cell_key(v) -> str:
+    # the type is part of the value: 5 and "5" are different inputs to Excel
+    return f"{type(v).__name__}\x1f{v}"
+
+
+def fingerprints(frame: pd.DataFrame, keys) -> tuple[np.ndarray, np.ndarray]:
+    """(per-column, per-row) uint64 fingerprints of the frame columns `keys`."""
+    n = len(frame)
+    column_fps = np.empty((n, len(keys)), dtype=np.uint64)
+    for j, key in enumerate(keys):
+        column_fps[:, j] = pd.util.hash_array(frame[key].map(_cell_key).to_numpy(dtype=object))
+    row_fps = pd.util.hash_pandas_object(pd.DataFrame(column_fps), index=False).to_numpy()
+    return column_fps, row_fps
+
+
+def reuse_positions(previous: RowState, row_fps: np.ndarray) -> np.ndarray:
+    """Position in the previous run of a row with the same inputs, or -1."""
+    if not len(previous.row_fps):
+        return np.full(len(row_fps), -1)
+    order = np.argsort(previous.row_fps, kind="stable")
+    ordered = previous.row_fps[order]
+    at = np.searchsorted(ordered, row_fps).clip(max=len(ordered) - 1)
+    return np.where(ordered[at] == row_fps, order[at], -1)
+
+
+def diff_report(previous: RowState, state: RowState, start_row: int, recomputed: int) -> dict:
+    """
+    changed: rows whose inputs appear nowhere in the previous run (edited or new)
+    removed: previous rows whose inputs appear nowhere now
+    columns: per input column, how many changed rows differ in it from the row
+             that had the same row number before
+    """
+    new_rows = ~np.isin(state.row_fps, previous.row_fps)
+    gone = ~np.isin(previous.row_fps, state.row_fps)
+    columns = {}
+    if previous.columns == state.columns:
+        edited = np.flatnonzero(new_rows)
+        edited = edited[edited < len(previous.row_fps)]
+        per_column = (previous.column_fps[edited] != state.column_fps[edited]).sum(axis=0)
+        columns = {name: int(c) for name, c in zip(state.columns, per_column) if c}
+    changed = np.flatnonzero(new_rows) + start_row
+    return {
+        "changed": int(new_rows.sum()),
+        "removed": int(gone.sum()),
+        "rows": changed[:INLINE_ROWS].tolist(),
+        "columns": columns,
+        "recomputed": recomputed,
+    }
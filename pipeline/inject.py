@@ -0,0 +1,265 @@
+from __future__ import annotations
+from io import BytesIO
+
+import numpy as np
+
+from pipeline.constants import (
+    COL_PURCHASE_SRC, COL_RAKHASH, COL_MAKAT, COL_MAKAT_CLEAN, COL_ORDER_CHECK,
+    COL_QTY, COL_QTY_CHECK, COL_PRICE_AFTER, COL_DUP_JULY, COL_MANUAL,
+    COL_APPROVAL, COL_NOTES, COL_TOTAL_PAY, COL_DIFF_ROW, COL_TOTAL,
+    EXTRA_COLUMNS, COLUMN_ALIASES, FUZZY_SOURCE_COLUMNS, MODE_VALUES,
+)
+from pipeline.headers import HeaderIndex
+from pipeline.profiling import NULL_PROFILER
+from pipeline.incremental import INLINE_ROWS, RowState, fingerprints, reuse_positions, diff_report
+from pipeline.order_keys import DUPLICATE_MARK, key_findings, row_keys
+from pipeline.reconcile import KEY_ROLES, SOURCE_ROLES, formula_inputs, read_frame
+from pipeline.row_plan import plan_from_frame, row_outputs, combine_row_outputs, plan_from_outputs
+from pipeline.streaming import StyledRows, copy_layout, open_source, read_header, sheet_width
+from pipeline.validation import sheet_rules, validate_frame, highlight_ranges, add_highlights
+
+KNOWN_COLUMNS = (
+    COL_PURCHASE_SRC, COL_RAKHASH, COL_MAKAT, COL_MAKAT_CLEAN, COL_ORDER_CHECK, COL_QTY,
+    *EXTRA_COLUMNS, COL_TOTAL,
+)
+
+# ----- Helpers -----
+def find_sheet_name(sheetnames, target):
+    if target in sheetnames:
+        return target
+    if (target + " ") in sheetnames:
+        return target + " "
+    for s in sheetnames:
+        if s.strip() == target.strip():
+            return s
+    return None
+
+def plan_sheet(src_ws, main_sheet_name, *, mode, supplied_index=None, previous=None, previous_month=None,
+               source=None, profiler=NULL_PROFILER):
+    """
+    Resolve the columns of one target sheet (adding missing ones) and plan the
+    per-row formulas (or computed values in MODE_VALUES). Reads, never writes.
+    Returns (header, plan, report); report has end_row, counts, added columns,
+    renamed headers, warnings, and the sheet's rules.yaml findings
+    ("validation") with the cells to highlight ("highlights", level → range).
+
+    previous: plan.state of an earlier run of the same file; adds "diff" to the
+    report and, in MODE_VALUES, reuses the outputs of rows whose inputs are
+    unchanged. The plan carries this run's state in plan.state.
+    previous_month: order_keys.MonthKeys of the previous month; rows whose order
+    key it holds are marked in "כפילויות חודש קודם". Repeated and ambiguous keys
+    are reported either way ("duplicates", in the shape of rules findings), and
+    the plan carries the sheet's keys up to the stop line in plan.order_keys
+    (their rows in plan.order_rows), for the checks across sheets.
+    source: path or bytes of the workbook; input cells holding formulas are
+    read from it again as the values Excel cached for them: in MODE_VALUES for
+    every input (rows with a formula that was never calculated are left as they
+    are and reported), in the formula modes for the order keys only (such rows
+    are left out of the key checks and reported).
+    profiler: times read / cached / fingerprint / compute / keys / validate as "<stage>[sheet]"
+    """
+    header = read_header(src_ws)
+    width = sheet_width(src_ws, header)
+    source_width = width
+    header.extend([None] * (width - len(header)))
+    index = HeaderIndex(header, aliases=COLUMN_ALIASES)
+
+    # Exact (normalized) matches first, so the fuzzy pass only sees headers no
+    # other column has claimed
+    for name in KNOWN_COLUMNS:
+        index.find(name)
+
+    def ensure_column(name):
+        return index.ensure(name, fuzzy=name in FUZZY_SOURCE_COLUMNS)
+
+    # Ensure required and extra columns exist (add at end if missing)
+    col_purchase_src = ensure_column(COL_PURCHASE_SRC)[0]
+    col_rakhash, _   = ensure_column(COL_RAKHASH)
+    col_makat, _     = ensure_column(COL_MAKAT)
+    col_clean, _     = ensure_column(COL_MAKAT_CLEAN)
+    col_order, _     = ensure_column(COL_ORDER_CHECK)
+    col_qty, _       = ensure_column(COL_QTY)
+    col_qty_check,_  = ensure_column(COL_QTY_CHECK)
+    col_price,_      = ensure_column(COL_PRICE_AFTER)
+    col_dup,_        = ensure_column(COL_DUP_JULY)
+    col_manual,_     = ensure_column(COL_MANUAL)
+    col_approval,_   = ensure_column(COL_APPROVAL)
+    col_notes,_      = ensure_column(COL_NOTES)
+    col_total_pay,_  = ensure_column(COL_TOTAL_PAY)
+    col_diff,_       = ensure_column(COL_DIFF_ROW)
+
+    added_extra = []
+    for name in EXTRA_COLUMNS:
+        _, added = ensure_column(name)
+        if added:
+            added_extra.append(name)
+
+    warnings = []
+    # locate existing "סה\"כ" column (do NOT create if missing)
+    col_total = index.find(COL_TOTAL, fuzzy=True)
+    if col_total is None:
+        warnings.append("missing_total")
+
+    cols = {"src": col_purchase_src, "makat": col_makat, "rakhash": col_rakhash,
+            "clean": col_clean, "order": col_order, "qty": col_qty,
+            "qty_check": col_qty_check, "manual": col_manual, "price": col_price,
+            "total": col_total, "approval": col_approval,
+            "total_pay": col_total_pay, "diff": col_diff}
+
+    # Columns rules.yaml reads on this sheet, if it has a spec (present in the upload only)
+    spec = sheet_rules(main_sheet_name)
+    rule_cols = {}
+    for name in (spec.columns if spec else ()):
+        c = index.find(name)
+        if c is not None and c <= source_width:
+            rule_cols[name] = c
+
+    # Pass 1: one read of the rows → stop line + all seven injected columns (+ rule columns)
+    with profiler.stage(f"read[{main_sheet_name}]") as stage:
+        frame = read_frame(src_ws.iter_rows(min_row=2, values_only=True), cols, extra=rule_cols)
+        stage["rows"] = len(frame)
+    # formula inputs → their cached values: the whole frame in values mode; in
+    # the formula modes the formulas are planned from the cells as they are,
+    # so only a copy for the order keys
+    uncached, key_frame = {}, frame
+    if source is not None:
+        with profiler.stage(f"cached[{main_sheet_name}]", rows=len(frame)):
+            if mode == MODE_VALUES:
+                uncached = _cached_inputs(frame, cols, source, main_sheet_name)
+            else:
+                key_frame = frame.copy()
+                uncached = _cached_inputs(key_frame, cols, source, main_sheet_name, roles=KEY_ROLES)
+
+    # Per-row fingerprints of every input column (each source column once)
+    inputs = {}
+    for key, c in [*((role, cols[role]) for role in SOURCE_ROLES), *rule_cols.items()]:
+        if c and c not in inputs.values():
+            inputs[key] = c
+    labels = tuple(index.header[c - 1] for c in inputs.values())
+    layout = (2, tuple(sorted(cols.items())))
+    with profiler.stage(f"fingerprint[{main_sheet_name}]", rows=len(frame)):
+        column_fps, row_fps = fingerprints(frame, list(inputs))
+    # a previous run with the columns elsewhere has nothing reusable
+    previous_ok = previous is not None and previous.layout == layout and previous.columns == labels
+
+    with profiler.stage(f"compute[{main_sheet_name}]") as stage:
+        plan, outputs, recomputed = _compute(frame, cols, main_sheet_name, mode, supplied_index,
+                                             previous if previous_ok else None, row_fps)
+        stage["rows"] = recomputed
+    plan.state = RowState(labels, layout, column_fps, row_fps, outputs)
+    formula_problems, formula_cells = _uncached_findings(uncached, index.header, cols, frame.index.to_numpy(),
+                                                         keys_only=mode != MODE_VALUES)
+    if uncached and mode == MODE_VALUES:
+        plan.skip(np.logical_or.reduce(list(uncached.values())))
+    uncached_keys = [uncached[role] for role in KEY_ROLES if role in uncached]
+
+    # Order keys up to the stop line: repeats within the month, and rows already in the previous one
+    with profiler.stage(f"keys[{main_sheet_name}]", rows=len(frame)):
+        keys = row_keys(key_frame)
+        keyed = keys.filled & (frame.index.to_numpy() <= plan.end_row)
+        if uncached_keys:
+            keyed &= ~np.logical_or.reduce(uncached_keys)
+        plan.order_keys = keys.keys[keyed]
+        plan.order_rows = frame.index.to_numpy()[keyed]
+        plan.order_column = col_order
+        duplicates, seen = key_findings(keys, keyed, frame.index.to_numpy(), previous_month)
+        if seen is not None:
+            plan.add("dup", col_dup, seen, values=np.full(len(frame), DUPLICATE_MARK, dtype=object))
+
+    # rules.yaml checks on the same rows, up to the stop line
+    problems = []
+    if spec:
+        problems = validate_frame(frame.loc[:plan.end_row, list(rule_cols)], spec, profiler=profiler)
+    problems += formula_problems
+    highlights = highlight_ranges(problems + duplicates + formula_cells,
+                                  {**rule_cols, COL_ORDER_CHECK: col_order, COL_DUP_JULY: col_dup,
+                                   **{index.header[c - 1]: c for c in cols.values() if c}})
+
+    report = {"end_row": plan.end_row, "counts": plan.counts, "added": added_extra,
+              "renamed": list(index.renamed.items()), "warnings": warnings,
+              "validation": problems, "duplicates": duplicates, "highlights": highlights,
+              "diff": diff_report(previous, plan.state, 2, recomputed) if previous is not None else None}
+    return index.header, plan, report
+
+def _cached_inputs(frame, cols, source, sheet_name, roles=SOURCE_ROLES) -> dict:
+    # formula inputs of `roles` → the values cached in the file (frame updated
+    # in place); returns role → rows whose formula has no cached value
+    formulas = formula_inputs(frame)[list(roles)]
+    if not formulas.to_numpy().any():
+        return {}
+    wb = open_source(BytesIO(source) if isinstance(source, bytes) else source, data_only=True)
+    try:
+        cached = read_frame(wb[sheet_name].iter_rows(min_row=2, values_only=True), cols)
+    finally:
+        wb.close()
+    uncached = {}
+    for role in roles:
+        rows = formulas[role].to_numpy()
+        if not rows.any():
+            continue
+        values = cached[role].reindex(frame.index).to_numpy(dtype=object)
+        missing = rows & np.array([v is None for v in values], dtype=bool)
+        put = rows & ~missing
+        frame.loc[frame.index[put], role] = values[put]
+        if missing.any():
+            uncached[role] = missing
+    return uncached
+
+def _uncached_findings(uncached, header, cols, row_numbers, keys_only=False):
+    # → ([one warning finding], [per-column cells to highlight])
+    if not uncached:
+        return [], []
+    rows = row_numbers[np.logical_or.reduce(list(uncached.values()))]
+    names = [header[cols[role] - 1] for role in uncached]
+    if keys_only:
+        name, effect = "uncached_key_inputs", "they were left out of the order key checks"
+    else:
+        name, effect = "uncached_formula_inputs", "their injected cells were left as they are"
+    finding = {"name": name, "level": "warning",
+               "detail": f"{len(rows)} rows read formulas the file holds no calculated value for "
+                         f"(save it in Excel first); {effect}",
+               "rows": rows[:INLINE_ROWS].tolist(), "row_index": rows, "columns": names}
+    cells = [{"level": "warning", "row_index": row_numbers[missing], "columns": [header[cols[role] - 1]]}
+             for role, missing in uncached.items()]
+    return [finding], cells
+
+def _compute(frame, cols, main_sheet_name, mode, supplied_index, previous, row_fps):
+    # → (plan, values-mode row outputs or None, rows computed)
+    if mode == MODE_VALUES:
+        if previous is not None and previous.outputs is not None:
+            previous_pos = reuse_positions(previous, row_fps)
+            fresh_pos = np.flatnonzero(previous_pos < 0)
+            fresh = row_outputs(frame.iloc[fresh_pos], cols, main_sheet_name, supplied_index)
+            outputs = combine_row_outputs(previous.outputs, previous_pos, fresh, fresh_pos)
+            recomputed = len(fresh_pos)
+        else:
+            outputs = row_outputs(frame, cols, main_sheet_name, supplied_index)
+            recomputed = len(frame)
+        return plan_from_outputs(outputs, cols), outputs, recomputed
+    # formulas are one vectorized pass over the masks: nothing worth reusing
+    return plan_from_frame(frame, cols, main_sheet_name, mode=mode), None, len(frame)
+
+PROGRESS_ROWS = 5000  # write_sheet reports progress once per block of rows
+
+def write_sheet(src_ws, out_ws, header, plan, highlights=None, progress=None):
+    """
+    Pass 2: emit header and rows once, with the source sheet's layout and
+    formats and the plan applied (and failed cells marked).
+    progress: called with the number of data rows written, every PROGRESS_ROWS rows
+    """
+    copy_layout(src_ws, out_ws)
+    rows = StyledRows(src_ws, out_ws, len(header))
+    done = 0
+    for r, row, style_ids in rows:
+        if r == 1:
+            out_ws.append(rows.cells(header, style_ids))
+            continue
+        out_ws.append(rows.cells(plan.apply(r, row), style_ids))
+        done += 1
+        if progress is not None and done % PROGRESS_ROWS == 0:
+            progress(done)
+    rows.copy_tail()
+    if progress is not None:
+        progress(done)
+    if highlights:
+        add_highlights(out_ws, highlights)
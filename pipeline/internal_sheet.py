@@ -0,0 +1,66 @@
+from __future__ import annotations
+import pandas as pd
+from openpyxl.utils import get_column_letter
+from openpyxl.workbook.defined_name import DefinedName
+
+from pipeline.constants import REQUIRED_INTERNAL_SHEET
+from pipeline.inject import find_sheet_name
+from pipeline.reconcile import LOOKUP_WIDTH, SUPPLIED_HEADER
+from pipeline.row_plan import LOOKUP_KEYS_NAME, LOOKUP_SUPPLIED_NAME
+
+# Fast read of the "הובלות אלכל כללי" sheet. calamine (Rust) parses .xlsx several
+# times faster than openpyxl; it is optional and openpyxl is used when missing.
+# Arrow-backed dtypes are deliberately not used: they turn mixed number/text
+# columns into text, which would change what VLOOKUP compares in the copy. For
+# the same reason the lookup columns (the key in A and "סופק") are kept as they
+# are parsed: read_excel would otherwise turn text that looks numeric (a "4500…"
+# key) into a number, which the text key built by & no longer finds.
+
+INTERNAL_TABLE_NAME = "InternalSheet"  # the copy as an Excel Table (MODE_TABLE)
+
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
+
+
+def _as_parsed(v):
+    # a converter: the cell keeps the type the engine read it as
+    return v
+
+
+def read_internal(file, lookup_only: bool = False):
+    """
+    Returns (sheet_name, DataFrame) of the internal sheet, or (None, None) when
+    the file has no "הובלות אלכל כללי" sheet.
+    lookup_only: read only columns A:O (all the lookup uses).
+    """
+    xl = pd.ExcelFile(file, engine=EXCEL_ENGINE)
+    sheet_name = find_sheet_name(xl.sheet_names, REQUIRED_INTERNAL_SHEET)
+    if not sheet_name:
+        return None, None
+    usecols = None
+    if lookup_only:
+        # usecols="A:O" is rejected when the sheet is narrower than O
+        width = len(xl.parse(sheet_name, nrows=0).columns)
+        usecols = list(range(min(width, LOOKUP_WIDTH)))
+    df = xl.parse(sheet_name, usecols=usecols, converters={0: _as_parsed, SUPPLIED_HEADER: _as_parsed})
+    return sheet_name, df
+
+
+
+def define_lookup_names(wb, df: pd.DataFrame, sheet_name: str = REQUIRED_INTERNAL_SHEET):
+    """
+    Workbook names the MODE_TABLE formulas look up through, over the copy of
+    `df`: the key column (A) and the "סופק" column among the first 15, each
+    bounded to the data rows. Without "סופק" there the supplied name is #N/A,
+    as the MATCH inside the VLOOKUP formula would be.
+    """
+    last = max(len(df), 1) + 1
+    headers = [str(c) for c in df.columns[:LOOKUP_WIDTH]]
+    bounded = lambda letter: f"'{sheet_name}'!${letter}$2:${letter}${last}"
+    supplied = (bounded(get_column_letter(headers.index(SUPPLIED_HEADER) + 1))
+                if SUPPLIED_HEADER in headers else "NA()")
+    wb.defined_names[LOOKUP_KEYS_NAME] = DefinedName(LOOKUP_KEYS_NAME, attr_text=bounded("A"))
+    wb.defined_names[LOOKUP_SUPPLIED_NAME] = DefinedName(LOOKUP_SUPPLIED_NAME, attr_text=supplied)
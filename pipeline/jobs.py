@@ -0,0 +1,276 @@
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple
+
+from pipeline.cache import CACHE_DIR, DiskCache, private_dir
+from pipeline.parallel import no_main_reimport, pool_context
+from pipeline.profiling import NULL_PROFILER, PROFILE_LOG, Profiler, log_sink
+from pipeline.runner import process_files_cached, result_key
+
+# Background jobs for the app. Submitting a pair of uploads records a job in a
+# small SQLite table and runs it on a process pool shared by every session, so
+# a long run neither blocks the Streamlit script nor restarts on the next widget
+# rerun, and several operators queue instead of competing for the same CPU.
+# Workers write their progress (step, per sheet: planned / rows written) to the
+# table; the UI polls it. The finished result is the result-cache entry of the
+# run (runner.result_key), which is what the download is served from.
+#
+# MACHLAB_JOB_WORKERS: jobs run at once (each plans its sheets in-process)
+# MACHLAB_JOB_MAX_DAYS: finished jobs older than this are dropped from the table
+
+JOBS_DIR = os.path.join(CACHE_DIR, "jobs")
+JOBS_DB = os.path.join(JOBS_DIR, "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("MACHLAB_JOB_WORKERS", "2"))
+JOB_MAX_DAYS = float(os.getenv("MACHLAB_JOB_MAX_DAYS", "7"))
+PROGRESS_INTERVAL = 0.5  # seconds between progress writes within one step
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+INTERRUPTED = "interrupted"  # error of jobs whose server process went away
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    input_key TEXT NOT NULL,
+    activity_name TEXT,
+    mode TEXT,
+    lookup_only INTEGER,
+    status TEXT NOT NULL,
+    progress TEXT,
+    profile TEXT,
+    error TEXT,
+    cached INTEGER NOT NULL DEFAULT 0,
+    owner_pid INTEGER,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_input ON jobs (input_key, status);
+"""
+_JSON_FIELDS = ("progress", "profile")
+
+
+class Job(NamedTuple):
+    id: str
+    input_key: str          # runner.result_key of the run = its result-cache key
+    activity_name: str | None
+    mode: str
+    lookup_only: bool
+    status: str
+    progress: dict          # {"step", "sheets": {name: {"rows", "planned", "written"}}}
+    profile: list | None    # Profiler.records, when the job was profiled
+    error: str | None
+    cached: bool            # served from the result cache, not computed
+    owner_pid: int | None
+    created: float
+    updated: float
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+
+def _row_to_job(row) -> Job:
+    values = dict(row)
+    for name in _JSON_FIELDS:
+        values[name] = json.loads(values[name]) if values[name] else None
+    values["progress"] = values["progress"] or {}
+    values["lookup_only"] = bool(values["lookup_only"])
+    values["cached"] = bool(values["cached"])
+    return Job(**values)
+
+
+class JobStore:
+    """The job table. Short-lived connections: it is shared by threads and processes."""
+
+    def __init__(self, path=JOBS_DB):
+        self.path = str(path)
+        private_dir(os.path.dirname(self.path))
+        db = self._connect()
+        try:
+            db.execute("PRAGMA journal_mode=WAL")  # readers (the UI) don't block the workers' writes
+            db.executescript(_SCHEMA)
+        finally:
+            db.close()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _query(self, sql, *args):
+        db = self._connect()
+        try:
+            with db:
+                return db.execute(sql, args).fetchall()
+        finally:
+            db.close()
+
+    def create(self, input_key, *, activity_name=None, mode=None, lookup_only=False, status=QUEUED,
+               cached=False) -> Job:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        self._query("INSERT INTO jobs (id, input_key, activity_name, mode, lookup_only, status, cached, "
+                    "owner_pid, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    job_id, input_key, activity_name, mode, int(lookup_only), status, int(cached),
+                    os.getpid(), now, now)
+        return self.get(job_id)
+
+    def get(self, job_id) -> Job | None:
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", job_id)
+        return _row_to_job(rows[0]) if rows else None
+
+    def active(self, input_key) -> Job | None:
+        """
+        The queued or running job for these inputs, if any. Only jobs of this
+        server process count: one left behind by an earlier process is stale
+        until interrupt_stale marks it (when this process starts its pool).
+        """
+        rows = self._query("SELECT * FROM jobs WHERE input_key = ? AND status IN (?, ?) AND owner_pid = ? "
+                           "ORDER BY created LIMIT 1", input_key, QUEUED, RUNNING, os.getpid())
+        return _row_to_job(rows[0]) if rows else None
+
+    def position(self, job: Job) -> int:
+        """Queued jobs ahead of `job`."""
+        return self._query("SELECT COUNT(*) FROM jobs WHERE status = ? AND created < ?",
+                           QUEUED, job.created)[0][0]
+
+    def update(self, job_id, **fields):
+        for name in _JSON_FIELDS:
+            if name in fields:
+                fields[name] = json.dumps(fields[name], ensure_ascii=False)
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._query(f"UPDATE jobs SET {assignments} WHERE id = ?", *fields.values(), job_id)
+
+    def fail_unfinished(self, job_id, error):
+        self._query("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ? AND status IN (?, ?)",
+                    FAILED, error, time.time(), job_id, QUEUED, RUNNING)
+
+    def interrupt_stale(self, owner_pid):
+        """Jobs left queued/running by an earlier server process can never finish."""
+        self._query("UPDATE jobs SET status = ?, error = ?, updated = ? "
+                    "WHERE status IN (?, ?) AND owner_pid != ?",
+                    FAILED, INTERRUPTED, time.time(), QUEUED, RUNNING, owner_pid)
+
+    def purge(self, max_age):
+        self._query("DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?",
+                    DONE, FAILED, time.time() - max_age)
+
+
+class JobProgress:
+    """process_files(progress=...) callback writing the job's progress to the table."""
+
+    def __init__(self, store: JobStore, job_id, interval=PROGRESS_INTERVAL):
+        self.store = store
+        self.job_id = job_id
+        self.interval = interval
+        self.state = {"step": None, "sheets": {}}
+        self._last = 0.0
+
+    def __call__(self, step, sheet=None, done=None, total=None):
+        changed = step != self.state["step"]
+        self.state["step"] = step
+        if sheet is not None:
+            entry = self.state["sheets"].setdefault(sheet, {"rows": total, "planned": False, "written": 0})
+            entry["rows"] = total
+            if step == "plan":
+                entry["planned"] = True
+                changed = True
+            elif step == "write":
+                entry["written"] = done
+                changed |= done == total
+        now = time.monotonic()
+        if changed or now - self._last >= self.interval:
+            self._last = now
+            self.store.update(self.job_id, progress=self.state)
+
+
+def _run_job(db_path, job_id, activity_bytes, internal_bytes, mode, lookup_only, activity_name, profile):
+    # in a pool worker
+    store = JobStore(db_path)
+    store.update(job_id, status=RUNNING)
+    profiler = NULL_PROFILER
+    if profile or PROFILE_LOG:
+        profiler = Profiler(memory=profile == "memory", sink=log_sink(),
+                            context={"activity": activity_name, "mode": mode, "job": job_id})
+    try:
+        # the pool already runs several jobs at once: plan their sheets in-process
+        result = process_files_cached(activity_bytes, internal_bytes, mode=mode, lookup_only=lookup_only,
+                                      workers=1, activity_name=activity_name, profiler=profiler,
+                                      progress=JobProgress(store, job_id))
+    except Exception:
+        store.update(job_id, status=FAILED, error=traceback.format_exc())
+        return
+    store.update(job_id, status=DONE if result["ok"] else FAILED, error=result.get("error"),
+                 cached=int(result["cached"]), profile=profiler.records if profiler.enabled else None)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(store: JobStore, reset=False):
+    global _pool
+    with _pool_lock:
+        if _pool is None or reset:
+            if _pool is None:
+                store.interrupt_stale(os.getpid())
+            _pool = ProcessPoolExecutor(max_workers=JOB_WORKERS, mp_context=pool_context())
+        return _pool
+
+
+def _on_done(store: JobStore, job_id, future):
+    # a worker that died (out of memory, killed) never records its own failure
+    error = future.exception()
+    if error is not None:
+        store.fail_unfinished(job_id, repr(error))
+
+
+def submit(activity_bytes: bytes, internal_bytes: bytes, *, mode, lookup_only=False, activity_name=None,
+           profile=None, store: JobStore | None = None, cache: DiskCache | None = None) -> Job:
+    """
+    Job for a pair of uploads: the one already queued/running for the same
+    inputs, a finished one when the result is cached, or a newly queued one.
+    profile: None, "time", or "memory" (records in job.profile)
+    """
+    store = store or JobStore()
+    cache = cache or DiskCache()
+    key = result_key(activity_bytes, internal_bytes, mode, lookup_only, activity_name)
+    job = store.active(key)
+    if job is not None:
+        return job
+    store.purge(JOB_MAX_DAYS * 24 * 3600)
+    options = {"activity_name": activity_name, "mode": mode, "lookup_only": lookup_only}
+    if cache.locate(key, ".pkl") is not None:
+        return store.create(key, status=DONE, cached=True, **options)
+
+    job = store.create(key, **options)
+    args = (_run_job, store.path, job.id, activity_bytes, internal_bytes, mode, lookup_only, activity_name, profile)
+    with no_main_reimport():
+        try:
+            future = _get_pool(store).submit(*args)
+        except BrokenProcessPool:
+            future = _get_pool(store, reset=True).submit(*args)
+    future.add_done_callback(lambda f: _on_done(store, job.id, f))
+    return job
+
+
+def get(job_id, store: JobStore | None = None) -> Job | None:
+    return (store or JobStore()).get(job_id)
+
+
+def position(job: Job, store: JobStore | None = None) -> int:
+    return (store or JobStore()).position(job)
+
+
+def result(job: Job, cache: DiskCache | None = None):
+    """The finished job's result (with "cached"), or None once evicted from the result cache."""
+    result = (cache or DiskCache()).get_object(job.input_key)
+    return None if result is None else {**result, "cached": job.cached}
@@ -0,0 +1,292 @@
+from __future__ import annotations
+import os
+import re
+from io import BytesIO
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from pipeline.cache import CACHE_DIR, DiskCache, cache_key, digest
+from pipeline.constants import COL_ORDER_CHECK, COL_DUP_JULY
+from pipeline.reconcile import VALUE_ERROR, excel_text, is_filled, order_columns
+
+# Order keys ("הזמנות לבדיקה" = רכש & LEFT(מק'ט,7)) as one uint64 per row. A key
+# text that is a plain number – the regular key, a purchase number followed by
+# a 7-digit SKU – is stored as that number, purchase * 10**7 + SKU; any other
+# text as a 64-bit hash of its casefolded text (VLOOKUP ignores case) with the
+# top bit set, so the two kinds never meet. A sorted array of them answers
+# membership and duplicate questions with searchsorted instead of per-row dict
+# lookups.
+#
+# Each processed month's key set is kept (one small .npz per report series and
+# month, under CACHE_DIR/order_keys, holding the keys of each activity file of
+# that month apart: a re-run of a file replaces its own keys); the next month's
+# run of the same series marks its rows whose key already appeared in any of
+# them in "כפילויות חודש קודם". The
+# month comes from the activity file name ("פעילות אלכל יולי 2025.xlsx",
+# "activity 07-2025.xlsx") and the series is the rest of that name ("פעילות
+# אלכל", "activity"), so the reports of different customers don't meet.
+#
+# MACHLAB_ORDER_KEYS_MAX_DAYS: stored months unused for this long are dropped
+
+SKU_DIGITS = 7
+TEXT_TAG = np.uint64(1 << 63)  # marks hashed (irregular) keys
+_REGULAR_KEY = re.compile(r"[1-9]\d{%d,17}" % SKU_DIGITS)  # < 10**18, below TEXT_TAG
+
+KEYS_DIR = os.path.join(CACHE_DIR, "order_keys")
+KEYS_MAX_DAYS = float(os.getenv("MACHLAB_ORDER_KEYS_MAX_DAYS", "400"))
+KEYS_SUFFIX = ".npz"
+
+DUPLICATE_MARK = "כפילות"  # written to "כפילויות חודש קודם"
+
+HEBREW_MONTHS = {
+    "ינואר": 1, "פברואר": 2, "מרץ": 3, "מרס": 3, "אפריל": 4, "מאי": 5, "יוני": 6,
+    "יולי": 7, "אוגוסט": 8, "ספטמבר": 9, "אוקטובר": 10, "נובמבר": 11, "דצמבר": 12,
+}
+_YEAR = r"(20\d{2})(?!\d)"
+# a whole word: "מאי" is not the month inside "מאיר"
+_MONTH_NAME = re.compile("(?<![\u05d0-\u05ea])(%s)(?![\u05d0-\u05ea])" % "|".join(HEBREW_MONTHS))
+_MONTH_YEAR = re.compile(r"(?<!\d)(\d{1,2})[._\-/ ]" + _YEAR)
+_YEAR_MONTH = re.compile(r"(?<!\d)(20\d{2})[._\-/ ](\d{1,2})(?!\d)")
+
+
+def encode_keys(texts) -> np.ndarray:
+    """uint64 key of each order-key text (see the module comment)."""
+    texts = pd.Series(np.asarray(texts, dtype=object), dtype="string")
+    regular = texts.str.fullmatch(_REGULAR_KEY.pattern).fillna(False).to_numpy(dtype=bool)
+    keys = np.empty(len(texts), dtype=np.uint64)
+    keys[regular] = texts[regular].astype("uint64").to_numpy()
+    other = texts[~regular].fillna("").str.casefold().to_numpy(dtype=object)
+    keys[~regular] = pd.util.hash_array(other) | TEXT_TAG
+    return keys
+
+
+class RowKeys(NamedTuple):
+    keys: np.ndarray      # uint64 per data row (meaningful where filled)
+    filled: np.ndarray    # the row has an order key (not blank, not #VALUE!)
+    pairs: np.ndarray     # uint64 fingerprint of the (רכש, מקט ללא פגומים) texts behind the key
+
+
+def _cell_texts(values: pd.Series, written: np.ndarray) -> np.ndarray:
+    # written cells already hold the formula's text; convert only the others
+    texts = values.to_numpy(dtype=object).copy()
+    texts[~written] = values[~written].map(excel_text).to_numpy(dtype=object)
+    return texts
+
+
+def row_keys(frame: pd.DataFrame) -> RowKeys:
+    """Order keys of the rows of a read_frame() frame, as the formulas compute them."""
+    _, written, current = order_columns(frame)
+    computed = written["order"].to_numpy(dtype=bool)
+    texts = _cell_texts(current["order"], computed)
+    filled = computed & (texts != VALUE_ERROR)
+    typed = current["order"][~computed]
+    filled[~computed] = typed.map(lambda v: is_filled(v) and v != VALUE_ERROR).to_numpy(dtype=bool)
+    # the pair behind a computed key is the key text split after its רכש part,
+    # i.e. the text plus the length of its מקט ללא פגומים part; a key typed into
+    # the sheet (length 0: a computed key always has a מק'ט) is its own pair
+    clean = pd.Series(_cell_texts(current["clean"], written["clean"].to_numpy(dtype=bool)))
+    split = np.where(computed, clean.str.len().to_numpy(dtype=np.uint64, na_value=0), 0).astype(np.uint64)
+    pairs = pd.util.hash_array(texts.astype(str).astype(object)) ^ (split * np.uint64(0x9E3779B97F4A7C15))
+    return RowKeys(encode_keys(texts), filled, pairs)
+
+
+class OrderKeyIndex:
+    """
+    Sorted uint64 keys: membership, first position and repeats by binary search.
+    keys: in any order, repeats allowed; positions refer to this order.
+    """
+
+    def __init__(self, keys):
+        keys = np.asarray(keys, dtype=np.uint64)
+        self.order = np.argsort(keys, kind="stable")
+        self.sorted = keys[self.order]
+
+    def __len__(self):
+        return len(self.sorted)
+
+    def positions(self, keys) -> np.ndarray:
+        """Position of the first indexed entry equal to each key, or -1."""
+        keys = np.asarray(keys, dtype=np.uint64)
+        if not len(self.sorted):
+            return np.full(len(keys), -1)
+        at = np.searchsorted(self.sorted, keys).clip(max=len(self.sorted) - 1)
+        return np.where(self.sorted[at] == keys, self.order[at], -1)
+
+    def contains(self, keys) -> np.ndarray:
+        return self.positions(keys) >= 0
+
+    def duplicated(self) -> np.ndarray:
+        """Per indexed entry (in the original order): its key occurs more than once."""
+        same = self.sorted[1:] == self.sorted[:-1]
+        repeated = np.zeros(len(self.sorted), dtype=bool)
+        repeated[1:] |= same
+        repeated[:-1] |= same
+        out = np.empty_like(repeated)
+        out[self.order] = repeated
+        return out
+
+    def unique(self) -> np.ndarray:
+        if not len(self.sorted):
+            return self.sorted
+        return self.sorted[np.concatenate(([True], self.sorted[1:] != self.sorted[:-1]))]
+
+
+def collisions(keys: RowKeys, mask: np.ndarray) -> np.ndarray:
+    """
+    Rows (within mask) whose key text is shared with a row built from a
+    different (רכש, מקט ללא פגומים) pair – e.g. a short מק'ט running into the
+    purchase number – so VLOOKUP cannot tell the orders apart.
+    """
+    rows = np.flatnonzero(mask)
+    pairs = np.unique(np.stack([keys.keys[rows], keys.pairs[rows]], axis=1), axis=0)
+    shared = pairs[:, 0][OrderKeyIndex(pairs[:, 0]).duplicated()]
+    out = np.zeros(len(mask), dtype=bool)
+    out[rows] = np.isin(keys.keys[rows], shared)
+    return out
+
+
+INLINE_ROWS = 20  # row numbers listed inline in a finding (as in rules findings)
+
+
+def _finding(name, rows, column, detail):
+    rows = np.asarray(rows, dtype=np.int64)
+    return {"name": name, "level": "warning", "detail": detail, "rows": rows[:INLINE_ROWS].tolist(),
+            "row_index": rows, "columns": [column]}
+
+
+class MonthKeys(NamedTuple):
+    period: str               # "YYYY-MM"
+    index: OrderKeyIndex      # that month's distinct keys
+
+
+def cross_sheet_findings(sheets: dict) -> dict:
+    """
+    sheets: sheet name → (keys, row numbers) of its keyed rows (plan.order_keys,
+    plan.order_rows). Per sheet, a finding on the rows whose key also appears in
+    another of the sheets (an empty list when there are none).
+    """
+    indexes = {name: OrderKeyIndex(keys) for name, (keys, _) in sheets.items()}
+    findings = {}
+    for name, (keys, rows) in sheets.items():
+        shared = np.zeros(len(keys), dtype=bool)
+        others = []
+        for other, index in indexes.items():
+            if other != name:
+                hit = index.contains(keys)
+                if hit.any():
+                    shared |= hit
+                    others.append(other.strip())
+        findings[name] = [_finding("duplicate_order_key_across_sheets", rows[shared], COL_ORDER_CHECK,
+                                   f"{int(shared.sum())} rows have order keys that also appear in "
+                                   f"{', '.join(others)}")] if shared.any() else []
+    return findings
+
+
+def key_findings(keys: RowKeys, mask: np.ndarray, row_numbers: np.ndarray,
+                 previous_month: MonthKeys | None = None):
+    """
+    Findings (rules-finding shape) on the keyed rows in `mask` and, when a
+    previous month is given, the rows whose key it already holds (else None).
+    """
+    problems = []
+    rows = np.flatnonzero(mask)
+    repeated = np.zeros(len(mask), dtype=bool)
+    repeated[rows] = OrderKeyIndex(keys.keys[rows]).duplicated()
+    if repeated.any():
+        problems.append(_finding("duplicate_order_key", row_numbers[repeated], COL_ORDER_CHECK,
+                                 f"{int(repeated.sum())} rows share their order key with another row"))
+    ambiguous = collisions(keys, mask)
+    if ambiguous.any():
+        problems.append(_finding("ambiguous_order_key", row_numbers[ambiguous], COL_ORDER_CHECK,
+                                 f"{int(ambiguous.sum())} rows spell the same key from a different "
+                                 f"purchase / SKU pair"))
+    seen = None
+    if previous_month is not None:
+        seen = np.zeros(len(mask), dtype=bool)
+        seen[rows] = previous_month.index.contains(keys.keys[rows])
+        if seen.any():
+            problems.append(_finding("previous_month_duplicate", row_numbers[seen], COL_DUP_JULY,
+                                     f"{int(seen.sum())} rows have order keys already in {previous_month.period}"))
+    return problems, seen
+
+
+# ----- months -----
+
+def period_of(name) -> str | None:
+    """"YYYY-MM" named in an activity file name, or None."""
+    stem = Path(str(name)).stem
+    m = _MONTH_NAME.search(stem)
+    year = re.search(r"(?<!\d)" + _YEAR, stem)
+    if m and year:
+        return f"{year.group(1)}-{HEBREW_MONTHS[m.group(1)]:02d}"
+    m = _YEAR_MONTH.search(stem)
+    if m and 1 <= int(m.group(2)) <= 12:
+        return f"{m.group(1)}-{int(m.group(2)):02d}"
+    m = _MONTH_YEAR.search(stem)
+    if m and 1 <= int(m.group(1)) <= 12:
+        return f"{m.group(2)}-{int(m.group(1)):02d}"
+    return None
+
+
+def series_of(name) -> str:
+    """The report series of an activity file: its name without the month and year."""
+    stem = Path(str(name)).stem
+    for pattern in (_MONTH_NAME, _YEAR_MONTH, _MONTH_YEAR, re.compile(r"(?<!\d)" + _YEAR)):
+        stem = pattern.sub(" ", stem)
+    return " ".join(re.sub(r"[._\-/]+", " ", stem).split()).casefold()
+
+
+def previous_period(period: str) -> str:
+    year, month = map(int, period.split("-"))
+    return f"{year - 1}-12" if month == 1 else f"{year}-{month - 1:02d}"
+
+
+def month_store() -> DiskCache:
+    return DiskCache(KEYS_DIR, max_age=KEYS_MAX_DAYS * 24 * 3600)
+
+
+def _month_key(series, period):
+    return cache_key("order_keys", series, period)
+
+
+def _file_sets(data) -> dict:
+    # stored month → {file tag: distinct keys of that activity file}
+    if data is None:
+        return {}
+    with np.load(BytesIO(data), allow_pickle=False) as stored:
+        return {tag: stored[tag] for tag in stored.files}
+
+
+def save_month(series: str, period: str, activity_name, keys: np.ndarray, store: DiskCache | None = None):
+    """
+    Keep the distinct order keys of one activity file of a series' month,
+    replacing what an earlier run of the same file stored (its corrected keys
+    replace the wrong ones); the month's other files are kept.
+    """
+    store = store or month_store()
+    sets = _file_sets(store.get(_month_key(series, period), KEYS_SUFFIX))
+    sets[digest(str(activity_name).encode())] = OrderKeyIndex(keys).unique()
+    out = BytesIO()
+    np.savez(out, **sets)
+    store.put(_month_key(series, period), out.getvalue(), KEYS_SUFFIX)
+
+
+def load_month(series: str, period: str, store: DiskCache | None = None) -> MonthKeys | None:
+    """The keys of every stored activity file of a series' month, or None."""
+    data = (store or month_store()).get(_month_key(series, period), KEYS_SUFFIX)
+    if data is None:
+        return None
+    sets = _file_sets(data)
+    return MonthKeys(period, OrderKeyIndex(np.concatenate([np.zeros(0, np.uint64), *sets.values()])))
+
+
+def previous_month_tag(activity_name, store: DiskCache | None = None) -> str:
+    """Identifies the stored previous month a run of `activity_name` is checked against ("" if none)."""
+    period = period_of(activity_name) if activity_name else None
+    if period is None:
+        return ""
+    data = (store or month_store()).get(_month_key(series_of(activity_name), previous_period(period)), KEYS_SUFFIX)
+    return "" if data is None else f"{previous_period(period)}:{digest(data)}"
@@ -0,0 +1,125 @@
+from __future__ import annotations
+import multiprocessing
+import os
+import sys
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from io import BytesIO
+
+from pipeline.inject import plan_sheet
+from pipeline.profiling import NULL_PROFILER, Profiler
+from pipeline.streaming import open_source
+
+# Per-sheet planning on worker processes. The target sheets share nothing but
+# the read-only internal lookup, which is built once in the parent and shipped
+# to the workers with the run. Workers open their own read-only view of the
+# activity workbook and return (header, plan, report). Assembly of the output
+# workbook stays in the parent, in sheet order.
+#
+# The pool is kept for the life of the process (Streamlit reruns, CLI) and uses
+# a forkserver with the pipeline preloaded: forking a threaded server process
+# directly is unsafe, and spawn would re-import pandas for every run.
+# Workers are started on submit (see no_main_reimport).
+
+# below this many data rows the hand-off costs more than it saves
+PARALLEL_MIN_ROWS = 20000
+
+_pool = None
+_pool_size = 0
+_main_lock = threading.Lock()
+
+
+@contextmanager
+def no_main_reimport():
+    """
+    Submit to a spawn/forkserver pool inside this: a new worker starts by
+    re-importing the parent's __main__ script, and under Streamlit that is
+    app.py. Workers only run pipeline functions, so they get an empty __main__.
+    """
+    with _main_lock:
+        main = sys.modules.get("__main__")
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            yield
+        finally:
+            sys.modules["__main__"] = main
+
+
+# modules the forkserver imports once: it is one per process, shared by this
+# pool and the job pool (pipeline.jobs), whichever starts first
+FORKSERVER_PRELOAD = ["pipeline.inject", "pipeline.jobs"]
+
+
+def pool_context():
+    """multiprocessing context for a worker pool: forkserver where available, else spawn."""
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload(FORKSERVER_PRELOAD)
+    return ctx
+
+
+def _get_pool(workers):
+    global _pool, _pool_size
+    if _pool is None or _pool_size < workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=pool_context())
+        _pool_size = workers
+    return _pool
+
+
+def _plan_in_worker(source, sheet_name, mode, supplied_index, previous, previous_month, profile):
+    # profile: time the stages here and hand the records back with the plan
+    profiler = Profiler(memory=profile == "memory") if profile else NULL_PROFILER
+    wb = open_source(BytesIO(source) if isinstance(source, bytes) else source)
+    try:
+        result = plan_sheet(wb[sheet_name], sheet_name, mode=mode, supplied_index=supplied_index,
+                            previous=previous, previous_month=previous_month, source=source, profiler=profiler)
+        return result, profiler.records
+    finally:
+        wb.close()
+
+
+def plan_sheets(source, src_wb, sheet_names, *, mode, supplied_index=None, workers=None, previous=None,
+                previous_month=None, profiler=NULL_PROFILER, progress=None):
+    """
+    Plan every sheet in `sheet_names`; returns {sheet_name: (header, plan, report)}.
+
+    source: path or bytes of the activity workbook (re-opened by each worker)
+    src_wb: the parent's already-open read-only workbook (sequential fallback)
+    workers: process count; None = one per sheet, capped by CPU count;
+             1 or small sheets = plan in this process
+    previous: {sheet_name: plan.state} of an earlier run (see inject.plan_sheet)
+    previous_month: order_keys.MonthKeys every sheet is checked against
+    profiler: per-sheet stage timings; workers' records are merged into it
+    progress: called with (sheet_name, plan) as each sheet is planned
+    """
+    progress = progress or (lambda name, plan: None)
+    previous = previous or {}
+    workers = workers or min(len(sheet_names), os.cpu_count() or 1)
+    rows = sum(src_wb[name].max_row or 0 for name in sheet_names)
+    if workers < 2 or len(sheet_names) < 2 or rows < PARALLEL_MIN_ROWS:
+        plans = {}
+        for name in sheet_names:
+            plans[name] = plan_sheet(src_wb[name], name, mode=mode, supplied_index=supplied_index,
+                                     previous=previous.get(name), previous_month=previous_month,
+                                     source=source, profiler=profiler)
+            progress(name, plans[name][1])
+        return plans
+
+    profile = profiler.enabled and ("memory" if getattr(profiler, "memory", False) else "time")
+    pool = _get_pool(workers)
+    with no_main_reimport():
+        futures = {pool.submit(_plan_in_worker, source, name, mode, supplied_index, previous.get(name),
+                               previous_month, profile): name
+                   for name in sheet_names}
+    plans = {}
+    for future in as_completed(futures):
+        name = futures[future]
+        plans[name], records = future.result()
+        profiler.extend(records)
+        progress(name, plans[name][1])
+    return {name: plans[name] for name in sheet_names}
@@ -0,0 +1,146 @@
+from __future__ import annotations
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Stage instrumentation. A Profiler records, per named stage, wall time, rows
+# handled (rows/sec), process RSS at the end and, with memory=True, the
+# tracemalloc peak inside the stage (a nested stage restarts the peak of the
+# one around it). Stages with the same name (per-block loops) are merged. Anything with a .stage(name) context manager can be passed
+# where a profiler is accepted; NULL_PROFILER costs one attribute lookup and an
+# empty `with` when profiling is off.
+#
+# MACHLAB_PROFILE_LOG: "-" = JSON lines on stdout, a path = appended to that file.
+
+PROFILE_LOG = os.getenv("MACHLAB_PROFILE_LOG")
+
+
+def rss_mb():
+    """Current resident set size in MB (peak RSS where the current is not readable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+    return None
+
+
+class _NullStage:
+    __slots__ = ("record",)
+
+    def __init__(self):
+        self.record = {}
+
+    def __enter__(self):
+        return self.record
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullProfiler:
+    enabled = False
+    records = ()
+    _stage = _NullStage()
+
+    def stage(self, name, rows=None):
+        return self._stage
+
+    def extend(self, records):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class Profiler:
+    """
+    memory: also trace Python allocations (tracemalloc; slows the run down)
+    sink: called with each finished stage record (see json_lines)
+    context: fields added to every record (file name, mode, ...)
+    """
+    enabled = True
+
+    def __init__(self, memory=False, sink=None, context=None):
+        self.memory = memory
+        self.sink = sink
+        self.context = context or {}
+        self._records = {}
+
+    @property
+    def records(self):
+        return list(self._records.values())
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """with profiler.stage("copy_internal") as rec: ...; rec["rows"] = n"""
+        rec = {"rows": rows}
+        tracing = self.memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] / 2**20 if self.memory else None
+            if tracing:
+                tracemalloc.stop()
+            self._add(name, seconds, rec.get("rows"), peak)
+
+    def _add(self, name, seconds, rows, peak):
+        rss = rss_mb()
+        if self.sink is not None:  # each occurrence as measured
+            self.sink({**self.context, "stage": name, "seconds": seconds, "rows": rows,
+                       "rows_per_sec": rows / seconds if rows is not None and seconds else None,
+                       "rss_mb": rss, "peak_mb": peak})
+        rec = self._records.get(name)
+        if rec is None:
+            rec = self._records[name] = {**self.context, "stage": name, "seconds": 0.0, "rows": None,
+                                         "rows_per_sec": None, "rss_mb": None, "peak_mb": None}
+        rec["seconds"] += seconds
+        if rows is not None:
+            rec["rows"] = (rec["rows"] or 0) + rows
+            rec["rows_per_sec"] = rec["rows"] / rec["seconds"] if rec["seconds"] else None
+        rec["rss_mb"] = rss
+        if peak is not None:
+            rec["peak_mb"] = max(rec["peak_mb"] or 0.0, peak)
+
+    def extend(self, records):
+        """Merge records made elsewhere (e.g. in a worker process)."""
+        for rec in records:
+            self._add(rec["stage"], rec["seconds"], rec["rows"], rec["peak_mb"])
+
+
+def json_lines(stream):
+    """Sink writing one JSON object per finished stage."""
+    def sink(rec):
+        stream.write(json.dumps({"ts": round(time.time(), 3), **rec}, ensure_ascii=False, default=str) + "\n")
+        stream.flush()
+    return sink
+
+
+def log_sink(target=PROFILE_LOG):
+    """JSON-lines sink for MACHLAB_PROFILE_LOG, or None when it is not set."""
+    if not target:
+        return None
+    if target == "-":
+        return json_lines(sys.stdout)
+
+    def sink(rec):
+        with open(target, "a", encoding="utf-8") as f:
+            json_lines(f)(rec)
+    return sink
@@ -0,0 +1,254 @@
+from __future__ import annotations
+import math
+import numpy as np
+import pandas as pd
+
+# Computed-values engine: evaluates in pandas exactly what the injected formulas
+# (רכש, מקט ללא פגומים, הזמנות לבדיקה, בדיקת כמות, אישור סופי, סה"כ לתשלום,
+# פער לפי שורה) would show once Excel recalculates, so the output file carries
+# plain values instead of per-row VLOOKUP/MATCH formulas.
+
+SUPPLIED_HEADER = "סופק"
+LOOKUP_WIDTH = 15  # VLOOKUP range is $A:$O
+
+QTY_OK = "תקין"
+QTY_CHECK = "בדיקת כמות"
+QTY_REVIEW = "נדרשת בדיקה"
+APPROVED = "מאושר"
+NOT_APPROVED = "לא מאושר"
+VALUE_ERROR = "#VALUE!"  # openpyxl stores this string as a real error cell
+
+# Source columns the engine reads, by role (frame column names)
+SOURCE_ROLES = ("src", "makat", "rakhash", "clean", "order",
+                "qty", "qty_check", "manual", "price", "total")
+KEY_ROLES = SOURCE_ROLES[:5]  # the inputs of the order key (order_columns)
+
+
+def is_filled(v) -> bool:
+    """Same emptiness test the formula injection uses."""
+    return v is not None and str(v).strip() != ""
+
+
+def excel_text(v) -> str:
+    """Text of a cell value as Excel's & / LEFT() would render it."""
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "TRUE" if v else "FALSE"
+    if isinstance(v, (int, np.integer)):
+        return str(int(v))
+    if isinstance(v, (float, np.floating)):
+        if math.isnan(v):
+            return ""
+        if float(v).is_integer() and abs(v) < 1e15:
+            return str(int(v))
+        return format(float(v), ".15g")
+    return str(v)
+
+
+def excel_number(v) -> float:
+    """Value of a cell inside arithmetic (blank → 0, numeric text coerced, else NaN = #VALUE!)."""
+    if v is None:
+        return 0.0
+    if isinstance(v, (bool, np.bool_)):
+        return float(v)
+    if isinstance(v, (int, float, np.integer, np.floating)):
+        return 0.0 if math.isnan(v) else float(v)
+    try:
+        return float(str(v).strip())
+    except ValueError:
+        return math.nan
+
+
+def _compare_key(v):
+    # Excel "=" never coerces between numbers and text; blank compares as 0
+    if v is None or (isinstance(v, float) and math.isnan(v)):
+        return ("n", 0.0)
+    if isinstance(v, (bool, np.bool_)):
+        return ("b", bool(v))
+    if isinstance(v, (int, float, np.integer, np.floating)):
+        return ("n", float(v))
+    return ("s", str(v).casefold())
+
+
+_TRUE_KEY, _FALSE_KEY = "\0TRUE", "\0FALSE"  # xlsx text cannot hold \0
+
+
+def _lookup_key(v):
+    # VLOOKUP exact match never coerces: text only finds text (ignoring case),
+    # a number only a number, a boolean only a boolean; blanks find nothing
+    if v is None or v is pd.NaT or (isinstance(v, float) and math.isnan(v)):
+        return None
+    if isinstance(v, (bool, np.bool_)):
+        return _TRUE_KEY if v else _FALSE_KEY
+    if isinstance(v, (int, float, np.integer, np.floating)):
+        return float(v)
+    if isinstance(v, str):
+        return v.casefold()
+    return excel_text(v).casefold()
+
+
+def build_supplied_index(df_internal: pd.DataFrame) -> pd.Series:
+    """
+    Order key → "סופק" value, equivalent to
+    VLOOKUP(key, internal!$A:$O, MATCH("סופק", internal!$A$1:$O$1, 0), 0).
+    Empty when "סופק" is not among the first 15 headers (MATCH → #N/A).
+    """
+    headers = [str(c) for c in df_internal.columns[:LOOKUP_WIDTH]]
+    if df_internal.empty or SUPPLIED_HEADER not in headers:
+        return pd.Series([], dtype=object)
+    supplied_col = headers.index(SUPPLIED_HEADER)
+    keys = df_internal.iloc[:, 0].astype(object).map(_lookup_key)
+    values = df_internal.iloc[:, supplied_col].astype(object)
+    index = pd.Series(values.to_numpy(), index=keys.to_numpy(dtype=object))
+    index = index[keys.notna().to_numpy() & (keys != "").to_numpy()]
+    # VLOOKUP returns the first match
+    return index[~index.index.duplicated(keep="first")]
+
+
+def read_frame(rows, roles: dict, start_row: int = 2, extra: dict | None = None) -> pd.DataFrame:
+    """
+    Build the engine input from row tuples (1-based column positions in `roles`).
+    Roles mapped to None (e.g. a missing "סה\"כ") come out as blanks.
+    extra: header name → position of further columns to keep from the same pass
+    (named by header; used by the rules.yaml validation).
+    """
+    picks = [(role, roles.get(role)) for role in SOURCE_ROLES] + list((extra or {}).items())
+    data = {key: [] for key, _ in picks}
+    n = 0
+    for row in rows:
+        for key, c in picks:
+            data[key].append(row[c - 1] if c and c <= len(row) else None)
+        n += 1
+    frame = pd.DataFrame({k: pd.Series(v, dtype=object) for k, v in data.items()})
+    frame.index = pd.RangeIndex(start_row, start_row + n)
+    return frame
+
+
+def is_formula(v) -> bool:
+    return isinstance(v, str) and v.startswith("=")
+
+
+def formula_inputs(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per SOURCE_ROLES column, the cells holding a formula whose value the
+    engine reads. Roles the injection overwrites (רכש, מקט ללא פגומים,
+    הזמנות לבדיקה, בדיקת כמות) are read only on rows where their own inputs
+    are blank.
+    """
+    formulas = pd.DataFrame({role: frame[role].map(is_formula).astype(bool) for role in SOURCE_ROLES})
+    src_filled = frame["src"].map(is_filled).astype(bool)
+    makat_filled = frame["makat"].map(is_filled).astype(bool)
+    formulas["rakhash"] &= ~src_filled
+    formulas["clean"] &= ~makat_filled
+    for role in ("order", "qty_check"):
+        formulas[role] &= ~(src_filled & makat_filled)
+    return formulas
+
+
+def order_columns(frame: pd.DataFrame):
+    """
+    4.1–4.3 (רכש, מקט ללא פגומים, הזמנות לבדיקה) of every row, as
+    (values, written, current) dicts keyed by role; current is what the cell
+    holds once the injection is applied (the formula's value, or the existing
+    cell where nothing is written).
+    """
+    values, written, current = {}, {}, {}
+    src_filled = frame["src"].map(is_filled)
+    makat_filled = frame["makat"].map(is_filled)
+
+    # 4.1 רכש = src*1
+    rakhash_num = frame["src"].map(excel_number)
+    rakhash_err = src_filled & rakhash_num.isna()
+    rakhash = rakhash_num.astype(object).where(~rakhash_err, VALUE_ERROR)
+    values["rakhash"], written["rakhash"] = rakhash, src_filled
+    current["rakhash"] = rakhash.where(src_filled, frame["rakhash"])
+
+    # 4.2 מקט ללא פגומים = LEFT(makat, 7)
+    clean = frame["makat"].map(lambda v: excel_text(v)[:7])
+    values["clean"], written["clean"] = clean, makat_filled
+    current["clean"] = clean.where(makat_filled, frame["clean"])
+
+    # 4.3 הזמנות לבדיקה = רכש & מקט ללא פגומים
+    order_set = current["rakhash"].map(is_filled) & current["clean"].map(is_filled)
+    order_err = order_set & rakhash_err
+    order = (current["rakhash"].map(excel_text) + current["clean"].map(excel_text)).astype(object)
+    order = order.where(~order_err, VALUE_ERROR)
+    values["order"], written["order"] = order, order_set
+    current["order"] = order.where(order_set, frame["order"])
+    return values, written, current
+
+
+# Output roles written only up to the stop line (the rest depend on the row alone)
+RANGED_ROLES = ("qty_check", "approval", "total_pay", "diff")
+
+
+def reconcile_rows(frame: pd.DataFrame, supplied: pd.Series, *,
+                   small_qty_rule: bool, has_total: bool):
+    """
+    Compute the injected columns as values. Each row's outputs depend on that
+    row (and the lookup) only, so rows can be computed in any subset; the stop
+    line is applied afterwards (row_plan.plan_from_outputs).
+
+    frame: one row per sheet row (index = Excel row number), SOURCE_ROLES columns
+    supplied: output of build_supplied_index
+    small_qty_rule: "הובלה לבית לקוח" variant (match + qty<3 → תקין, else בדיקת כמות)
+    has_total: whether the sheet has a "סה\"כ" column (פער לפי שורה is skipped otherwise)
+
+    Returns (values, written, order_filled), Series over frame.index:
+    values/written map output role → the row's value / whether the row writes it
+    before the stop line is applied (RANGED_ROLES are cut at end_row);
+    order_filled marks rows with a non-empty order key (they set end_row).
+    """
+    values, written, current = order_columns(frame)
+    order_cur = current["order"]
+    order_filled = order_cur.map(is_filled).astype(bool)
+
+    # 4.4 בדיקת כמות – hash join of the order key against the internal "סופק" column
+    found = order_cur.map(_lookup_key).map(supplied)
+    hit = order_cur.map(_lookup_key).isin(supplied.index)
+    qty_keys = frame["qty"].map(_compare_key)
+    equal = pd.Series(
+        [h and _compare_key(s) == q for h, s, q in zip(hit, found, qty_keys)],
+        index=frame.index, dtype=bool,
+    )
+    if small_qty_rule:
+        small = qty_keys.map(lambda k: k[0] == "n" and k[1] < 3)
+        matched = np.where(small, QTY_OK, QTY_CHECK)
+    else:
+        matched = QTY_OK
+    qty_check = pd.Series(np.where(equal, matched, QTY_REVIEW), index=frame.index, dtype=object)
+    # errors in the key propagate through VLOOKUP (IFNA only catches #N/A)
+    qty_err = order_cur.map(lambda v: v == VALUE_ERROR)
+    qty_check = qty_check.where(~qty_err, VALUE_ERROR)
+    values["qty_check"], written["qty_check"] = qty_check, order_filled
+    qty_check_cur = qty_check.where(order_filled, frame["qty_check"])
+
+    # 4.5 אישור סופי
+    manual_keys = frame["manual"].map(_compare_key)
+    manual_zero = manual_keys.map(lambda k: k == ("n", 0.0))
+    manual_ok = manual_keys.map(lambda k: k == ("s", APPROVED.casefold()))
+    qty_ok = qty_check_cur.map(lambda v: _compare_key(v) == ("s", QTY_OK.casefold()))
+    approved = (manual_zero & qty_ok) | manual_ok
+    approval_err = qty_check_cur.map(lambda v: v == VALUE_ERROR)
+    approval = pd.Series(np.where(approved, APPROVED, NOT_APPROVED), index=frame.index, dtype=object)
+    approval = approval.where(~approval_err, VALUE_ERROR)
+    every_row = pd.Series(True, index=frame.index)
+    values["approval"], written["approval"] = approval, every_row
+
+    # 4.6 סה"כ לתשלום
+    price = frame["price"].map(excel_number)
+    qty = frame["qty"].map(excel_number)
+    pay = (price * qty.abs()).where(approval == APPROVED, 0.0)
+    total_pay = pay.astype(object).where(pay.notna() & ~approval_err, VALUE_ERROR)
+    values["total_pay"], written["total_pay"] = total_pay, every_row
+
+    # 4.7 פער לפי שורה
+    if has_total:
+        total = frame["total"].map(excel_number)
+        diff = total - pay
+        pay_err = total_pay.map(lambda v: v == VALUE_ERROR)
+        diff = diff.astype(object).where(diff.notna() & ~pay_err, VALUE_ERROR)
+        values["diff"], written["diff"] = diff, every_row
+
+    return values, written, order_filled
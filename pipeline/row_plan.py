@@ -0,0 +1,233 @@
+from __future__ import annotations
+from typing import NamedTuple
+
+import numpy as np
+from openpyxl.utils import get_column_letter
+
+from pipeline.constants import REQUIRED_MAIN_SHEET_1, REQUIRED_INTERNAL_SHEET, MODE_VALUES, MODE_TABLE
+from pipeline.reconcile import RANGED_ROLES, is_filled, reconcile_rows
+
+# Row plan: one read of a target sheet's rows (only the source columns the
+# injections depend on) is enough to work out the stop row and all seven
+# injected columns. The writer then applies the plan while emitting rows.
+
+OUTPUT_ROLES = ("rakhash", "clean", "order", "qty_check", "approval", "total_pay", "diff")
+
+_ROW = "\0"  # row-number placeholder inside formula templates
+
+# MODE_TABLE: the copied internal sheet is an Excel Table, and these workbook
+# names hold its bounded key column (A) and its "סופק" column, resolved once when
+# the copy is written (internal_sheet.define_lookup_names). Every row then does
+# one exact MATCH over the data rows instead of VLOOKUP over $A:$O plus its own
+# MATCH for the "סופק" header.
+LOOKUP_KEYS_NAME = "Internal_Keys"
+LOOKUP_SUPPLIED_NAME = "Internal_Supplied"
+
+
+def supplied_lookup(order_ref, table=False):
+    """Formula for the "סופק" value of an order key (#N/A when missing)."""
+    if table:
+        return f"INDEX({LOOKUP_SUPPLIED_NAME},MATCH({order_ref},{LOOKUP_KEYS_NAME},0))"
+    return (
+        'VLOOKUP({order},\'{internal}\'!$A:$O,'
+        'MATCH("סופק",\'{internal}\'!$A$1:$O$1,0),0)'
+    ).format(order=order_ref, internal=REQUIRED_INTERNAL_SHEET)
+
+
+def qty_check_formula(order_ref, qty_ref, main_sheet_name, table=False):
+    # ✅ נרמול שמות הגיליונות למניעת בעיות של רווחים או תווים נסתרים
+    sheet_key = main_sheet_name.strip()
+    sheet_1_key = REQUIRED_MAIN_SHEET_1.strip()
+    lookup = supplied_lookup(order_ref, table)
+
+    if sheet_key == sheet_1_key:  # "הובלה לבית לקוח"
+        # תנאי מיוחד: אם הכמות < 3 -> "תקין", אחרת "בדיקת כמות"
+        return (
+            '=IFNA('
+            'IF({lookup}='
+            '\'{main}\'!{qty},'
+            'IF(\'{main}\'!{qty}<3,"תקין","בדיקת כמות"),'
+            '"נדרשת בדיקה"),'
+            '"נדרשת בדיקה")'
+        ).format(
+            lookup=lookup,
+            main=main_sheet_name,  # שומר את שם הגיליון האמיתי, גם אם כולל רווח
+            qty=qty_ref,
+        )
+
+    # "הובלה לסוחר" וברירת מחדל: תנאי פשוט: שוויון -> "תקין", אחרת "נדרשת בדיקה"
+    return (
+        '=IFNA('
+        'IF({lookup}='
+        '{qty},'
+        '"תקין",'
+        '"נדרשת בדיקה"),'
+        '"נדרשת בדיקה")'
+    ).format(
+        lookup=lookup,
+        qty=qty_ref,
+    )
+
+
+def formula_templates(cols: dict, main_sheet_name: str, table: bool = False) -> dict:
+    """Per-role formula with the row number left as a placeholder."""
+    L = {role: get_column_letter(c) for role, c in cols.items() if c}
+    ref = lambda role: f"{L[role]}{_ROW}"
+    templates = {
+        "rakhash": f"={ref('src')}*1",
+        "clean": f"=LEFT({ref('makat')},7)",
+        "order": f"={ref('rakhash')}&{ref('clean')}",
+        "qty_check": qty_check_formula(ref("order"), ref("qty"), main_sheet_name, table),
+        "approval": (
+            '=IF(OR(AND({manual}=0,{qtychk}="תקין"),{manual}="מאושר"),"מאושר","לא מאושר")'
+        ).format(manual=ref("manual"), qtychk=ref("qty_check")),
+        "total_pay": (
+            '=IF({approval}="מאושר",{price}*ABS({qty}),0)'
+        ).format(approval=ref("approval"), price=ref("price"), qty=ref("qty")),
+    }
+    if cols.get("total"):
+        templates["diff"] = f"={ref('total')}-{ref('total_pay')}"
+    return {role: tmpl.split(_ROW) for role, tmpl in templates.items()}
+
+
+class RowPlan:
+    """
+    Injected outputs of one target sheet, worked out from a single pass.
+
+    For every output role: the target column, a boolean mask over the data rows
+    (row 2 → position 0) and either per-row values or a formula template.
+    """
+
+    def __init__(self, start_row, n_rows, end_row):
+        self.start_row = start_row
+        self.n_rows = n_rows
+        self.end_row = end_row
+        self.columns = {}  # role → (col, mask, values | None, template parts | None)
+        self.state = None  # incremental.RowState of the run that built the plan
+        self.order_keys = None  # packed order keys of the rows up to end_row (order_keys.row_keys)
+        self.order_rows = None  # their sheet rows
+        self.order_column = None  # column of "הזמנות לבדיקה"
+
+    def add(self, role, col, mask, values=None, template=None):
+        self.columns[role] = (col, mask, values, template)
+
+    def skip(self, rows):
+        """Leave the rows in `rows` (bool over the data rows) as they are in the source."""
+        for role, (col, mask, values, template) in self.columns.items():
+            self.columns[role] = (col, mask & ~rows, values, template)
+
+    @property
+    def counts(self):
+        counts = dict.fromkeys(OUTPUT_ROLES, 0)
+        counts.update({role: int(mask.sum()) for role, (_, mask, _, _) in self.columns.items()})
+        return counts
+
+    def apply(self, r, row):
+        """Write the planned outputs of sheet row `r` into `row` (a list)."""
+        i = r - self.start_row
+        if i < 0 or i >= self.n_rows:
+            return row
+        for col, mask, values, template in self.columns.values():
+            if mask[i]:
+                row[col - 1] = values[i] if template is None else str(r).join(template)
+        return row
+
+
+class RowOutputs(NamedTuple):
+    """
+    Values-mode results of every data row (row start_row → position 0), before
+    the stop line is applied. Rows depend on their own inputs only, so a row's
+    entry can be reused wherever the same inputs appear again.
+    """
+    values: dict            # role → object ndarray
+    written: dict           # role → bool ndarray
+    order_filled: np.ndarray
+
+
+def row_outputs(frame, cols: dict, main_sheet_name: str, supplied_index) -> RowOutputs:
+    values, written, order_filled = reconcile_rows(
+        frame, supplied_index,
+        small_qty_rule=main_sheet_name.strip() == REQUIRED_MAIN_SHEET_1.strip(),
+        has_total=cols.get("total") is not None,
+    )
+    return RowOutputs(
+        values={role: v.to_numpy(dtype=object) for role, v in values.items()},
+        written={role: w.to_numpy(dtype=bool) for role, w in written.items()},
+        order_filled=order_filled.to_numpy(dtype=bool),
+    )
+
+
+def combine_row_outputs(previous: RowOutputs, previous_pos: np.ndarray,
+                        fresh: RowOutputs, fresh_pos: np.ndarray) -> RowOutputs:
+    """
+    Rows taken from an earlier run's outputs (previous_pos[i] = its position
+    there, -1 = not reused) and freshly computed rows (at fresh_pos).
+    """
+    n = len(previous_pos)
+    reuse = previous_pos >= 0
+    src = previous_pos[reuse]
+
+    def merge(old, new, dtype):
+        out = np.zeros(n, dtype=dtype) if dtype is bool else np.empty(n, dtype=dtype)
+        out[reuse] = old[src]
+        out[fresh_pos] = new
+        return out
+
+    return RowOutputs(
+        values={role: merge(previous.values[role], fresh.values[role], object) for role in fresh.values},
+        written={role: merge(previous.written[role], fresh.written[role], bool) for role in fresh.written},
+        order_filled=merge(previous.order_filled, fresh.order_filled, bool),
+    )
+
+
+def plan_from_outputs(outputs: RowOutputs, cols: dict, start_row: int = 2) -> RowPlan:
+    """Apply the stop line (last row with an order key) to row outputs."""
+    n = len(outputs.order_filled)
+    last = np.flatnonzero(outputs.order_filled)
+    end_row = int(last[-1]) + start_row if len(last) else start_row - 1
+    in_range = np.arange(n) < (end_row - start_row + 1)
+    plan = RowPlan(start_row, n, end_row)
+    for role, values in outputs.values.items():
+        written = outputs.written[role]
+        plan.add(role, cols[role], written & in_range if role in RANGED_ROLES else written, values=values)
+    return plan
+
+
+def plan_from_frame(frame, cols: dict, main_sheet_name: str, *, mode, supplied_index=None,
+                    start_row: int = 2) -> RowPlan:
+    """
+    Row plan of one target sheet.
+    frame: the sheet's data rows from `start_row` on, as read with read_frame()
+    cols: 1-based column per role (source roles + output roles; "total" may be None)
+    """
+    n = len(frame)
+    if mode == MODE_VALUES:
+        outputs = row_outputs(frame, cols, main_sheet_name, supplied_index)
+        return plan_from_outputs(outputs, cols, start_row=start_row)
+
+    filled = {role: frame[role].map(is_filled).to_numpy(dtype=bool)
+              for role in ("src", "makat", "rakhash", "clean", "order")}
+    rakhash_mask = filled["src"]
+    clean_mask = filled["makat"]
+    order_mask = (rakhash_mask | filled["rakhash"]) & (clean_mask | filled["clean"])
+    order_cur = order_mask | filled["order"]
+
+    # stop line determined by last non-empty in "הזמנות לבדיקה"
+    last = np.flatnonzero(order_cur)
+    end_row = int(last[-1]) + start_row if len(last) else start_row - 1
+    in_range = np.arange(n) < (end_row - start_row + 1)
+
+    plan = RowPlan(start_row, n, end_row)
+    templates = formula_templates(cols, main_sheet_name, table=mode == MODE_TABLE)
+    masks = {
+        "rakhash": rakhash_mask,
+        "clean": clean_mask,
+        "order": order_mask,
+        "qty_check": in_range & order_cur,
+        "approval": in_range,
+        "total_pay": in_range,
+        "diff": in_range,
+    }
+    for role, template in templates.items():
+        plan.add(role, cols[role], masks[role], template=template)
+    return plan
@@ -0,0 +1,215 @@
+from __future__ import annotations
+import os
+from functools import lru_cache
+from io import BytesIO
+
+import numpy as np
+
+from pipeline.cache import DiskCache, cache_key, code_fingerprint, digest
+from pipeline.constants import COL_ORDER_CHECK, REQUIRED_INTERNAL_SHEET, TARGET_SHEETS, MODE_FORMULAS, MODE_VALUES, MODE_TABLE
+from pipeline.inject import find_sheet_name, write_sheet
+from pipeline.internal_sheet import INTERNAL_TABLE_NAME, define_lookup_names, read_internal
+from pipeline.order_keys import (cross_sheet_findings, load_month, period_of, previous_month_tag, previous_period,
+                                 save_month, series_of)
+from pipeline.parallel import plan_sheets
+from pipeline.profiling import NULL_PROFILER
+from pipeline.reconcile import build_supplied_index
+from pipeline.sidecar import read_internal_cached
+from pipeline.validation import highlight_ranges
+from pipeline.streaming import open_source, new_output, create_sheet, copy_sheet, copy_dataframe_to_sheet
+
+
+def _source_of(file):
+    """Path or bytes of an upload, so worker processes can re-open it."""
+    if isinstance(file, (str, bytes, os.PathLike)):
+        return file
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    file.seek(0)
+    return file.read()
+
+
+def _read_bytes(file) -> bytes:
+    source = _source_of(file)
+    if isinstance(source, bytes):
+        return source
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def _no_progress(step, sheet=None, done=None, total=None):
+    pass
+
+
+def _history_key(activity_name, target_sheet, internal_digest, mode):
+    # the same file name re-uploaded against the same master file and code
+    return cache_key("rows", activity_name, target_sheet, internal_digest, mode, _code_fingerprint())
+
+
+def process_files(activity_file, internal_file, *, mode=MODE_FORMULAS, lookup_only=False, workers=None,
+                  use_sidecar=True, activity_name=None, cache: DiskCache | None = None,
+                  profiler=NULL_PROFILER, progress=None):
+    """
+    Full pipeline: copy the internal sheet into the activity workbook and inject
+    the target sheets.
+
+    activity_file / internal_file: paths, bytes or binary file objects (.xlsx)
+    workers: processes for planning the target sheets (see parallel.plan_sheets)
+    use_sidecar: serve the internal sheet and its lookup from the ingested
+                 master-file sidecar (see sidecar.read_internal_cached)
+    activity_name: name of the uploaded activity file; when given, per-row
+                   input fingerprints are kept under it (in `cache`), and the
+                   next run of that name reports what changed ("diff" in each
+                   sheet report) and recomputes only changed rows (values mode); when the
+                   name carries a month ("יולי 2025"), the month's order keys are
+                   stored under the rest of the name (the report series) and rows
+                   already in that series' previous month are marked in
+                   "כפילויות חודש קודם" (see order_keys)
+    profiler: pipeline.profiling.Profiler timing each stage (rows/sec, memory)
+    progress: called as progress(step, sheet=None, done=None, total=None) when a
+              step starts, as each target sheet is planned, and per block of
+              rows written (see jobs.JobProgress)
+    Returns {"ok", "output" (xlsx bytes), "sheets" (per-sheet reports in
+    TARGET_SHEETS order), "missing_sheets", "period" (month of the activity
+    file or None), "previous_period" (the stored month it was checked against,
+    or None)} or {"ok": False, "error": ...}.
+    """
+    progress = progress or _no_progress
+
+    # 1) Read the internal sheet (once, fast engine) – or map its sidecar when this file was seen before
+    progress("read_internal")
+    with profiler.stage("read_internal") as stage:
+        internal = _read_bytes(internal_file)
+        if use_sidecar:
+            internal_sheet_name, df_internal, supplied_index = read_internal_cached(internal, lookup_only=lookup_only)
+        else:
+            internal_sheet_name, df_internal = read_internal(BytesIO(internal), lookup_only=lookup_only)
+            supplied_index = build_supplied_index(df_internal) if internal_sheet_name and mode == MODE_VALUES else None
+        stage["rows"] = None if df_internal is None else len(df_internal)
+    if not internal_sheet_name:
+        return {"ok": False, "error": "missing_internal_sheet"}
+    if mode != MODE_VALUES:
+        supplied_index = None
+
+    # 2) Stream the activity workbook (read-only) into a write-only output, row by row
+    progress("open_activity")
+    with profiler.stage("open_activity"):
+        source = _source_of(activity_file)
+        src_wb = open_source(BytesIO(source) if isinstance(source, bytes) else source)
+        out_wb = new_output()
+
+    targets = {}
+    missing_sheets = []
+    for target_sheet in TARGET_SHEETS:
+        main_sheet_name = find_sheet_name(src_wb.sheetnames, target_sheet)
+        if not main_sheet_name:
+            missing_sheets.append(target_sheet)
+            continue
+        targets[main_sheet_name] = target_sheet
+
+    # 3) Plan each target sheet with the exact same injections (concurrently on large files),
+    #    against the previous run of this file when there is one
+    history_keys, previous = {}, {}
+    period = period_of(activity_name) if activity_name else None
+    series = series_of(activity_name) if period else None
+    previous_month = load_month(series, previous_period(period)) if period else None
+    if activity_name:
+        cache = cache or DiskCache()
+        internal_digest = digest(internal)
+        for sheet_name, target_sheet in targets.items():
+            history_keys[sheet_name] = _history_key(activity_name, target_sheet, internal_digest, mode)
+            state = cache.get_object(history_keys[sheet_name])
+            if state is not None:
+                previous[sheet_name] = state
+    progress("plan")
+    with profiler.stage("plan") as stage:
+        plans = plan_sheets(source, src_wb, list(targets), mode=mode, supplied_index=supplied_index,
+                            workers=workers, previous=previous, previous_month=previous_month, profiler=profiler,
+                            progress=lambda name, plan: progress("plan", name, plan.n_rows, plan.n_rows))
+        stage["rows"] = sum(plan.n_rows for _, plan, _ in plans.values())
+    for sheet_name, key in history_keys.items():
+        cache.put_object(key, plans[sheet_name][1].state)
+    if period and plans:
+        save_month(series, period, activity_name, np.concatenate([plan.order_keys for _, plan, _ in plans.values()]))
+
+    # Order keys repeated across the target sheets (each sheet only sees its own)
+    shared = cross_sheet_findings({name: (plan.order_keys, plan.order_rows) for name, (_, plan, _) in plans.items()})
+    for sheet_name, findings in shared.items():
+        if findings:
+            _, plan, report = plans[sheet_name]
+            report["duplicates"] += findings
+            report["highlights"] = highlight_ranges(findings, {COL_ORDER_CHECK: plan.order_column},
+                                                    base=report["highlights"])
+
+    # 4) Assemble in sheet order; other sheets are copied as-is
+    reports = {}
+    for sheet_name in src_wb.sheetnames:
+        if sheet_name == REQUIRED_INTERNAL_SHEET:
+            continue  # overwritten by the fresh copy below
+        if sheet_name in targets:
+            header, plan, report = plans[sheet_name]
+            reports[targets[sheet_name]] = report
+            with profiler.stage(f"write[{sheet_name}]", rows=plan.n_rows):
+                write_sheet(src_wb[sheet_name], create_sheet(out_wb, sheet_name, rtl=True), header, plan,
+                            report["highlights"],
+                            progress=lambda done, name=sheet_name, n=plan.n_rows: progress("write", name, done, n))
+        else:
+            with profiler.stage("copy_sheets"):
+                copy_sheet(src_wb[sheet_name], create_sheet(out_wb, sheet_name))
+
+    # 5) Copy internal sheet as a new (last) sheet in the same workbook
+    #    (MODE_TABLE: as an Excel Table, with the bounded lookup ranges named)
+    progress("copy_internal")
+    with profiler.stage("copy_internal", rows=len(df_internal)):
+        table = INTERNAL_TABLE_NAME if mode == MODE_TABLE else None
+        copy_dataframe_to_sheet(df_internal, out_wb, REQUIRED_INTERNAL_SHEET, table=table)
+        if table:
+            define_lookup_names(out_wb, df_internal)
+
+    # 6) Save
+    progress("save")
+    with profiler.stage("save"):
+        out = BytesIO()
+        out_wb.save(out)
+        src_wb.close()
+
+    sheets = [{"sheet": t, **reports[t]} for t in TARGET_SHEETS if t in reports]
+    return {"ok": True, "output": out.getvalue(), "sheets": sheets, "missing_sheets": missing_sheets,
+            "period": period, "previous_period": previous_month.period if previous_month else None}
+
+
+_code_fingerprint = lru_cache(maxsize=1)(code_fingerprint)
+
+
+def result_key(activity_bytes: bytes, internal_bytes: bytes, mode=MODE_FORMULAS, lookup_only=False,
+               activity_name=None) -> str:
+    """
+    Cache key of a run: SHA-256 of both uploads plus the code/rules fingerprint
+    and the options, the report series and month named by the activity file
+    (its keys are stored under them), and the stored previous month it is
+    checked against (the duplicate column depends on it).
+    """
+    period = period_of(activity_name) if activity_name else None
+    month = f"{series_of(activity_name)}:{period}" if period else ""
+    return cache_key(digest(activity_bytes), digest(internal_bytes), _code_fingerprint(), mode, lookup_only,
+                     month, previous_month_tag(activity_name))
+
+
+def process_files_cached(activity_bytes: bytes, internal_bytes: bytes, *, mode=MODE_FORMULAS,
+                         lookup_only=False, workers=None, cache: DiskCache | None = None,
+                         activity_name=None, profiler=NULL_PROFILER, progress=None):
+    """
+    process_files() behind a content-addressed cache (see result_key).
+    Adds "cached" to the result.
+    """
+    cache = cache or DiskCache()
+    key = result_key(activity_bytes, internal_bytes, mode, lookup_only, activity_name)
+    with profiler.stage("result_cache"):
+        result = cache.get_object(key)
+    if result is not None:
+        return {**result, "cached": True}
+    result = process_files(activity_bytes, internal_bytes, mode=mode, lookup_only=lookup_only, workers=workers,
+                           activity_name=activity_name, cache=cache, profiler=profiler, progress=progress)
+    if result["ok"]:
+        cache.put_object(key, result)
+    return {**result, "cached": False}
@@ -0,0 +1,169 @@
+from __future__ import annotations
+import datetime as dt
+import os
+import pickle
+from functools import lru_cache, partial
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from pipeline.cache import CACHE_DIR, DiskCache, cache_key, code_fingerprint, digest
+from pipeline.internal_sheet import read_internal
+from pipeline.reconcile import build_supplied_index
+
+# Sidecar for the "הובלות אלכל כללי" master file, which changes rarely. Each
+# distinct upload (by SHA-256) is ingested once into an uncompressed Arrow IPC
+# file plus a second one holding the prebuilt order key → "סופק" index; later
+# runs memory-map both instead of parsing the .xlsx and rebuilding the lookup.
+#
+# Values must come back exactly as parsed (a number stays a number next to text
+# in the same column), so object columns Arrow cannot type as a whole are stored
+# as a struct tagging each cell with its kind.
+
+SIDECAR_DIR = os.path.join(CACHE_DIR, "internal")
+SIDECAR_MAX_MB = int(os.getenv("MACHLAB_SIDECAR_MAX_MB", "1024"))
+SIDECAR_MAX_DAYS = float(os.getenv("MACHLAB_SIDECAR_MAX_DAYS", "30"))
+
+_HERE = Path(__file__).resolve().parent
+# what decides the ingested frame and index
+SIDECAR_FILES = [_HERE / "internal_sheet.py", _HERE / "reconcile.py", _HERE / "sidecar.py"]
+_fingerprint = lru_cache(maxsize=1)(partial(code_fingerprint, SIDECAR_FILES))
+
+DATA_SUFFIX = ".arrow"
+INDEX_SUFFIX = ".index.arrow"
+
+_NONE, _BOOL, _INT, _FLOAT, _TEXT, _TIME, _OTHER = range(7)
+_CELL = pa.struct([
+    ("kind", pa.int8()), ("i", pa.int64()), ("f", pa.float64()),
+    ("s", pa.string()), ("t", pa.timestamp("us")), ("o", pa.binary()),
+])
+
+
+def sidecar_cache() -> DiskCache:
+    return DiskCache(SIDECAR_DIR, max_bytes=SIDECAR_MAX_MB * 1024 * 1024,
+                     max_age=SIDECAR_MAX_DAYS * 24 * 3600)
+
+
+# ----- cell encoding -----
+
+def _kind(v) -> int:
+    if v is None or (isinstance(v, float) and np.isnan(v)) or v is pd.NaT:
+        return _NONE
+    if isinstance(v, (bool, np.bool_)):
+        return _BOOL
+    if isinstance(v, (int, np.integer)):
+        return _INT
+    if isinstance(v, (float, np.floating)):
+        return _FLOAT
+    if isinstance(v, str):
+        return _TEXT
+    if isinstance(v, dt.datetime):
+        return _TIME
+    return _OTHER
+
+
+def _encode_cells(values: np.ndarray) -> pa.StructArray:
+    kinds = np.fromiter((_kind(v) for v in values), dtype=np.int8, count=len(values))
+    pick = lambda wanted, convert: [convert(v) if k in wanted else None for k, v in zip(kinds, values)]
+    return pa.StructArray.from_arrays([
+        pa.array(kinds, pa.int8()),
+        pa.array(pick((_INT, _BOOL), int), pa.int64()),
+        pa.array(pick((_FLOAT,), float), pa.float64()),
+        pa.array(pick((_TEXT,), str), pa.string()),
+        pa.array(pick((_TIME,), pd.Timestamp), pa.timestamp("us")),
+        pa.array(pick((_OTHER,), pickle.dumps), pa.binary()),
+    ], fields=list(_CELL))
+
+
+def _decode_cells(arr: pa.StructArray) -> np.ndarray:
+    kinds = arr.field("kind").to_numpy()
+    out = np.full(len(arr), np.nan, dtype=object)  # blanks as read_excel leaves them
+    if (m := kinds == _BOOL).any():
+        out[m] = arr.field("i").to_numpy(zero_copy_only=False)[m].astype(bool).astype(object)
+    if (m := kinds == _INT).any():
+        out[m] = arr.field("i").to_numpy(zero_copy_only=False)[m].astype(np.int64).astype(object)
+    if (m := kinds == _FLOAT).any():
+        out[m] = arr.field("f").to_numpy(zero_copy_only=False)[m].astype(object)
+    if (m := kinds == _TEXT).any():
+        out[m] = arr.field("s").to_numpy(zero_copy_only=False)[m]
+    if (m := kinds == _TIME).any():
+        out[m] = list(pd.DatetimeIndex(arr.field("t").to_numpy(zero_copy_only=False)[m]))
+    if (m := kinds == _OTHER).any():
+        out[m] = [pickle.loads(b) for b in arr.field("o").to_numpy(zero_copy_only=False)[m]]
+    return out
+
+
+def _encode_column(s: pd.Series) -> pa.Array:
+    if s.dtype != object:
+        return pa.array(s, from_pandas=True)
+    kinds = {_kind(v) for v in s}
+    # all text (or blank): a plain string column round-trips exactly
+    if kinds <= {_NONE, _TEXT}:
+        return pa.array(s, type=pa.string(), from_pandas=True)
+    return _encode_cells(s.to_numpy())
+
+
+def _decode_column(arr) -> pd.Series | np.ndarray:
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    if pa.types.is_struct(arr.type) and arr.type == _CELL:
+        return _decode_cells(arr)
+    if pa.types.is_string(arr.type) or pa.types.is_large_string(arr.type):
+        values = arr.to_numpy(zero_copy_only=False).astype(object)
+        values[arr.is_null().to_numpy(zero_copy_only=False)] = np.nan
+        return values
+    return arr.to_pandas()
+
+
+def frame_to_arrow(df: pd.DataFrame, metadata: dict | None = None) -> bytes:
+    names = [str(c) for c in df.columns]
+    table = pa.Table.from_arrays([_encode_column(df.iloc[:, i]) for i in range(df.shape[1])], names=names)
+    if metadata:
+        table = table.replace_schema_metadata({k: str(v) for k, v in metadata.items()})
+    sink = BytesIO()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def arrow_to_frame(path: Path):
+    """(DataFrame, schema metadata) of a sidecar file, memory-mapped."""
+    table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    df = pd.DataFrame({name: _decode_column(table.column(i)) for i, name in enumerate(table.column_names)})
+    metadata = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+    return df, metadata
+
+
+# ----- ingest -----
+
+def _index_frame(supplied: pd.Series) -> pd.DataFrame:
+    return pd.DataFrame({"key": supplied.index.to_numpy(dtype=object),
+                         "value": supplied.to_numpy(dtype=object)})
+
+
+def read_internal_cached(internal_bytes: bytes, *, lookup_only: bool = False, cache: DiskCache | None = None):
+    """
+    read_internal() + build_supplied_index() for an uploaded master file, served
+    from its sidecar when this exact file was ingested before.
+    Returns (sheet_name, df, supplied_index), or (None, None, None) without the sheet.
+    """
+    cache = cache or sidecar_cache()
+    key = cache_key(digest(internal_bytes), lookup_only, _fingerprint())
+    data_path = cache.locate(key, DATA_SUFFIX)
+    index_path = cache.locate(key, INDEX_SUFFIX)
+    if data_path is not None and index_path is not None:
+        df, metadata = arrow_to_frame(data_path)
+        index, _ = arrow_to_frame(index_path)
+        supplied = pd.Series(index["value"].to_numpy(dtype=object), index=index["key"].to_numpy(dtype=object))
+        return metadata["sheet_name"], df, supplied
+
+    sheet_name, df = read_internal(BytesIO(internal_bytes), lookup_only=lookup_only)
+    if not sheet_name:
+        return None, None, None
+    supplied = build_supplied_index(df)
+    cache.put(key, frame_to_arrow(_index_frame(supplied)), INDEX_SUFFIX)
+    cache.put(key, frame_to_arrow(df, {"sheet_name": sheet_name}), DATA_SUFFIX)
+    return sheet_name, df, supplied
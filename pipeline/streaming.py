@@ -0,0 +1,209 @@
+from __future__ import annotations
+import warnings
+from xml.etree.ElementTree import iterparse
+
+import pandas as pd
+from openpyxl import load_workbook, Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.read_only import ReadOnlyCell
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet._reader import WorkSheetParser
+from openpyxl.worksheet.cell_range import MultiCellRange
+from openpyxl.worksheet.dimensions import ColumnDimension
+from openpyxl.xml.constants import SHEET_MAIN_NS
+from openpyxl.worksheet.filters import AutoFilter
+from openpyxl.worksheet.table import Table, TableColumn, TableStyleInfo
+
+# Streaming I/O: the activity workbook is read with read_only=True and the result
+# is written with a write_only workbook, one row at a time, so memory stays flat
+# instead of growing with the size of the workbook. Of each source sheet's layout,
+# the column widths, frozen panes and view direction are carried over (they are
+# read from the head of the sheet's XML, ahead of its rows), and in the same pass
+# as the rows their cell formats (number format, font, fill, border, alignment),
+# then the merged cells, data validations and conditional formats that follow
+# them in the XML. Row heights, comments, hyperlinks and images are not.
+
+
+def open_source(file, data_only=False):
+    """
+    Open an .xlsx for row streaming: formulas kept as text, or with data_only
+    the values Excel cached for them (None where the file was never calculated).
+    """
+    return load_workbook(file, read_only=True, keep_links=False, data_only=data_only)
+
+
+def new_output():
+    return Workbook(write_only=True)
+
+
+def create_sheet(wb: Workbook, sheet_name: str, rtl: bool = False):
+    ws = wb.create_sheet(sheet_name)
+    if rtl:
+        # RTL view only (do not reverse column order)
+        try:
+            ws.sheet_view.rightToLeft = True
+        except Exception:
+            pass
+    return ws
+
+
+def _tag(name):
+    return f"{{{SHEET_MAIN_NS}}}{name}"
+
+
+def sheet_layout(ws) -> dict:
+    """
+    Layout of a read-only sheet: {"columns": [(min, max, width, hidden)],
+    "freeze": top-left cell of the frozen panes or None, "rtl": bool}.
+    Only the XML ahead of <sheetData> is parsed.
+    """
+    layout = {"columns": [], "freeze": None, "rtl": False}
+    if not hasattr(ws, "_get_source"):
+        return layout
+    with ws._get_source() as src:
+        for _, el in iterparse(src, events=("start",)):
+            if el.tag == _tag("sheetData"):
+                break
+            if el.tag == _tag("sheetView"):
+                layout["rtl"] = el.get("rightToLeft") in ("1", "true")
+            elif el.tag == _tag("pane") and el.get("state") in ("frozen", "frozenSplit"):
+                x, y = int(float(el.get("xSplit", 0))), int(float(el.get("ySplit", 0)))
+                layout["freeze"] = el.get("topLeftCell") or f"{get_column_letter(x + 1)}{y + 1}"
+            elif el.tag == _tag("col") and el.get("width"):
+                layout["columns"].append((int(el.get("min")), int(el.get("max")), float(el.get("width")),
+                                          el.get("hidden") in ("1", "true")))
+    return layout
+
+
+def copy_layout(src_ws, out_ws):
+    """sheet_layout() of src_ws onto a write-only sheet (before its first row)."""
+    layout = sheet_layout(src_ws)
+    for first, last, width, hidden in layout["columns"]:
+        letter = get_column_letter(first)
+        dim = ColumnDimension(out_ws, index=letter, width=width, hidden=hidden)
+        dim.min, dim.max = first, last
+        out_ws.column_dimensions[letter] = dim
+    if layout["freeze"]:
+        out_ws.freeze_panes = layout["freeze"]
+    if layout["rtl"]:
+        out_ws.sheet_view.rightToLeft = True
+
+
+def sheet_width(ws, header) -> int:
+    """Column count to pad rows to; read-only sheets may not know their dimension."""
+    return max(ws.max_column or 0, len(header))
+
+
+def read_header(ws) -> list:
+    return list(next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ()))
+
+
+class StyledRows:
+    """
+    One pass over a read-only sheet for copying it into a write-only one:
+    iterating yields (row_number, values, style_ids) for every row from 1, each
+    padded to `width` cells; cells() turns a row of values back into cells with
+    the source formats, and copy_tail() (once the rows are done) adds the merged
+    cells, data validations and conditional formats read after them.
+    """
+
+    def __init__(self, src_ws, out_ws, width: int = 0):
+        self.src_ws, self.out_ws, self.width = src_ws, out_ws, width
+        self.parser = None
+        self._styles = {}  # source style id → style array in the output workbook
+
+    def __iter__(self):
+        wb = self.src_ws.parent
+        with self.src_ws._get_source() as src:
+            self.parser = WorkSheetParser(src, self.src_ws._shared_strings, data_only=wb.data_only,
+                                          epoch=wb.epoch, date_formats=wb._date_formats,
+                                          timedelta_formats=wb._timedelta_formats)
+            expected = 1
+            for r, cells in self.parser.parse():
+                for missing in range(expected, r):  # rows absent from the XML
+                    yield missing, [None] * self.width, [0] * self.width
+                expected = r + 1
+                n = max(self.width, cells[-1]["column"] if cells else 0)
+                values, style_ids = [None] * n, [0] * n
+                for cell in cells:
+                    values[cell["column"] - 1] = cell["value"]
+                    style_ids[cell["column"] - 1] = cell["style_id"]
+                yield r, values, style_ids
+
+    def _style(self, style_id):
+        style = self._styles.get(style_id)
+        if style is None:
+            src, cell = ReadOnlyCell(self.src_ws, 1, 1, None, style_id=style_id), WriteOnlyCell(self.out_ws)
+            cell.font, cell.fill, cell.border = src.font, src.fill, src.border
+            cell.alignment, cell.protection, cell.number_format = src.alignment, src.protection, src.number_format
+            style = self._styles[style_id] = cell._style
+        return style
+
+    def cells(self, values, style_ids) -> list:
+        """values as a row to append: formatted cells where the source cell had a format."""
+        row = list(values)
+        for i, style_id in enumerate(style_ids):
+            if style_id and i < len(row):
+                cell = WriteOnlyCell(self.out_ws, row[i])
+                cell._style = self._style(style_id)
+                row[i] = cell
+        return row
+
+    def copy_tail(self):
+        parser = self.parser
+        if parser.merged_cells:
+            self.out_ws.merged_cells = MultiCellRange([cell.ref for cell in parser.merged_cells.mergeCell])
+        validations = getattr(parser, "data_validations", None)
+        if validations:
+            self.out_ws.data_validations = validations
+        differential = self.src_ws.parent._differential_styles
+        for cf in parser.formatting:
+            for rule in cf.rules:
+                if rule.dxfId is not None:  # an index into the source workbook's styles
+                    rule.dxf, rule.dxfId = differential[rule.dxfId], None
+                self.out_ws.conditional_formatting[cf] = rule
+
+
+def copy_sheet(src_ws, out_ws):
+    """Copy a sheet's values (and formulas) untouched, with its layout and formats."""
+    copy_layout(src_ws, out_ws)
+    rows = StyledRows(src_ws, out_ws)
+    for _, values, style_ids in rows:
+        out_ws.append(rows.cells(values, style_ids))
+    rows.copy_tail()
+
+
+def table_headers(columns) -> list:
+    """Header texts usable as Excel Table column names: non-empty, unique ignoring case."""
+    headers, seen = [], set()
+    for i, col in enumerate(columns, start=1):
+        name = str(col).strip() or f"Column{i}"
+        base, n = name, 2
+        while name.casefold() in seen:
+            name, n = f"{base} ({n})", n + 1
+        seen.add(name.casefold())
+        headers.append(name)
+    return headers
+
+
+def copy_dataframe_to_sheet(df: pd.DataFrame, wb: Workbook, sheet_name: str, table: str | None = None):
+    """table: also make the copy an Excel Table of this name (header texts adjusted to be valid)."""
+    ws = create_sheet(wb, sheet_name, rtl=True)
+    # headers
+    headers = table_headers(df.columns) if table else [str(col) for col in df.columns]
+    ws.append(headers)
+    if table and len(headers):
+        # write-only sheets cannot read the header row back: columns are given explicitly
+        ref = f"A1:{get_column_letter(len(headers))}{max(len(df), 1) + 1}"
+        with warnings.catch_warnings():  # the "add table columns manually" notice: they are
+            warnings.simplefilter("ignore", UserWarning)
+            ws.add_table(Table(
+                displayName=table, ref=ref, autoFilter=AutoFilter(ref=ref),
+                tableColumns=[TableColumn(id=i, name=h) for i, h in enumerate(headers, start=1)],
+                tableStyleInfo=TableStyleInfo(name="TableStyleLight9", showRowStripes=True),
+            ))
+    # rows – one vectorized NaN/NaT → blank pass, then whole rows through ws.append
+    values = df.astype(object).where(df.notna(), None)
+    for row in values.itertuples(index=False, name=None):
+        ws.append(row)
+    return ws
@@ -0,0 +1,85 @@
+from __future__ import annotations
+from importlib.resources import files
+
+import numpy as np
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import PatternFill
+from openpyxl.utils import get_column_letter, range_boundaries
+
+from validators.compiler import load_rules
+from validators.rules_engine import validate_workbook
+
+# rules.yaml checks on the target sheets, run on the rows the row plan has
+# already read (no second parse of the upload). Failed cells are marked in the
+# output with one conditional-format range per level, not per-cell styles.
+
+RULES_PATH = files("pipeline") / "rules" / "rules.yaml"  # package data
+
+LEVELS = ("error", "warning")  # errors first: they win where both apply
+HIGHLIGHT_FILLS = {"error": "FFC7CE", "warning": "FFEB9C"}  # Excel's light red / light yellow
+
+
+def sheet_rules(sheet_name: str, rules_path=RULES_PATH):
+    """rules.yaml spec of a sheet (names compared without outer spaces), or None."""
+    for spec in load_rules(rules_path).sheets:
+        if spec.name.strip() == sheet_name.strip():
+            return spec
+    return None
+
+
+def validate_frame(frame, spec, rules_path=RULES_PATH, profiler=None) -> list[dict]:
+    """Findings of `spec` on a frame of the sheet's data rows (from row 2 on)."""
+    result = validate_workbook({spec.name: frame}, str(rules_path), sheets=[spec.name], profiler=profiler)
+    return result["results"][0]["problems"]
+
+
+def _runs(rows: np.ndarray):
+    # sorted unique row numbers → (first, last) of each consecutive run
+    if not len(rows):
+        return []
+    breaks = np.flatnonzero(np.diff(rows) != 1)
+    starts = np.concatenate(([rows[0]], rows[breaks + 1]))
+    ends = np.concatenate((rows[breaks], [rows[-1]]))
+    return zip(starts.tolist(), ends.tolist())
+
+
+def highlight_ranges(problems, columns: dict, base: dict | None = None) -> dict:
+    """
+    level → sqref ("F5:F9 H12 ...") of the cells the findings point at.
+
+    columns: column name → 1-based column in the output sheet
+    base: highlights (as returned here) the findings' cells are added to
+    """
+    cells = {}  # level → column → [row arrays]
+    for level, sqref in (base or {}).items():
+        for part in sqref.split():
+            min_col, min_row, max_col, max_row = range_boundaries(part)
+            for col in range(min_col, max_col + 1):
+                cells.setdefault(level, {}).setdefault(col, []).append(np.arange(min_row, max_row + 1))
+    for p in problems:
+        if p.get("level") not in HIGHLIGHT_FILLS or "row_index" not in p:
+            continue
+        for name in p.get("columns", ()):
+            col = columns.get(name)
+            if col is not None:
+                cells.setdefault(p["level"], {}).setdefault(col, []).append(p["row_index"])
+
+    highlights = {}
+    for level, by_col in cells.items():
+        parts = []
+        for col, arrays in sorted(by_col.items()):
+            letter = get_column_letter(col)
+            for first, last in _runs(np.unique(np.concatenate(arrays))):
+                parts.append(f"{letter}{first}" if first == last else f"{letter}{first}:{letter}{last}")
+        highlights[level] = " ".join(parts)
+    return highlights
+
+
+def add_highlights(ws, highlights: dict):
+    """One always-true conditional format per level over the failed cells."""
+    for level in LEVELS:
+        sqref = highlights.get(level)
+        if sqref:
+            color = HIGHLIGHT_FILLS[level]
+            fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+            ws.conditional_formatting.add(sqref, FormulaRule(formula=["TRUE"], fill=fill))
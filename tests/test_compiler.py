@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from validators.compiler import compile_expr, parse_type
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        "Quantity": [-1, 0, 5, 150, 50, 3],
+        "UnitCost": [1.0, 0.0, 2.5, np.nan, 3.0, -2.0],
+        "Q": [-1, 0, 99, 100, 50, 7],
+        "Supplier Name": ["a", "b", "", "d", "e", "f"],
+    })
+
+
+@pytest.mark.parametrize("expr", [
+    "Quantity >= 0 & UnitCost > 0",
+    "Q >= 0 & Q < 100",
+    "Q < 10 | Q > 90 & Q != 100",
+    "~(Q > 5) & Q < 50",
+    "(Q > 5) & (Q < 60)",
+    "0 <= Q < 100",
+    "Q * 2 > 10 | UnitCost == 0",
+    "not Q > 5 or Q == 50",
+    "Quantity > 0 and UnitCost > 0 or Q == 0",
+    "Quantity - Q <= 1 | Q % 2 == 1",
+    "`Supplier Name` != ''",
+])
+def test_matches_df_eval(df, expr):
+    fn, _ = compile_expr(expr)
+    np.testing.assert_array_equal(fn(df), df.eval(expr).to_numpy(dtype=bool))
+
+
+def test_reads_only_referenced_columns():
+    _, columns = compile_expr("Quantity >= 0 & `Supplier Name` != ''")
+    assert columns == ("Quantity", "Supplier Name")
+
+
+@pytest.mark.parametrize("expr", ["__import__('os')", "Q.values > 0", "[Q][0] > 0", "np.load('x') > 0"])
+def test_rejects_outside_the_subset(expr):
+    with pytest.raises((ValueError, SyntaxError)):
+        compile_expr(expr)
+
+
+def test_parse_type():
+    assert parse_type("int>=0") == ("int", (">=", 0.0), None)
+    assert parse_type("float<=1e8") == ("float", ("<=", 1e8), None)
+    assert parse_type("date:%d/%m/%Y") == ("date", None, "%d/%m/%Y")
@@ -0,0 +1,53 @@
+from pipeline.constants import (COL_MAKAT, COL_PRICE_AFTER, COL_PURCHASE_SRC, COL_QTY, COL_TOTAL, COLUMN_ALIASES,
+                                FUZZY_SOURCE_COLUMNS)
+from pipeline.headers import HeaderIndex, normalize_header
+
+
+def test_normalize_header():
+    assert normalize_header("‏  מק׳ט\xa0 ") == "מק'ט"
+    assert normalize_header('סה״כ') == 'סה"כ'
+    assert normalize_header(None) == ""
+
+
+def test_exact_match_after_normalization_first_occurrence_wins():
+    index = HeaderIndex(["תאריך", " הז. רכש (לקוח)‏", "הז. רכש (לקוח)"], aliases=COLUMN_ALIASES)
+    assert index.find(COL_PURCHASE_SRC) == 2
+    assert index.renamed == {}
+
+
+def test_alias_match_is_reported_as_renamed():
+    index = HeaderIndex(["תאריך", "הזמנת רכש", "קוד פריט", "כמות בפועל"], aliases=COLUMN_ALIASES)
+    assert [index.find(n) for n in (COL_PURCHASE_SRC, COL_MAKAT, COL_QTY)] == [2, 3, 4]
+    assert index.renamed == {COL_PURCHASE_SRC: "הזמנת רכש", COL_MAKAT: "קוד פריט", COL_QTY: "כמות בפועל"}
+
+
+def test_fuzzy_match_only_when_asked_and_only_unclaimed_headers():
+    index = HeaderIndex(["מחירון מחלב לאחר בדיקה.", "הערות לקוח", "סה\"כ לחיובב"])
+    assert index.find("מחירון מחלב לאחר בדיקה") is None
+    assert index.find("מחירון מחלב לאחר בדיקה", fuzzy=True) == 1
+    assert index.renamed == {"מחירון מחלב לאחר בדיקה": "מחירון מחלב לאחר בדיקה."}
+    # "הערות לקוח" is taken: the fuzzy pass only looks at headers nothing resolved to
+    assert index.find("הערות לקוח") == 2
+    assert index.find("הערות לקוחה", fuzzy=True) is None
+    assert index.find('סה"כ לחיוב', fuzzy=True) == 3
+    assert HeaderIndex(["תאריך"]).find(COL_TOTAL, fuzzy=True) is None
+
+
+def test_fuzzy_match_rejects_headers_one_word_apart():
+    before = "מחירון מחלב לפני בדיקה"
+    assert HeaderIndex([before]).find(COL_PRICE_AFTER, fuzzy=True) is None
+    assert HeaderIndex(["מחירון מחלב בדיקה"]).find(COL_PRICE_AFTER, fuzzy=True) is None
+    assert HeaderIndex(["מחירון מחלב לאחרר בדיקה"]).find(COL_PRICE_AFTER, fuzzy=True) == 1  # a typo
+
+    # the after-check price is appended next to the before-check one, never resolved to it
+    index = HeaderIndex(["תאריך", before, "כמות"], aliases=COLUMN_ALIASES)
+    assert index.ensure(COL_PRICE_AFTER, fuzzy=COL_PRICE_AFTER in FUZZY_SOURCE_COLUMNS) == (4, True)
+    assert HeaderIndex(["מחירון מחלב אחרי בדיקה"], aliases=COLUMN_ALIASES).find(COL_PRICE_AFTER) == 1
+
+
+def test_ensure_appends_missing_columns_once():
+    index = HeaderIndex(["תאריך", None, "כמות"])
+    assert index.ensure("כמות") == (3, False)
+    assert index.ensure("הערות") == (4, True)
+    assert index.ensure("הערות") == (4, False)
+    assert index.header == ["תאריך", None, "כמות", "הערות"]
@@ -0,0 +1,18 @@
+import os
+
+from pipeline import jobs
+from pipeline.jobs import JobStore
+
+
+def test_jobs_of_an_earlier_process_are_not_active(tmp_path):
+    store = JobStore(tmp_path / "jobs" / "jobs.sqlite3")
+    orphan = store.create("key", status=jobs.RUNNING)
+    store.update(orphan.id, owner_pid=os.getpid() + 1)  # as left by a server that restarted
+    assert store.active("key") is None
+
+    store.interrupt_stale(os.getpid())
+    assert store.get(orphan.id).status == jobs.FAILED
+    assert store.get(orphan.id).error == jobs.INTERRUPTED
+
+    job = store.create("key")
+    assert store.active("key") == job
@@ -0,0 +1,56 @@
+import numpy as np
+
+from pipeline.cache import DiskCache
+from pipeline.order_keys import cross_sheet_findings, load_month, period_of, save_month, series_of
+from pipeline.validation import highlight_ranges
+
+
+def test_series_and_month_of_file_names():
+    assert period_of("פעילות אלכל יולי 2025.xlsx") == "2025-07"
+    assert series_of("/in/פעילות אלכל יולי 2025.xlsx") == series_of("פעילות אלכל אוגוסט 2025.xlsx") == "פעילות אלכל"
+    assert series_of("Activity_07-2025.xlsx") == series_of("activity 2025-08.xlsx") == "activity"
+    assert series_of("לקוח ב יולי 2025.xlsx") != series_of("פעילות אלכל יולי 2025.xlsx")
+
+
+def test_month_names_inside_other_words_are_not_months():
+    assert period_of("פעילות אלכל לקוח מאיר יולי 2025.xlsx") == "2025-07"
+    assert series_of("פעילות אלכל לקוח מאיר יולי 2025.xlsx") == "פעילות אלכל לקוח מאיר"
+    assert period_of("מרסל אפריליה 2025.xlsx") is None
+    assert period_of("סיכום_מאי_2025.xlsx") == "2025-05"
+    assert period_of("ומרץ 2025") is None
+
+
+def test_months_are_kept_per_series_and_file(tmp_path):
+    store = DiskCache(tmp_path / "order_keys")
+    save_month("a", "2025-07", "a/part 1.xlsx", np.array([3, 1], dtype=np.uint64), store)
+    save_month("a", "2025-07", "a/part 2.xlsx", np.array([5, 3], dtype=np.uint64), store)
+    save_month("b", "2025-07", "b/part 1.xlsx", np.array([9], dtype=np.uint64), store)
+    assert load_month("a", "2025-07", store).index.sorted.tolist() == [1, 3, 3, 5]
+    assert load_month("b", "2025-07", store).index.sorted.tolist() == [9]
+    assert load_month("a", "2025-06", store) is None
+
+    # a corrected re-run of a file replaces its own keys only
+    save_month("a", "2025-07", "a/part 1.xlsx", np.array([2], dtype=np.uint64), store)
+    assert load_month("a", "2025-07", store).index.sorted.tolist() == [2, 3, 5]
+
+
+def test_cross_sheet_findings():
+    findings = cross_sheet_findings({
+        "home": (np.array([1, 2, 3], dtype=np.uint64), np.array([2, 3, 5])),
+        "dealer ": (np.array([3, 4, 4], dtype=np.uint64), np.array([2, 3, 4])),
+        "other": (np.array([7], dtype=np.uint64), np.array([2])),
+    })
+    assert findings["other"] == []
+    (home,), (dealer,) = findings["home"], findings["dealer "]
+    assert home["name"] == "duplicate_order_key_across_sheets"
+    assert home["rows"] == [5] and "dealer" in home["detail"]
+    assert dealer["rows"] == [2] and "home" in dealer["detail"]
+
+
+def test_highlights_added_to_earlier_ones():
+    base = highlight_ranges([{"level": "warning", "row_index": np.array([2, 3]), "columns": ["k"]}], {"k": 10})
+    assert base == {"warning": "J2:J3"}
+    merged = highlight_ranges([{"level": "warning", "row_index": np.array([3, 4, 8]), "columns": ["k"]},
+                               {"level": "error", "row_index": np.array([5]), "columns": ["k"]}],
+                              {"k": 10}, base=base)
+    assert merged == {"warning": "J2:J4 J8", "error": "J5"}
@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from pipeline.reconcile import (APPROVED, NOT_APPROVED, QTY_CHECK, QTY_OK, QTY_REVIEW, SOURCE_ROLES,
+                                SUPPLIED_HEADER, VALUE_ERROR, build_supplied_index, reconcile_rows)
+
+# What Excel shows for the injected formulas, row by row:
+#   רכש = src*1, מקט ללא פגומים = LEFT(makat,7), הזמנות לבדיקה = רכש&מקט,
+#   בדיקת כמות = IFNA(IF(VLOOKUP(order, internal, סופק)=qty, ...), "נדרשת בדיקה"),
+#   אישור סופי, סה"כ לתשלום = IF(approved, price*ABS(qty), 0), פער = total - pay
+
+INTERNAL = pd.DataFrame({
+    "מפתח": ["45000000011234567", 451234567, "45AB12345", "45000000027654321", "45000000031111111"],
+    "לקוח": ["a", "b", "c", "d", "e"],
+    SUPPLIED_HEADER: [2, 7, 1, "2", 4],
+})
+
+# (src, makat, qty, manual, price, total, small qty rule) → (order, qty check, approval, to pay, diff)
+CASES = {
+    "match": (("4500000001", 12345678, 2, None, 10.0, 20.0, True),
+              ("45000000011234567", QTY_OK, APPROVED, 20.0, 0.0)),
+    "match_dealer_sheet": (("4500000001", 12345678, 2, None, 10.0, 20.0, False),
+                           ("45000000011234567", QTY_OK, APPROVED, 20.0, 0.0)),
+    "match_large_qty": ((4500000003, "1111111-P", 4, None, 5.0, 20.0, True),
+                        ("45000000031111111", QTY_CHECK, NOT_APPROVED, 0.0, 20.0)),
+    "number_key_never_matches_text": ((45, 1234567, 7, None, 1.0, 7.0, False),
+                                      ("451234567", QTY_REVIEW, NOT_APPROVED, 0.0, 7.0)),
+    "text_key_ignores_case": ((45, "ab12345x", 1, None, 3.0, 3.0, True),
+                              ("45ab12345", QTY_OK, APPROVED, 3.0, 0.0)),
+    "text_supplied_never_equals_number": ((4500000002, 76543210, 2, None, 1.0, 2.0, False),
+                                          ("45000000027654321", QTY_REVIEW, NOT_APPROVED, 0.0, 2.0)),
+    "missing_key": ((4500000009, 1234567, 1, None, 1.0, 1.0, False),
+                    ("45000000091234567", QTY_REVIEW, NOT_APPROVED, 0.0, 1.0)),
+    "manual_approval": ((4500000009, 1234567, -3, "מאושר", 10.0, 0.0, False),
+                        ("45000000091234567", QTY_REVIEW, APPROVED, 30.0, -30.0)),
+    "manual_not_zero": (("4500000001", 12345678, 2, 1, 10.0, 20.0, True),
+                        ("45000000011234567", QTY_OK, NOT_APPROVED, 0.0, 20.0)),
+    "purchase_not_a_number": (("abc", 1234567, 1, None, 1.0, 1.0, True),
+                              (VALUE_ERROR, VALUE_ERROR, VALUE_ERROR, VALUE_ERROR, VALUE_ERROR)),
+    "price_not_a_number": (("4500000001", 12345678, 2, None, "x", 20.0, True),
+                           ("45000000011234567", QTY_OK, APPROVED, VALUE_ERROR, VALUE_ERROR)),
+    "blank_row": ((None, None, None, None, None, None, True),
+                  (None, None, NOT_APPROVED, 0.0, 0.0)),
+}
+
+
+def _frame(src, makat, qty, manual, price, total):
+    row = dict.fromkeys(SOURCE_ROLES)
+    row.update(src=src, makat=makat, qty=qty, manual=manual, price=price, total=total)
+    return pd.DataFrame({role: pd.Series([v], index=[2], dtype=object) for role, v in row.items()})
+
+
+@pytest.mark.parametrize("case", list(CASES))
+def test_values_match_formula_results(case):
+    (*inputs, small), expected = CASES[case]
+    values, written, order_filled = reconcile_rows(_frame(*inputs), build_supplied_index(INTERNAL),
+                                                   small_qty_rule=small, has_total=True)
+    got = tuple(values[role][2] if written[role][2] else None
+                for role in ("order", "qty_check", "approval", "total_pay", "diff"))
+    assert got == expected
+    assert order_filled[2] == (expected[0] is not None)
+
+
+def test_lookup_returns_first_match():
+    internal = pd.DataFrame({"מפתח": ["k1", "K1", None], SUPPLIED_HEADER: [1, 2, 3]})
+    index = build_supplied_index(internal)
+    assert index.to_dict() == {"k1": 1}
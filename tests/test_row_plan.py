@@ -0,0 +1,157 @@
+import zipfile
+from io import BytesIO
+
+import pytest
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+
+from benchmarks.synthetic import make_pair
+from pipeline.cache import DiskCache
+from pipeline.constants import (
+    COL_APPROVAL, COL_DIFF_ROW, COL_DUP_JULY, COL_MAKAT, COL_MAKAT_CLEAN, COL_MANUAL, COL_NOTES, COL_ORDER_CHECK,
+    COL_PRICE_AFTER, COL_PURCHASE_SRC, COL_QTY, COL_QTY_CHECK, COL_RAKHASH, COL_TOTAL, COL_TOTAL_PAY, EXTRA_COLUMNS,
+    MODE_FORMULAS, MODE_VALUES, REQUIRED_INTERNAL_SHEET, REQUIRED_MAIN_SHEET_1, TARGET_SHEETS,
+)
+from pipeline.runner import process_files
+
+
+@pytest.fixture(scope="module")
+def pair(tmp_path_factory):
+    return make_pair(tmp_path_factory.mktemp("synthetic"), 120, internal_rows=150, cols=16, seed=7)
+
+
+def _baseline(ws):
+    """The per-cell injection the row plan replaced, formula for formula."""
+    def find_col(name):
+        return next((c for c in range(1, ws.max_column + 1)
+                     if (ws.cell(row=1, column=c).value or "").strip() == name), None)
+
+    def ensure_column(name):
+        c = find_col(name)
+        if c is None:
+            c = ws.max_column + 1
+            ws.cell(row=1, column=c, value=name)
+        return get_column_letter(c)
+
+    def filled(ref):
+        v = ws[ref].value
+        return v is not None and str(v).strip() != ""
+
+    (src, rakhash, makat, clean, order, qty, qtychk, price, _, manual, approval, _, totalpay,
+     diff) = map(ensure_column, (COL_PURCHASE_SRC, COL_RAKHASH, COL_MAKAT, COL_MAKAT_CLEAN, COL_ORDER_CHECK,
+                                 COL_QTY, COL_QTY_CHECK, COL_PRICE_AFTER, COL_DUP_JULY, COL_MANUAL,
+                                 COL_APPROVAL, COL_NOTES, COL_TOTAL_PAY, COL_DIFF_ROW))
+    for name in EXTRA_COLUMNS:
+        ensure_column(name)
+    total = find_col(COL_TOTAL)
+
+    max_row = ws.max_row
+    for r in range(2, max_row + 1):
+        if filled(f"{src}{r}"):
+            ws[f"{rakhash}{r}"] = f"={src}{r}*1"
+    for r in range(2, max_row + 1):
+        if filled(f"{makat}{r}"):
+            ws[f"{clean}{r}"] = f"=LEFT({makat}{r},7)"
+    for r in range(2, max_row + 1):
+        if filled(f"{rakhash}{r}") and filled(f"{clean}{r}"):
+            ws[f"{order}{r}"] = f"={rakhash}{r}&{clean}{r}"
+    end_row = next((r for r in range(max_row, 1, -1) if filled(f"{order}{r}")), 1)
+
+    lookup = (f"VLOOKUP({{order}},'{REQUIRED_INTERNAL_SHEET}'!$A:$O,"
+              f"MATCH(\"סופק\",'{REQUIRED_INTERNAL_SHEET}'!$A$1:$O$1,0),0)")
+    for r in range(2, end_row + 1):
+        if filled(f"{order}{r}"):
+            found = lookup.format(order=f"{order}{r}")
+            if ws.title.strip() == REQUIRED_MAIN_SHEET_1:
+                ws[f"{qtychk}{r}"] = (f"=IFNA(IF({found}='{ws.title}'!{qty}{r},"
+                                      f"IF('{ws.title}'!{qty}{r}<3,\"תקין\",\"בדיקת כמות\"),"
+                                      f"\"נדרשת בדיקה\"),\"נדרשת בדיקה\")")
+            else:
+                ws[f"{qtychk}{r}"] = f"=IFNA(IF({found}={qty}{r},\"תקין\",\"נדרשת בדיקה\"),\"נדרשת בדיקה\")"
+    for r in range(2, end_row + 1):
+        ws[f"{approval}{r}"] = (f"=IF(OR(AND({manual}{r}=0,{qtychk}{r}=\"תקין\"),{manual}{r}=\"מאושר\"),"
+                                f"\"מאושר\",\"לא מאושר\")")
+        ws[f"{totalpay}{r}"] = f"=IF({approval}{r}=\"מאושר\",{price}{r}*ABS({qty}{r}),0)"
+        if total:
+            ws[f"{diff}{r}"] = f"={get_column_letter(total)}{r}-{totalpay}{r}"
+
+
+def _cells(ws):
+    return [list(row) for row in ws.iter_rows(values_only=True)]
+
+
+def _target_cells(output: bytes):
+    wb = load_workbook(BytesIO(output))
+    return {name: _cells(wb[name]) for name in wb.sheetnames if name.strip() in TARGET_SHEETS}
+
+
+def test_formulas_match_per_cell_baseline(pair):
+    activity, internal = pair
+    result = process_files(activity, internal, mode=MODE_FORMULAS, use_sidecar=False)
+    assert result["ok"]
+
+    expected = load_workbook(activity)
+    for name in TARGET_SHEETS:
+        _baseline(expected[name])
+    assert _target_cells(result["output"]) == {name: _cells(expected[name]) for name in TARGET_SHEETS}
+
+
+def _edited(activity) -> bytes:
+    # a changed purchase number, SKU and quantity, a removed row and an added one
+    wb = load_workbook(activity)
+    ws = wb[REQUIRED_MAIN_SHEET_1]
+    ws["B5"], ws["C9"], ws["D12"] = 4500000000, "1234567-P", 3
+    ws.delete_rows(20)
+    ws.append(["2025-03-01", 4500000001, 12345670, 1, 10.0, 10.0, None, None])
+    out = BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def test_incremental_rerun_matches_full_recompute(pair, tmp_path):
+    activity, internal = pair
+    cache = DiskCache(tmp_path / "rows")
+    name = "activity.xlsx"
+    first = process_files(activity, internal, mode=MODE_VALUES, use_sidecar=False, activity_name=name, cache=cache)
+    assert first["ok"]
+
+    edited = _edited(activity)
+    rerun = process_files(edited, internal, mode=MODE_VALUES, use_sidecar=False, activity_name=name, cache=cache)
+    full = process_files(edited, internal, mode=MODE_VALUES, use_sidecar=False)
+
+    assert _target_cells(rerun["output"]) == _target_cells(full["output"])
+    diff = rerun["sheets"][0]["diff"]
+    assert 0 < diff["recomputed"] < first["sheets"][0]["end_row"] - 1
+    assert rerun["sheets"][1]["diff"]["recomputed"] == 0
+
+
+def _cached(data: bytes, sheet_xml: str, formula: str, value) -> bytes:
+    # what Excel stores on save: the formula's calculated value next to it
+    out = BytesIO()
+    with zipfile.ZipFile(BytesIO(data)) as zin, zipfile.ZipFile(out, "w") as zout:
+        for item in zin.infolist():
+            part = zin.read(item)
+            if item.filename == sheet_xml:
+                part = part.replace(f"<f>{formula}</f><v />".encode(), f"<f>{formula}</f><v>{value}</v>".encode())
+            zout.writestr(item, part)
+    return out.getvalue()
+
+
+def test_formula_mode_keys_read_cached_values(pair):
+    activity, internal = pair
+    wb = load_workbook(activity)
+    ws = wb[REQUIRED_MAIN_SHEET_1]
+    for r in (4, 5):
+        ws[f"B{r}"], ws[f"C{r}"] = "=B2", ws["C2"].value
+    out = BytesIO()
+    wb.save(out)
+    sheet_xml = f"xl/worksheets/sheet{wb.sheetnames.index(REQUIRED_MAIN_SHEET_1) + 1}.xml"
+
+    saved = _cached(out.getvalue(), sheet_xml, "B2", ws["B2"].value)
+    report = process_files(saved, internal, mode=MODE_FORMULAS, use_sidecar=False)["sheets"][0]
+    assert [(f["name"], f["rows"]) for f in report["duplicates"]] == [("duplicate_order_key", [2, 4, 5])]
+
+    # never calculated: left out of the key checks and reported
+    report = process_files(out.getvalue(), internal, mode=MODE_FORMULAS, use_sidecar=False)["sheets"][0]
+    assert report["duplicates"] == []
+    assert [f["rows"] for f in report["validation"] if f["name"] == "uncached_key_inputs"] == [[4, 5]]
@@ -0,0 +1,102 @@
+import datetime as dt
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from pipeline.validation import RULES_PATH
+from validators.rules_engine import validate_workbook
+
+
+@pytest.fixture
+def inventory(tmp_path):
+    """An Inventory sheet with blank rows inside the data and after it."""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Inventory"
+    ws.append(["SKU", "Location", "Quantity", "UnitCost", "LastUpdate"])
+    ws.append(["A", "L1", 5, 2.0, dt.datetime(2025, 1, 1)])
+    ws.append([None] * 5)
+    ws.append(["", "", None, None, ""])
+    ws.append(["B", "L2", -3, 1e9, dt.datetime(2025, 1, 2)])
+    ws.append(["C", "L3", 2, 1.0, dt.datetime(2025, 1, 3)])
+    ws.append([None] * 5)
+    path = tmp_path / "inventory.xlsx"
+    wb.save(path)
+    return path
+
+
+def _findings(path, chunk_size):
+    with pd.ExcelFile(path, engine="openpyxl") as xl:
+        result = validate_workbook(xl, str(RULES_PATH), sheets=["Inventory"], chunk_size=chunk_size)
+    # chunked runs list findings in first-seen order across blocks
+    return {p["name"]: (p.get("failed_rows"), p.get("detail"), p.get("rows"))
+            for p in result["results"][0]["problems"]}
+
+
+@pytest.mark.parametrize("chunk_size", [True, 1, 2, 3])
+def test_chunked_matches_whole_sheet(inventory, chunk_size):
+    whole = _findings(inventory, None)
+    assert {"Quantity_type", "LastUpdate_type", "no_negative_qty", "value_reasonable"} <= set(whole)
+    assert whole["no_negative_qty"][2] == [3, 4, 5]  # the blank rows 3-4 are rows too
+    assert _findings(inventory, chunk_size) == whole
+
+
+@pytest.mark.parametrize("chunk_size", [None, 2])
+def test_optional_column_checked_only_when_present(tmp_path, chunk_size):
+    # the price column is appended by the injection, so uploads usually lack it
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "הובלה לבית לקוח"
+    ws.append(["הז. רכש (לקוח)", "מק'ט", "כמות"])
+    ws.append(["4500000001", "ABC1234-01", 2])
+    ws.append(["4500000002", "ABC1235-01", 1])
+    without = tmp_path / "without.xlsx"
+    wb.save(without)
+    ws["D1"], ws["D2"], ws["D3"] = "מחירון מחלב לאחר בדיקה", 10.0, -1.0
+    with_price = tmp_path / "with.xlsx"
+    wb.save(with_price)
+
+    def findings(path):
+        with pd.ExcelFile(path, engine="openpyxl") as xl:
+            result = validate_workbook(xl, str(RULES_PATH), sheets=[ws.title], chunk_size=chunk_size)
+        return {p["name"]: p.get("rows") for p in result["results"][0]["problems"]}
+
+    assert findings(without) == {}
+    assert findings(with_price) == {"מחירון מחלב לאחר בדיקה_range": [3]}
+
+
+def test_sheet_name_with_outer_spaces(tmp_path):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "הובלה לסוחר "
+    ws.append(["הז. רכש (לקוח)", "מק'ט", "כמות"])
+    ws.append(["4500000001", "ABC1234-01", 0])
+    path = tmp_path / "dealer.xlsx"
+    wb.save(path)
+    with pd.ExcelFile(path, engine="openpyxl") as xl:
+        for sheets in (["הובלה לסוחר "], ["הובלה לסוחר"]):
+            (result,) = validate_workbook(xl, str(RULES_PATH), sheets=sheets)["results"]
+            assert result["sheet"] == "הובלה לסוחר"
+            assert [p["name"] for p in result["problems"]] == ["qty_not_zero"]
+
+
+def test_missing_typed_column_is_an_error_unless_optional(tmp_path):
+    rules = tmp_path / "rules.yaml"
+    rules.write_text("""
+sheets:
+  - name: "Inventory"
+    optional_columns: [Note]
+    column_types:
+      Quantty: "int>=0"
+      Note: "string"
+""", encoding="utf-8")
+    wb = Workbook()
+    wb.active.title = "Inventory"
+    wb.active.append(["Quantity"])
+    wb.active.append([1])
+    path = tmp_path / "inventory.xlsx"
+    wb.save(path)
+    with pd.ExcelFile(path, engine="openpyxl") as xl:
+        (result,) = validate_workbook(xl, str(rules))["results"]
+    assert [(p["name"], p["detail"]) for p in result["problems"]] == [("missing_column", "Quantty")]
@@ -0,0 +1,47 @@
+from io import BytesIO
+
+import pytest
+from openpyxl import load_workbook
+from openpyxl.formatting.rule import CellIsRule
+from openpyxl.styles import Font, PatternFill
+from openpyxl.worksheet.datavalidation import DataValidation
+
+from benchmarks.synthetic import make_pair
+from pipeline.constants import MODE_FORMULAS, REQUIRED_MAIN_SHEET_1
+from pipeline.runner import process_files
+
+RED = PatternFill(start_color="FFFF0000", end_color="FFFF0000", fill_type="solid")
+
+
+@pytest.fixture(scope="module")
+def formatted(tmp_path_factory):
+    activity, internal = make_pair(tmp_path_factory.mktemp("synthetic"), 30, internal_rows=40, cols=16, seed=3)
+    wb = load_workbook(activity)
+    for ws in (wb[REQUIRED_MAIN_SHEET_1], wb.worksheets[0]):
+        ws["A1"].font = Font(bold=True)
+        ws["B2"].number_format = "0.00%"
+        ws["B3"].fill = RED
+        ws.merge_cells("H20:H21")
+        validation = DataValidation(type="list", formula1='"כן,לא"')
+        validation.add("H2:H10")
+        ws.add_data_validation(validation)
+        ws.conditional_formatting.add("B2:B30", CellIsRule(operator="lessThan", formula=["0"], fill=RED))
+    out = BytesIO()
+    wb.save(out)
+    return out.getvalue(), internal, wb.worksheets[0].title
+
+
+@pytest.mark.parametrize("sheet", ["target", "copied"])
+def test_formats_carried_into_the_output(formatted, sheet):
+    activity, internal, copied = formatted
+    result = process_files(activity, internal, mode=MODE_FORMULAS, use_sidecar=False)
+    ws = load_workbook(BytesIO(result["output"]))[REQUIRED_MAIN_SHEET_1 if sheet == "target" else copied]
+
+    assert ws["A1"].font.bold
+    assert ws["B2"].number_format == "0.00%"
+    assert ws["B3"].fill.fgColor.rgb == "FFFF0000"
+    assert [str(r) for r in ws.merged_cells.ranges] == ["H20:H21"]
+    assert [str(v.sqref) for v in ws.data_validations.dataValidation] == ["H2:H10"]
+    rules = {str(cf.sqref): cf.rules for cf in ws.conditional_formatting}
+    assert rules["B2:B30"][0].operator == "lessThan"
+    assert rules["B2:B30"][0].dxf.fill.fgColor.rgb == "FFFF0000"
@@ -0,0 +1,293 @@
+from __future__ import annotations
+import ast
+import io
+import os
+import re
+import tokenize
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+import yaml
+
+try:
+    import numexpr
+except ImportError:  # optional: plain NumPy is used without it
+    numexpr = None
+
+# Rule compiler: rules.yaml is parsed once into an immutable RuleSet (cached per
+# file, invalidated by mtime). Column type specs are split once and every check
+# expression is validated and compiled to a vectorized callable over the
+# columns' NumPy arrays (numexpr when available and the expression allows it).
+
+TYPE_MAP = {
+    "string": "string",
+    "int": "int64",
+    "float": "float64",
+    "date": "datetime64[ns]",
+}
+
+
+class ColumnType(NamedTuple):
+    base: str                    # "int" | "float" | "string" | "date" | ...
+    cond: Optional[tuple]        # (">=", 0.0) | ("<=", 1e8) | None
+    fmt: Optional[str] = None    # strptime format of text dates ("date:%d/%m/%Y")
+
+
+class Check(NamedTuple):
+    name: str
+    level: str
+    expr: str
+    columns: tuple               # column names the expression reads
+    fn: Optional[Callable]       # df → bool ndarray; None when the expr did not compile
+    error: Optional[str]         # compile error
+
+
+class SheetRules(NamedTuple):
+    name: str
+    required_columns: tuple
+    optional_columns: tuple      # typed columns the sheet may lack (checked when present)
+    column_types: tuple          # ((column, ColumnType), ...)
+    checks: tuple                # (Check, ...)
+    columns: tuple               # every column the spec reads, in first-use order
+
+
+class RuleSet(NamedTuple):
+    version: int
+    sheets: tuple                # (SheetRules, ...)
+
+
+def parse_type(spec: str) -> ColumnType:
+    # "int>=0" → ("int", (">=", 0.0)) | "date" → ("date", None)
+    # "date:%d/%m/%Y" → ("date", None, "%d/%m/%Y")
+    cond = None
+    for op in (">=", "<="):
+        if op in spec:
+            spec, val = spec.split(op, 1)
+            cond = (op, float(val))
+            break
+    base, _, fmt = spec.partition(":")
+    return ColumnType(base.strip(), cond, fmt.strip() or None)
+
+
+# ----- expressions -----
+
+def days_since(values: np.ndarray) -> np.ndarray:
+    """Whole days from each date to today (NaN for missing dates)."""
+    values = np.asarray(values, dtype="datetime64[ns]").astype("datetime64[D]")
+    return (np.datetime64("today", "D") - values) / np.timedelta64(1, "D")
+
+
+FUNCTIONS = {"days_since": days_since}
+_NP_ALLOWED = {"abs", "absolute", "sqrt", "log", "log10", "exp", "floor", "ceil", "round",
+               "isnan", "isfinite", "where", "minimum", "maximum", "clip"}
+_BACKTICK = re.compile(r"`([^`]+)`")
+_CMP = {ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq}
+_BINOP = {ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow}
+
+
+def _boolean_ops(source: str) -> str:
+    # & / | → and / or before parsing, as df.eval does: they take the precedence
+    # of the boolean operators, so "Q >= 0 & Q < 100" is two comparisons
+    tokens = []
+    for tok in tokenize.generate_tokens(io.StringIO(source).readline):
+        if tok.type == tokenize.OP and tok.string in ("&", "|"):
+            tok = (tokenize.NAME, "and" if tok.string == "&" else "or")
+        else:
+            tok = (tok.type, tok.string)
+        tokens.append(tok)
+    return tokenize.untokenize(tokens)
+
+
+class _Rewriter(ast.NodeTransformer):
+    """
+    Validates the expression and rewrites it for array evaluation:
+    column names → c0, c1, ...; and/or/not (& | already read as and/or) →
+    & | ~ (element-wise, like df.eval).
+    """
+
+    def __init__(self, aliases):
+        self.aliases = aliases   # placeholder → original column name (backticks)
+        self.columns = []
+        self.numexpr_ok = True
+
+    def _column(self, name):
+        if name not in self.columns:
+            self.columns.append(name)
+        return ast.Name(id=f"c{self.columns.index(name)}", ctx=ast.Load())
+
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_Name(self, node):
+        if node.id in FUNCTIONS or node.id == "np":
+            return node
+        return self._column(self.aliases.get(node.id, node.id))
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, (int, float, bool)):
+            self.numexpr_ok = False
+            if not isinstance(node.value, str):
+                raise ValueError(f"unsupported constant {node.value!r}")
+        return node
+
+    def visit_BinOp(self, node):
+        if type(node.op) not in _BINOP:
+            raise ValueError(f"unsupported operator {type(node.op).__name__}")
+        return self.generic_visit(node)
+
+    def visit_UnaryOp(self, node):
+        node.operand = self.visit(node.operand)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(op=ast.Invert(), operand=node.operand)
+        if not isinstance(node.op, (ast.USub, ast.UAdd, ast.Invert)):
+            raise ValueError(f"unsupported operator {type(node.op).__name__}")
+        return node
+
+    def visit_BoolOp(self, node):
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        values = [self.visit(v) for v in node.values]
+        out = values[0]
+        for v in values[1:]:
+            out = ast.BinOp(left=out, op=op, right=v)
+        return out
+
+    def visit_Compare(self, node):
+        if any(type(op) not in _CMP for op in node.ops):
+            raise ValueError("unsupported comparison")
+        left = self.visit(node.left)
+        comparators = [self.visit(c) for c in node.comparators]
+        # a < b < c → (a < b) & (b < c)
+        parts, prev = [], left
+        for op, right in zip(node.ops, comparators):
+            parts.append(ast.Compare(left=prev, ops=[op], comparators=[right]))
+            prev = right
+        out = parts[0]
+        for p in parts[1:]:
+            out = ast.BinOp(left=out, op=ast.BitAnd(), right=p)
+        return out
+
+    def visit_Call(self, node):
+        self.numexpr_ok = False
+        func = node.func
+        if isinstance(func, ast.Name) and func.id in FUNCTIONS:
+            pass
+        elif (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name)
+              and func.value.id == "np" and func.attr in _NP_ALLOWED):
+            pass
+        else:
+            raise ValueError(f"function not allowed: {ast.unparse(func)}")
+        if node.keywords:
+            raise ValueError("keyword arguments are not allowed")
+        node.args = [self.visit(a) for a in node.args]
+        return node
+
+    def visit_Attribute(self, node):
+        raise ValueError(f"attribute access not allowed: {ast.unparse(node)}")
+
+    def generic_visit(self, node):
+        if not isinstance(node, (ast.BinOp, ast.Load, ast.operator)):
+            raise ValueError(f"unsupported syntax: {type(node).__name__}")
+        return super().generic_visit(node)
+
+
+def column_array(series: pd.Series) -> np.ndarray:
+    """NumPy view of a column; nullable/extension dtypes become float with NaN."""
+    dtype = series.dtype
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype) and pd.api.types.is_numeric_dtype(dtype):
+        return series.to_numpy(dtype="float64", na_value=np.nan)
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return series.to_numpy(dtype="datetime64[ns]")
+    return series.to_numpy()
+
+
+def compile_expr(expr: str):
+    """
+    Returns (fn, columns): fn(df) → bool ndarray, evaluated on the referenced
+    columns only. Raises ValueError/SyntaxError for anything outside the
+    allowed arithmetic/comparison/boolean subset.
+    """
+    aliases = {}
+
+    def _alias(m):
+        key = f"__bt{len(aliases)}"
+        aliases[key] = m.group(1)
+        return key
+
+    tree = ast.parse(_boolean_ops(_BACKTICK.sub(_alias, expr.strip())), mode="eval")
+    rewriter = _Rewriter(aliases)
+    tree = ast.fix_missing_locations(rewriter.visit(tree))
+    columns = tuple(rewriter.columns)
+    names = [f"c{i}" for i in range(len(columns))]
+    code = compile(tree, f"<rule {expr!r}>", "eval")
+    env = {"__builtins__": {}, "np": np, **FUNCTIONS}
+    ne_source = ast.unparse(tree) if (numexpr is not None and rewriter.numexpr_ok) else None
+
+    def fn(df: pd.DataFrame) -> np.ndarray:
+        arrays = {n: column_array(df[c]) for n, c in zip(names, columns)}
+        if ne_source is not None and all(a.dtype.kind in "biuf" for a in arrays.values()):
+            result = numexpr.evaluate(ne_source, local_dict=arrays)
+        else:
+            result = eval(code, env, arrays)
+        result = np.asarray(result)
+        if result.shape == ():
+            result = np.full(len(df), bool(result))
+        return result.astype(bool)
+
+    return fn, columns
+
+
+def compile_sheet(spec: dict) -> SheetRules:
+    checks = []
+    for chk in spec.get("checks", []) or []:
+        expr = chk.get("expr")
+        try:
+            fn, columns = compile_expr(expr)
+            error = None
+        except (SyntaxError, ValueError, TypeError, AttributeError) as e:
+            fn, columns, error = None, (), str(e)
+        checks.append(Check(
+            name=chk.get("name", expr),
+            level=chk.get("level", "error"),
+            expr=expr,
+            columns=columns,
+            fn=fn,
+            error=error,
+        ))
+    required = tuple(spec.get("required_columns", []) or [])
+    column_types = tuple((col, parse_type(t)) for col, t in (spec.get("column_types", {}) or {}).items())
+    columns = [*required, *(col for col, _ in column_types), *(c for chk in checks for c in chk.columns)]
+    return SheetRules(
+        name=spec["name"],
+        required_columns=required,
+        optional_columns=tuple(spec.get("optional_columns", []) or []),
+        column_types=column_types,
+        checks=tuple(checks),
+        columns=tuple(dict.fromkeys(columns)),
+    )
+
+
+def compile_rules(cfg: dict) -> RuleSet:
+    cfg = cfg or {}
+    return RuleSet(
+        version=cfg.get("version", 1),
+        sheets=tuple(compile_sheet(s) for s in cfg.get("sheets", []) or []),
+    )
+
+
+_cache = {}  # abs path → ((mtime_ns, size), RuleSet)
+
+
+def load_rules(rules_path) -> RuleSet:
+    """Compiled rules for `rules_path`, recompiled only when the file changes."""
+    path = os.path.abspath(rules_path)
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        rules = compile_rules(yaml.safe_load(f))
+    _cache[path] = (stamp, rules)
+    return rules
@@ -1,132 +1,359 @@
 from __future__ import annotations
-import pandas as pd
+from collections.abc import Mapping
+
 import numpy as np
-import yaml
-
-TYPE_MAP = {
-    "string": "string",
-    "int": "int64",
-    "float": "float64",
-    "date": "datetime64[ns]",
-}
-
-def _parse_type(spec: str):
-    # "int>=0" → ("int", (">=", 0.0)) | "date" → ("date", None)
-    if ">=" in spec:
-        base, val = spec.split(">=", 1)
-        return base.strip(), (">=", float(val))
-    if "<=" in spec:
-        base, val = spec.split("<=", 1)
-        return base.strip(), ("<=", float(val))
-    return spec.strip(), None
-
-def _coerce_and_check_types(df: pd.DataFrame, column_types: dict):
-    problems = []
-    for col, spec in column_types.items():
+import pandas as pd
+
+from validators.compiler import TYPE_MAP, SheetRules, column_array, load_rules
+
+# Findings that count rows also carry where they are: "row_index" holds sheet row
+# numbers (header = row 1), capped at MAX_FAILED_ROWS, and "rows" the first
+# INLINE_ROWS of them as plain ints for display; "columns" names the columns the
+# finding is about (the checked column, or the columns a check expression reads).
+MAX_FAILED_ROWS = 100_000
+INLINE_ROWS = 20
+CHUNK_ROWS = 50_000   # default block size for validate_workbook(chunk_size=True)
+
+class _NoProfile:
+    # stand-in for the optional profiler: anything whose .stage(name) returns a
+    # context manager yielding a dict ("rows" may be set on it)
+    class _Stage:
+        def __enter__(self):
+            return {}
+
+        def __exit__(self, *exc):
+            return False
+
+    _stage = _Stage()
+
+    def stage(self, name, rows=None):
+        return self._stage
+
+_NO_PROFILE = _NoProfile()
+
+class _Findings:
+    """Problems of one sheet, merged across row blocks in first-seen order."""
+
+    def __init__(self):
+        self._items = {}
+
+    def add(self, name, level, detail):
+        # fixed problem (missing column, failed cast, bad expression): reported once
+        self._items.setdefault((name, detail), {"name": name, "level": level, "detail": detail})
+
+    def add_rows(self, name, level, rows, columns=(), describe=None):
+        # rows: sheet row numbers that failed; describe(n) → detail text, or None
+        # for check-style findings reported as "failed_rows"
+        if not len(rows):
+            return
+        item = self._items.get(name)
+        if item is None:
+            item = self._items[name] = {"name": name, "level": level, "columns": list(columns),
+                                        "describe": describe, "n": 0, "kept": 0, "index": []}
+        item["n"] += len(rows)
+        room = MAX_FAILED_ROWS - item["kept"]
+        if room > 0:
+            item["index"].append(rows[:room])
+            item["kept"] += min(room, len(rows))
+
+    def result(self) -> list[dict]:
+        problems = []
+        for item in self._items.values():
+            if "n" not in item:
+                problems.append(item)
+                continue
+            index = np.concatenate(item["index"]).astype(np.int64)
+            problem = {"name": item["name"], "level": item["level"]}
+            if item["describe"] is None:
+                problem["failed_rows"] = item["n"]
+            else:
+                problem["detail"] = item["describe"](item["n"])
+            problem["rows"] = index[:INLINE_ROWS].tolist()
+            problem["row_index"] = index
+            problem["columns"] = item["columns"]
+            problems.append(problem)
+        return problems
+
+def _coerce(series: pd.Series, base: str, fmt=None):
+    """(typed column, cast ok); the column itself when its dtype already matches."""
+    dtype = series.dtype
+    if base == "date":
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            return series, True
+        # a declared format parses the whole column in one go instead of guessing it
+        return pd.to_datetime(series, format=fmt, errors="coerce"), True
+    if base in ("int", "float"):
+        if not pd.api.types.is_numeric_dtype(dtype):
+            series = pd.to_numeric(series, errors="coerce")
+        target = pd.api.types.pandas_dtype(TYPE_MAP[base])
+        if series.dtype == target:
+            return series, True
+        try:
+            return series.astype(target), True
+        except (TypeError, ValueError):
+            if base == "int":
+                # blanks (or inf): the whole-number values stay integers next to <NA>
+                try:
+                    return series.astype("Int64"), False
+                except (TypeError, ValueError):
+                    pass
+            return series, False
+    target = pd.api.types.pandas_dtype(TYPE_MAP.get(base, "object"))
+    if dtype == target:  # dtype objects: pandas' "str" dtype equals the name "string"
+        return series, True
+    try:
+        return series.astype(target), True
+    except Exception:
+        return series, False
+
+def _range_violations(df: pd.DataFrame, ranged: list) -> np.ndarray:
+    """
+    One bool matrix (rows × ranged columns) of values outside their bound,
+    compared in a single NumPy pass; missing values never violate.
+    ranged: [(column, base type, (op, value)), ...]
+    """
+    values = np.empty((len(df), len(ranged)), dtype="float64")
+    low = np.full(len(ranged), -np.inf)
+    high = np.full(len(ranged), np.inf)
+    for j, (col, _, (op, val)) in enumerate(ranged):
+        values[:, j] = column_array(df[col])
+        if op == ">=":
+            low[j] = val
+        else:
+            high[j] = val
+    return (values < low) | (values > high)
+
+def _coerce_and_check_types(df: pd.DataFrame, spec: SheetRules, row_numbers: np.ndarray, findings: _Findings):
+    ranged = []
+    for col, (base, cond, fmt) in spec.column_types:
         if col not in df.columns:
-            problems.append({"name": "missing_column", "level": "error", "detail": col})
+            if col not in spec.optional_columns:
+                findings.add("missing_column", "error", col)
             continue
 
-        base, cond = _parse_type(spec)
-
-        # casting
+        # casting (only columns whose dtype changes are written back)
+        series = df[col]
+        typed, ok = _coerce(series, base, fmt)
+        if typed is not series:
+            df[col] = typed
         if base == "date":
-            df[col] = pd.to_datetime(df[col], errors="coerce")
-            bad = df[col].isna()
-            if bad.any():
-                problems.append({"name": f"{col}_type", "level": "error",
-                                 "detail": f"invalid dates in {bad.sum()} rows"})
-        else:
-            if base in ("int", "float"):
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-            try:
-                df[col] = df[col].astype(TYPE_MAP.get(base, "object"))
-            except Exception:
-                problems.append({"name": f"{col}_type", "level": "error",
-                                 "detail": f"cannot cast to {base}"})
-
-        # simple range condition if defined
-        if cond and col in df.columns:
-            op, val = cond
-            if op == ">=":
-                bad = df[col] < val
-            elif op == "<=":
-                bad = df[col] > val
+            bad = typed.isna().to_numpy()
+            findings.add_rows(f"{col}_type", "error", row_numbers[bad], [col],
+                              lambda n: f"invalid dates in {n} rows")
+        elif not ok:
+            findings.add(f"{col}_type", "error", f"cannot cast to {base}")
+
+        # simple range condition if defined: checked below, all columns at once
+        if cond:
+            if pd.api.types.is_numeric_dtype(typed.dtype):
+                ranged.append((col, base, cond))
             else:
-                bad = pd.Series(False, index=df.index)
-            if bad.any():
-                problems.append({"name": f"{col}_range", "level": "error",
-                                 "detail": f"{int(bad.sum())} values violate {base}{op}{val}"})
-    return df, problems
-
-def _days_since(series: pd.Series) -> pd.Series:
-    # assumes datetime64 already
-    return (pd.Timestamp.now(normalize=True) - series.dt.normalize()).dt.days
-
-def _eval_expr(df: pd.DataFrame, expr: str) -> pd.Series:
-    # sandboxed eval for simple arithmetic/column ops
-    env = {"np": np, "days_since": _days_since}
-    return df.eval(expr, engine="python", local_dict=env)
-
-def _run_checks(df: pd.DataFrame, checks: list[dict]) -> list[dict]:
-    findings = []
-    for chk in checks or []:
+                findings.add(f"{col}_range", "error", f"{base}{cond[0]}{cond[1]} needs a numeric column")
+
+    if ranged:
+        violations = _range_violations(df, ranged)
+        for j, (col, base, (op, val)) in enumerate(ranged):
+            findings.add_rows(f"{col}_range", "error", row_numbers[violations[:, j]], [col],
+                              lambda n, rule=f"{base}{op}{val}": f"{n} values violate {rule}")
+    return df
+
+def _run_checks(df: pd.DataFrame, checks: tuple, row_numbers: np.ndarray, findings: _Findings):
+    for chk in checks:
         try:
-            mask = ~_eval_expr(df, chk["expr"])
-            if mask.any():
-                findings.append({
-                    "name": chk.get("name", chk["expr"]),
-                    "level": chk.get("level", "error"),
-                    "failed_rows": int(mask.sum())
-                })
+            if chk.fn is None:
+                raise ValueError(chk.error)
+            mask = ~chk.fn(df)  # compiled, vectorized over the referenced columns
+            findings.add_rows(chk.name, chk.level, row_numbers[mask], chk.columns)
         except Exception as e:
-            findings.append({
-                "name": chk.get("name", "invalid_check"),
-                "level": "error",
-                "detail": f"failed to evaluate expr: {chk.get('expr')} ({e})"
-            })
-    return findings
+            findings.add(chk.name or "invalid_check", "error",
+                         f"failed to evaluate expr: {chk.expr} ({e})")
 
-def _validate_sheet(df: pd.DataFrame, spec: dict):
-    problems = []
+def _validate_block(df: pd.DataFrame, spec: SheetRules, row_numbers: np.ndarray, findings: _Findings,
+                    profiler=_NO_PROFILE):
+    # types + ranges
+    with profiler.stage(f"validate.coerce[{spec.name}]", rows=len(df)):
+        df = _coerce_and_check_types(df, spec, row_numbers, findings)
 
-    # required columns
-    required = spec.get("required_columns", [])
-    missing = [c for c in required if c not in df.columns]
+    # row-level checks
+    with profiler.stage(f"validate.checks[{spec.name}]", rows=len(df)):
+        _run_checks(df, spec.checks, row_numbers, findings)
+
+def _missing_required(columns, spec: SheetRules):
+    missing = [c for c in spec.required_columns if c not in columns]
     if missing:
-        problems.append({"name":"missing_columns","level":"error","detail":",".join(missing)})
+        return [{"name":"missing_columns","level":"error","detail":",".join(missing)}]
+    return []
+
+def _validate_sheet(df: pd.DataFrame, spec: SheetRules, profiler=_NO_PROFILE):
+    # required columns
+    problems = _missing_required(df.columns, spec)
+    if problems:
         return problems  # stop early if required columns are missing
 
-    # types + ranges
-    _, type_problems = _coerce_and_check_types(df, spec.get("column_types", {}))
-    problems.extend(type_problems)
+    findings = _Findings()
+    _validate_block(df, spec, np.arange(2, len(df) + 2), findings, profiler)
+    return findings.result()
 
-    # row-level checks
-    problems.extend(_run_checks(df, spec.get("checks", [])))
-    return problems
+def _read_header(xl: pd.ExcelFile, name: str):
+    """
+    Header row when the engine can read it without loading the sheet (openpyxl
+    read-only streams rows); None for engines that load whole sheets anyway.
+    """
+    if xl.engine != "openpyxl":
+        return None
+    row = next(xl.book[name].iter_rows(max_row=1, values_only=True), ())
+    return [c for c in row if c is not None]
 
-def validate_workbook(xl: pd.ExcelFile, rules_path: str):
+def _load_sheet(xl: pd.ExcelFile, spec: SheetRules):
+    """
+    Returns (df, problems). Missing required columns are reported from the
+    header row before any data is read (where the engine allows it); otherwise
+    only the columns the spec reads are parsed, string columns as raw objects
+    (cast later).
     """
-    xl: pd.ExcelFile (already opened in the app)
+    header = _read_header(xl, spec.name)
+    if header is not None:
+        problems = _missing_required(header, spec)
+        if problems:
+            return None, problems
+
+    wanted = set(spec.columns)
+    dtype = {col: object for col, t in spec.column_types if t.base == "string"}
+    df = xl.parse(spec.name, usecols=lambda c: c in wanted, dtype=dtype or None)
+    return df, []
+
+def _iter_blocks(xl: pd.ExcelFile, spec: SheetRules, chunk_size: int):
+    """
+    (df, row_numbers) blocks of the spec's columns. openpyxl streams the sheet,
+    so only one block is held at a time; other engines load the sheet whole and
+    it is validated in slices. As in read_excel, blank rows inside the data are
+    kept (all-blank rows) and trailing ones dropped, and empty text is a blank.
+    """
+    if xl.engine != "openpyxl":
+        df, _ = _load_sheet(xl, spec)
+        for start in range(0, len(df), chunk_size):
+            block = df.iloc[start:start + chunk_size].copy()
+            yield block, np.arange(start + 2, start + 2 + len(block))
+        return
+
+    ws = xl.book[spec.name]
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, ())
+    wanted = set(spec.columns)
+    positions = {}
+    for i, name in enumerate(header):
+        if name in wanted and name not in positions:
+            positions[name] = i
+    names, picks = list(positions), list(positions.values())
+
+    blank = [None] * len(picks)
+    block, numbers, pending = [], [], []  # pending: blank rows, kept once a later row has data
+    for r, values in enumerate(rows, start=2):
+        if all(v is None or v == "" for v in values):
+            pending.append(r)
+            continue
+        for r_blank in pending:
+            block.append(blank)
+            numbers.append(r_blank)
+            if len(block) == chunk_size:
+                yield pd.DataFrame(block, columns=names), np.asarray(numbers)
+                block, numbers = [], []
+        pending = []
+        block.append([None if i >= len(values) or values[i] == "" else values[i] for i in picks])
+        numbers.append(r)
+        if len(block) == chunk_size:
+            yield pd.DataFrame(block, columns=names), np.asarray(numbers)
+            block, numbers = [], []
+    if block:
+        yield pd.DataFrame(block, columns=names), np.asarray(numbers)
+
+def _validate_chunked(xl: pd.ExcelFile, spec: SheetRules, chunk_size: int, profiler=_NO_PROFILE):
+    header = _read_header(xl, spec.name)
+    if header is not None:
+        problems = _missing_required(header, spec)
+        if problems:
+            return problems
+
+    findings = _Findings()
+    blocks = _iter_blocks(xl, spec, chunk_size)
+    i = 0
+    while True:
+        with profiler.stage(f"validate.load[{spec.name}]") as stage:
+            block = next(blocks, None)
+            if block is not None:
+                stage["rows"] = len(block[0])
+        if block is None:
+            break
+        df, row_numbers = block
+        if i == 0 and header is None:
+            problems = _missing_required(df.columns, spec)
+            if problems:
+                return problems
+        _validate_block(df, spec, row_numbers, findings, profiler)
+        i += 1
+    return findings.result()
+
+def _frame_sheet(frames: Mapping, spec: SheetRules, profiler=_NO_PROFILE):
+    # already-loaded sheet: validate a copy of the columns the spec reads
+    df = frames[spec.name]
+    problems = _missing_required(df.columns, spec)
+    if problems:
+        return problems
+    with profiler.stage(f"validate.load[{spec.name}]", rows=len(df)):
+        df = df.loc[:, [c for c in spec.columns if c in df.columns]].copy()
+    return _validate_sheet(df, spec, profiler)
+
+def validate_workbook(xl: pd.ExcelFile | Mapping, rules_path: str, *, chunk_size: int | bool | None = None,
+                      sheets=None, profiler=None):
+    """
+    xl: pd.ExcelFile (already opened in the app), or a mapping of sheet name →
+        DataFrame already loaded elsewhere (one row per sheet row from row 2 on,
+        columns named by header)
     rules_path: path to rules.yaml
+    chunk_size: validate in blocks of this many rows (True = CHUNK_ROWS) instead
+                of one DataFrame per sheet; findings are merged across blocks
+                (ExcelFile only)
+    sheets: only validate the rule sheets with these names (default: all); a
+            spec is matched to the sheet of its name ignoring outer spaces
+    profiler: optional stage timer (e.g. pipeline.profiling.Profiler); load,
+              coerce and checks are timed per sheet as "validate.<phase>[sheet]"
     """
-    with open(rules_path, "r", encoding="utf-8") as f:
-        cfg = yaml.safe_load(f) or {}
+    profiler = profiler or _NO_PROFILE
+    rules = load_rules(rules_path)  # parsed + compiled once, reloaded when the file changes
+    if chunk_size is True:
+        chunk_size = CHUNK_ROWS
+    loaded = isinstance(xl, Mapping)
+    sheet_names = list(xl) if loaded else xl.sheet_names
 
+    wanted = None if sheets is None else {s.strip() for s in sheets}
     results = []
-    for sheet_spec in cfg.get("sheets", []):
-        name = sheet_spec["name"]
-        if name not in xl.sheet_names:
+    for sheet_spec in rules.sheets:
+        name = sheet_spec.name
+        if wanted is not None and name.strip() not in wanted:
+            continue
+        # the workbook's own sheet name may carry stray outer spaces ("הובלה לסוחר ")
+        actual = name if name in sheet_names else next((s for s in sheet_names if s.strip() == name.strip()), None)
+        if actual is None:
             results.append({
                 "sheet": name,
                 "ok": False,
                 "problems": [{"name":"missing_sheet","level":"error","detail":"sheet not found"}]
             })
             continue
+        if actual != name:
+            sheet_spec = sheet_spec._replace(name=actual)
 
-        df = xl.parse(name)
-        problems = _validate_sheet(df, sheet_spec)
+        if loaded:
+            problems = _frame_sheet(xl, sheet_spec, profiler)
+        elif chunk_size:
+            problems = _validate_chunked(xl, sheet_spec, chunk_size, profiler)
+        else:
+            with profiler.stage(f"validate.load[{name}]") as stage:
+                df, problems = _load_sheet(xl, sheet_spec)  # header first, then only the used columns
+                stage["rows"] = None if df is None else len(df)
+            if df is not None:
+                problems = _validate_sheet(df, sheet_spec, profiler)
         ok = not any(p.get("level") == "error" for p in problems)
         results.append({"sheet": name, "ok": ok, "problems": problems})
 
-    return {"version": cfg.get("version", 1), "results": results}
+    return {"version": rules.version, "results": results}